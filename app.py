@@ -1,6 +1,12 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response, send_file, stream_with_context
+import base64
+import hashlib
+import itertools
+import json
 import logging
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 # Configure logging
@@ -17,11 +23,28 @@ logging.basicConfig(
 try:
     from problem_manager import (
         add_problem, load_problems, get_problem_by_id,
-        update_problem_solution, save_problems, delete_problem
+        update_problem_solution, update_problem_solutions, save_problems,
+        update_problem, update_problems, update_problems_matching, delete_problems, delete_problems_matching,
+        UPDATABLE_FIELDS, delete_problem, query_problems,
+        get_data_version, get_last_modified, iter_problems
     )
     import problem_manager # Keep this for now if other parts of problem_manager are needed directly
-    from gemini_integration import generate_solution_steps
-    from exporter import export_problems_to_html
+    from gemini_integration import (
+        generate_solution_steps, request_solution_steps, stream_solution_steps, is_error_response, is_transient_error,
+        throttle as gemini_throttle, single_flight as gemini_single_flight
+    )
+    from solution_cache import get_default_cache as get_solution_cache
+    from local_solver import stats as local_solver_stats
+    from bulk_import import import_problems, detect_format, IMPORT_FORMATS, DEFAULT_IMPORT_DUPLICATE_POLICY
+    from search_index import search_problems, get_search_index, DEFAULT_SEARCH_LIMIT
+    from duplicate_index import find_duplicates, get_duplicate_index, DUPLICATE_POLICIES, DEFAULT_DUPLICATE_POLICY
+    from job_queue import JobQueue, DEFAULT_STORE_PATH as DEFAULT_JOB_STORE_PATH
+    from exporter import (
+        export_problems_to_html, fragment_cache_stats, get_export_format, EXPORT_FORMATS
+    )
+    from export_cache import ExportCache, EXPORT_CACHE_DIR_ENV_VAR
+    from export_jobs import get_default_store as get_export_file_store, with_progress
+    from worksheet import generate_worksheet, get_worksheet, worksheet_problems, get_worksheet_pools
 except ImportError as e:
     logging.error(f"Error importing modules: {e}")
     # You might want to handle this more gracefully depending on your application's needs
@@ -29,12 +52,93 @@ except ImportError as e:
 
 app = Flask(__name__)
 
+# Upper bound for the `limit` parameter of GET /api/problems
+MAX_PAGE_SIZE = 500
+
+# Concurrent Gemini calls per batch generation request, and the most a client may ask for
+BATCH_GENERATION_WORKERS = 4
+MAX_BATCH_GENERATION_WORKERS = 16
+
+# Background solution generation. Jobs are persisted to JOB_STORE_PATH and survive a restart.
+JOB_STORE_PATH_ENV_VAR = "JOB_STORE_PATH"
+JOB_WORKERS_ENV_VAR = "JOB_WORKERS"
+job_queue = JobQueue(
+    store_path=os.getenv(JOB_STORE_PATH_ENV_VAR) or DEFAULT_JOB_STORE_PATH,
+    workers=int(os.getenv(JOB_WORKERS_ENV_VAR) or 2),
+    is_transient=is_transient_error,
+)
+
+# Rendered exports, keyed by filter/options/data version. Set EXPORT_CACHE_DIR (e.g. exports/cache)
+# to add a disk tier shared by all worker processes.
+export_cache = ExportCache(disk_dir=os.getenv(EXPORT_CACHE_DIR_ENV_VAR) or None)
+
+# Exports rendered in the background (POST /api/export/jobs), kept in EXPORT_JOBS_DIR (exports/jobs)
+export_files = get_export_file_store()
+
+def _make_etag(*parts):
+    """Builds a strong ETag value from the given parts (data version, query parameters, ...)."""
+    return hashlib.sha1("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def _problem_etag(problem):
+    """ETag for a single problem, derived from its stored values (covers updated_time and every field)."""
+    return _make_etag(*(problem.get(field, "") for field in problem_manager.HEADERS))
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def _encode_cursor(problem, sort_by):
+    """Opaque next_cursor for list pages: the last row's (sort value, problem_id)."""
+    key = json.dumps([problem.get(sort_by) or "", problem.get('problem_id') or ""], ensure_ascii=False)
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip("=")
+
+def _decode_cursor(cursor):
+    """(sort value, problem_id) from a next_cursor; ValueError if it isn't one."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e: # binascii.Error and JSON errors are ValueErrors
+        raise ValueError("Invalid cursor") from e
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+def _not_modified_response(etag, last_modified=None):
+    """
+    Checks the request's conditional headers against the current validators.
+    Returns a ready 304 response if the client's copy is still fresh, None otherwise,
+    so callers can skip serialising the body entirely.
+    """
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if not request.if_none_match.contains(etag):
+            return None
+    elif not (last_modified and request.if_modified_since
+              and last_modified.replace(microsecond=0) <= request.if_modified_since):
+        return None
+    return _with_validators(make_response('', 304), etag, last_modified)
+
+def _with_validators(response, etag, last_modified=None):
+    """Attaches ETag/Last-Modified and asks clients to revalidate instead of trusting stale copies."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/')
 def home():
     return "Welcome to the Math Problems API!"
 
 @app.route('/api/problems', methods=['POST'])
 def create_problem():
+    """
+    Adds a problem. The text is first checked against the near-duplicate index; `on_duplicate`
+    in the body decides what happens when it matches an existing problem: "warn" (default) adds
+    it and lists the matches under "duplicates", "reject" answers 409, "link" adds nothing and
+    returns the closest existing problem with "linked": true, "allow" skips the check.
+    """
     try:
         data = request.get_json()
         if not data:
@@ -52,7 +156,20 @@ def create_problem():
             if not answer: missing_fields.append('answer')
             return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
 
+        on_duplicate = data.get('on_duplicate') or DEFAULT_DUPLICATE_POLICY
+        if on_duplicate not in DUPLICATE_POLICIES:
+            return jsonify({"error": f"on_duplicate must be one of: {', '.join(DUPLICATE_POLICIES)}"}), 400
+        duplicates = find_duplicates(problem_text) if on_duplicate != "allow" else []
+        if duplicates and on_duplicate == "reject":
+            return jsonify({"error": "A near-duplicate problem already exists", "duplicates": duplicates}), 409
+        if duplicates and on_duplicate == "link":
+            existing = get_problem_by_id(duplicates[0]["problem_id"])
+            if existing:
+                return jsonify(dict(existing, linked=True, duplicates=duplicates)), 200
+
         new_problem = add_problem(problem_text, problem_type, answer, source)
+        if duplicates:
+            return jsonify(dict(new_problem, duplicates=duplicates)), 201
         return jsonify(new_problem), 201
 
     except Exception as e:
@@ -60,35 +177,196 @@ def create_problem():
         logging.exception("Error in create_problem")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
+@app.route('/api/problems/import', methods=['POST'])
+def import_problems_route():
+    """
+    Bulk import from CSV (with a header row) or JSON Lines, validated row by row as it streams in
+    and committed with one write. Send the file as multipart field `file`, or as the raw body with
+    Content-Type text/csv / application/x-ndjson. Query parameters: format (csv|jsonl, otherwise
+    from the file name or Content-Type), source (default for rows without one), strict=1 (all or
+    nothing), dry_run=1 (validate only), on_duplicate (allow|warn|reject|link: what to do with
+    rows that nearly duplicate an existing problem or an earlier row; allow, the default, doesn't
+    check, reject and link skip them).
+    Returns the import summary with per-row errors and near-duplicates.
+    """
+    truthy = ('1', 'true', 'yes')
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        import_format = request.args.get('format') or detect_format(filename=upload.filename, content_type=upload.mimetype)
+    else:
+        stream = request.stream
+        import_format = request.args.get('format') or detect_format(content_type=request.content_type)
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({"error": "Unknown import format. Pass format=csv or format=jsonl, "
+                                 "or upload a .csv/.jsonl file."}), 400
+
+    on_duplicate = request.args.get('on_duplicate') or DEFAULT_IMPORT_DUPLICATE_POLICY
+    if on_duplicate not in DUPLICATE_POLICIES:
+        return jsonify({"error": f"on_duplicate must be one of: {', '.join(DUPLICATE_POLICIES)}"}), 400
+
+    strict = request.args.get('strict', '').lower() in truthy
+    try:
+        summary = import_problems(
+            stream, import_format,
+            default_source=request.args.get('source', ''),
+            strict=strict,
+            dry_run=request.args.get('dry_run', '').lower() in truthy,
+            on_duplicate=on_duplicate,
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not read the import file: {e}"}), 400
+    except Exception as e:
+        logging.exception("Error in import_problems_route")
+        return jsonify({"error": "An unexpected error occurred during the import"}), 500
+
+    if strict and summary["failed"]:
+        return jsonify(summary), 422
+    return jsonify(summary), 201 if summary["imported"] else 200
+
 @app.route('/api/problems', methods=['GET'])
 def get_problems():
+    """
+    Lists problems. Optional query parameters:
+      problem_type  case-insensitive type filter
+      sort          created_time or updated_time; prefix with '-' for newest first
+      fields        comma-separated subset of columns to return, e.g. problem_id,problem_text
+      limit/cursor  page size and the opaque cursor returned as next_cursor by the previous page
+    Without limit/cursor the response is the plain JSON list it has always been; with them it is
+    {"items": [...], "next_cursor": "..." or null}. Pages are ordered by the sort column
+    (created_time by default), then problem ID; the cursor holds the last row's values of both,
+    so the next page starts right after it even if problems were added or deleted meanwhile.
+    """
     try:
         # Retrieve potential filter parameters from request.args
         filter_problem_type = request.args.get('problem_type', None)
+        sort_param = request.args.get('sort', '')
+        fields_param = request.args.get('fields', '')
+        limit_param = request.args.get('limit')
+        cursor_param = request.args.get('cursor')
+        paginated = limit_param is not None or cursor_param is not None
 
-        problems = load_problems()
-
-        if filter_problem_type:
-            # Perform case-insensitive filtering
-            filter_problem_type_lower = filter_problem_type.lower()
-            filtered_problems = [
-                p for p in problems
-                if p.get('problem_type', '').lower() == filter_problem_type_lower
-            ]
-            problems = filtered_problems # Replace original list with filtered list
-
-        return jsonify(problems), 200
+        try:
+            limit = int(limit_param) if limit_param is not None else (MAX_PAGE_SIZE if paginated else None)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        try:
+            after = _decode_cursor(cursor_param) if cursor_param else None
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        descending = sort_param.startswith('-')
+        sort_by = sort_param.lstrip('-') or ("created_time" if paginated else None)
+        fields = [field.strip() for field in fields_param.split(',') if field.strip()] or None
+        # The cursor needs the last row's sort value and ID even if they aren't projected
+        query_fields = fields
+        if paginated and fields:
+            query_fields = fields + [field for field in (sort_by, 'problem_id') if field not in fields]
+
+        # The representation depends only on the data version and the query parameters
+        etag = _make_etag(get_data_version(), *sorted(request.args.items(multi=True)))
+        last_modified = get_last_modified()
+        not_modified = _not_modified_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Filtering, sorting, paging and projection are done by the storage layer (in SQL for sqlite).
+        # One extra row is fetched to find out whether another page follows.
+        try:
+            problems = query_problems(
+                problem_type=filter_problem_type, sort_by=sort_by, descending=descending,
+                limit=limit + 1 if limit is not None else None, fields=query_fields, after=after
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if not paginated:
+            return _with_validators(jsonify(problems), etag, last_modified), 200
+
+        items = problems[:limit]
+        next_cursor = _encode_cursor(items[-1], sort_by) if len(problems) > limit else None
+        if query_fields != fields:
+            items = [{field: problem[field] for field in fields} for problem in items]
+        response = jsonify({"items": items, "next_cursor": next_cursor})
+        return _with_validators(response, etag, last_modified), 200
     except Exception as e:
         # Log the exception e for debugging
         logging.exception("Error in get_problems")
         return jsonify({"error": "An unexpected error occurred while retrieving problems"}), 500
 
+@app.route('/api/problems/search', methods=['GET'])
+def search_problems_endpoint():
+    """
+    Full-text search over problem_text, answer and solution steps (Chinese is matched by
+    character n-grams). Query parameters: q (required), problem_type, limit, cursor.
+    Returns {"total": n, "total_exact": bool, "items": [...], "next_cursor": ...}, best matches
+    first; each item carries its "search_score". Totals that are expensive to count exactly are
+    estimated (total_exact false); next_cursor doesn't depend on them.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' is required"}), 400
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+        offset = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    if offset < 0:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    try:
+        # One extra hit tells whether another page follows
+        result = search_problems(query, problem_type=request.args.get('problem_type'), offset=offset, limit=limit + 1)
+    except Exception as e:
+        logging.exception("Error in search_problems_endpoint")
+        return jsonify({"error": "An unexpected error occurred while searching problems"}), 500
+    next_cursor = str(offset + limit) if len(result["items"]) > limit else None
+    return jsonify({"total": result["total"], "total_exact": result["total_exact"],
+                    "items": result["items"][:limit], "next_cursor": next_cursor}), 200
+
+@app.route('/api/problems/duplicates', methods=['GET'])
+def find_duplicates_endpoint():
+    """
+    Existing problems that nearly duplicate `problem_text` (query parameter, required), most
+    similar first, without adding anything. Optional: threshold (0-1 Jaccard similarity of the
+    character shingles, default DUPLICATE_THRESHOLD), limit.
+    """
+    problem_text = request.args.get('problem_text', '').strip()
+    if not problem_text:
+        return jsonify({"error": "Query parameter 'problem_text' is required"}), 400
+    try:
+        threshold = request.args.get('threshold')
+        threshold = float(threshold) if threshold else None
+        limit = int(request.args.get('limit', 5))
+    except ValueError:
+        return jsonify({"error": "threshold must be a number and limit an integer"}), 400
+    if threshold is not None and not 0 < threshold <= 1:
+        return jsonify({"error": "threshold must be between 0 and 1"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    try:
+        duplicates = find_duplicates(problem_text, threshold=threshold, limit=limit)
+    except Exception as e:
+        logging.exception("Error in find_duplicates_endpoint")
+        return jsonify({"error": "An unexpected error occurred while checking for duplicates"}), 500
+    return jsonify({"duplicates": duplicates}), 200
+
 @app.route('/api/problems/<problem_id>', methods=['GET'])
 def get_problem(problem_id):
     try:
         problem = get_problem_by_id(problem_id)
         if problem:
-            return jsonify(problem), 200
+            etag = _problem_etag(problem)
+            last_modified = _parse_timestamp(problem.get('updated_time'))
+            not_modified = _not_modified_response(etag, last_modified)
+            if not_modified is not None:
+                return not_modified
+            return _with_validators(jsonify(problem), etag, last_modified), 200
         else:
             return jsonify({"error": "Problem not found"}), 404
     except Exception as e:
@@ -96,9 +374,50 @@ def get_problem(problem_id):
         logging.exception(f"Error in get_problem(problem_id={problem_id})")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
+def _run_generate_solution_job(params, report_progress):
+    """Job handler: generates and stores solution steps for one problem. Returns the updated problem."""
+    problem_id = params['problem_id']
+    problem = get_problem_by_id(problem_id)
+    if not problem:
+        raise LookupError(f"Problem {problem_id} not found")
+
+    report_progress("generating")
+    # Raises GoogleAPIError on API failures so the queue can retry the transient ones
+    generated_steps = request_solution_steps(
+        problem.get('problem_text'), problem.get('problem_type'), problem.get('answer'),
+        student_level=params.get('student_level'), force_regenerate=params.get('force_regenerate', False)
+    )
+
+    report_progress("saving")
+    if not update_problem_solution(problem_id, generated_steps):
+        raise LookupError(f"Problem {problem_id} was deleted while its solution was being generated")
+    return {"problem": get_problem_by_id(problem_id)}
+
+def _run_export_job(params, report_progress):
+    """Job handler: renders an export to a file under export_files. Returns where to download it."""
+    export_format = get_export_format(params['format'])
+    if export_format is None:
+        raise ValueError(f"Unknown export format '{params['format']}'")
+    data_version = get_data_version()
+    report_progress("rendering", problems=0)
+    problems = with_progress(iter_problems(problem_type=params.get('type')), report_progress)
+    written = export_files.write(export_format.render(problems, export_full=params.get('export_full', True)),
+                                 export_format.extension)
+    return dict(written, format=params['format'], data_version=data_version,
+                download_url=f"/api/exports/{written['file_name']}")
+
+job_queue.register_handler("generate_solution", _run_generate_solution_job)
+job_queue.register_handler("export", _run_export_job)
+job_queue.start() # Also resumes jobs left unfinished by a previous run
+export_files.collect_garbage()
+
 @app.route('/api/problems/<problem_id>/generate_solution', methods=['POST'])
 def generate_solution_for_problem(problem_id):
-    # 1. Get the problem
+    """
+    Queues solution generation for a problem and returns 202 with the job.
+    Poll GET /api/jobs/<job_id> for progress; the updated problem is in the job's result.
+    """
+    # 1. Check the problem up front so obvious mistakes don't become failed jobs
     try:
         problem = get_problem_by_id(problem_id)
         if not problem:
@@ -117,71 +436,205 @@ def generate_solution_for_problem(problem_id):
         # For now, keeping it as a required piece of info from the problem itself.
         return jsonify({"error": "Problem data (text, type, answer) is incomplete, cannot generate solution."}), 400
 
-    # Get student_level from request JSON
+    # Get student_level (and force_regenerate, to bypass the response cache) from request JSON
     student_level = None
-    request_data = request.get_json()
+    force_regenerate = False
+    request_data = request.get_json(silent=True)
     if request_data:
         student_level = request_data.get('student_level')
+        force_regenerate = bool(request_data.get('force_regenerate'))
 
-    # 2. Generate solution steps via Gemini
+    # 2. Queue the Gemini call
+    try:
+        job = job_queue.submit("generate_solution", {
+            "problem_id": problem_id, "student_level": student_level, "force_regenerate": force_regenerate
+        })
+    except Exception as e:
+        logging.exception(f"Error queueing solution generation for problem {problem_id}")
+        return jsonify({"error": "An error occurred while queueing solution generation"}), 500
+
+    status_url = f"/api/jobs/{job['job_id']}"
+    response = make_response(jsonify(dict(job, status_url=status_url)), 202)
+    response.headers['Location'] = status_url
+    return response
+
+def _sse_event(event, data):
+    """Formats one Server-Sent Event; data is JSON so newlines in the text survive."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/problems/<problem_id>/generate_solution/stream', methods=['GET'])
+def stream_solution_for_problem(problem_id):
+    """
+    Generates solution steps and streams them as Server-Sent Events while Gemini produces them.
+    Query parameters: student_level, force_regenerate=1.
+
+    Events: `chunk` {"text": ...} for each piece of text, then `done` with the updated problem once
+    the full text is saved, or `generation_error` {"error": ...} if generation fails.
+    GET because that is what the browser's EventSource sends.
+    """
     try:
-        generated_steps = generate_solution_steps(problem_text, problem_type, answer, student_level=student_level)
-        if not generated_steps or generated_steps.startswith("Error:"):
-            error_detail = generated_steps if generated_steps else "No content from Gemini."
-            logging.error(f"Gemini API error for problem {problem_id} (level: {student_level}): {error_detail}")
-            return jsonify({
-                "error": "Failed to generate solution from Gemini API",
-                "details": error_detail
-            }), 502 # Bad Gateway, as we depend on an upstream service
+        problem = get_problem_by_id(problem_id)
+        if not problem:
+            return jsonify({"error": "Problem not found"}), 404
     except Exception as e:
-        logging.exception(f"Exception calling Gemini API for problem {problem_id}")
-        return jsonify({"error": "An unexpected error occurred while generating solution steps"}), 500
+        logging.exception(f"Error retrieving problem {problem_id}")
+        return jsonify({"error": f"An error occurred while retrieving problem {problem_id}"}), 500
+
+    problem_text = problem.get('problem_text')
+    problem_type = problem.get('problem_type')
+    answer = problem.get('answer')
+    if not all([problem_text, problem_type, answer]):
+        return jsonify({"error": "Problem data (text, type, answer) is incomplete, cannot generate solution."}), 400
+
+    student_level = request.args.get('student_level') or None
+    force_regenerate = request.args.get('force_regenerate', '').lower() in ('1', 'true', 'yes')
+
+    def events():
+        parts = []
+        try:
+            for text in stream_solution_steps(problem_text, problem_type, answer,
+                                              student_level=student_level, force_regenerate=force_regenerate):
+                parts.append(text)
+                yield _sse_event("chunk", {"text": text})
+        except Exception as e:
+            logging.error(f"Streaming generation failed for problem {problem_id} (level: {student_level}): {e}")
+            yield _sse_event("generation_error", {"error": "Failed to generate solution from Gemini API", "details": str(e)})
+            return
 
-    # 3. Update the problem with the generated solution
+        # Persist once the stream has finished
+        try:
+            if not update_problem_solution(problem_id, "".join(parts).strip()):
+                yield _sse_event("generation_error", {"error": "Problem was deleted while its solution was being generated"})
+                return
+            yield _sse_event("done", get_problem_by_id(problem_id))
+        except Exception as e:
+            logging.exception(f"Error updating problem {problem_id} with streamed solution")
+            yield _sse_event("generation_error", {"error": f"An error occurred while updating problem {problem_id} with the solution"})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Don't let a reverse proxy hold the events back
+    return response
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background job: status, attempts, progress, and result or error once finished."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+def _generate_for_batch(problem, student_level, force_regenerate=False):
+    """Generates steps for one problem of a batch. Returns (status, steps_or_error)."""
+    problem_text = problem.get('problem_text')
+    problem_type = problem.get('problem_type')
+    answer = problem.get('answer')
+    if not all([problem_text, problem_type, answer]):
+        return "incomplete", "Problem data (text, type, answer) is incomplete, cannot generate solution."
     try:
-        updated_problem_data = update_problem_solution(problem_id, generated_steps)
-        if not updated_problem_data:
-             # This case might occur if update_problem_solution itself can't find the problem again
-             # or if the update operation fails silently (though it should raise an exception ideally)
-            logging.error(f"Failed to update problem {problem_id} after generating solution.")
-            return jsonify({"error": "Failed to update problem with solution, problem may have been deleted."}), 500
+        generated_steps = generate_solution_steps(problem_text, problem_type, answer, student_level=student_level,
+                                                  force_regenerate=force_regenerate)
     except Exception as e:
-        logging.exception(f"Error updating problem {problem_id} with solution")
-        return jsonify({"error": f"An error occurred while updating problem {problem_id} with the solution"}), 500
+        logging.exception(f"Exception calling Gemini API for problem {problem.get('problem_id')}")
+        return "error", f"An unexpected error occurred while generating solution steps: {e}"
+    if is_error_response(generated_steps):
+        return "error", generated_steps or "No content from Gemini."
+    return "generated", generated_steps
+
+@app.route('/api/problems/generate_solutions', methods=['POST'])
+def generate_solutions_batch():
+    """
+    Generates solution steps for many problems at once.
+
+    JSON body: either {"problem_ids": [...]} or {"missing_only": true} (every problem without
+    solution_steps_gemini), plus optional "problem_type" (with missing_only), "student_level",
+    "force_regenerate" (bypass the response cache) and "max_workers". Gemini calls run on a bounded thread pool; all successful results are
+    committed with a single bulk write. Returns per-item status:
+    generated | skipped (already solved, with missing_only) | not_found | incomplete | error |
+    deleted (removed while generating).
+    """
+    request_data = request.get_json(silent=True) or {}
+    problem_ids = request_data.get('problem_ids')
+    missing_only = bool(request_data.get('missing_only'))
+    student_level = request_data.get('student_level')
+    force_regenerate = bool(request_data.get('force_regenerate'))
+
+    if problem_ids is None and not missing_only:
+        return jsonify({"error": "Provide 'problem_ids' or set 'missing_only' to true"}), 400
+    if problem_ids is not None and (not isinstance(problem_ids, list)
+                                    or not all(isinstance(pid, str) for pid in problem_ids)):
+        return jsonify({"error": "'problem_ids' must be a list of problem ID strings"}), 400
+    try:
+        max_workers = int(request_data.get('max_workers', BATCH_GENERATION_WORKERS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'max_workers' must be an integer"}), 400
+    max_workers = max(1, min(max_workers, MAX_BATCH_GENERATION_WORKERS))
 
-    # 4. Return the updated problem
-    # Re-fetch to ensure we have the absolute latest state, though update_problem_solution might return it.
-    # For consistency and to adhere to the subtask (retrieve the updated problem).
+    results = {}
     try:
-        final_updated_problem = get_problem_by_id(problem_id)
-        if not final_updated_problem:
-            # Should ideally not happen if update was successful
-            logging.error(f"Problem {problem_id} not found after successful update. This is unexpected.")
-            return jsonify({"error": "Problem disappeared after update, please check system integrity."}), 500
-        return jsonify(final_updated_problem), 200
+        if problem_ids is not None:
+            # One snapshot instead of a load per ID; dict.fromkeys drops duplicates but keeps order
+            wanted = dict.fromkeys(problem_ids)
+            problems_by_id = {p['problem_id']: p for p in iter_problems() if p['problem_id'] in wanted}
+            targets = []
+            for problem_id in wanted:
+                if problem_id in problems_by_id:
+                    targets.append(problems_by_id[problem_id])
+                else:
+                    results[problem_id] = {"problem_id": problem_id, "status": "not_found"}
+            if missing_only:
+                for problem in targets:
+                    if problem.get('solution_steps_gemini'):
+                        results[problem['problem_id']] = {"problem_id": problem['problem_id'], "status": "skipped"}
+                targets = [p for p in targets if not p.get('solution_steps_gemini')]
+        else:
+            targets = [p for p in iter_problems(request_data.get('problem_type'))
+                       if not p.get('solution_steps_gemini')]
     except Exception as e:
-        logging.exception(f"Error re-retrieving problem {problem_id} after update")
-        return jsonify({"error": f"An error occurred retrieving the updated problem {problem_id}"}), 500
+        logging.exception("Error loading problems for batch generation")
+        return jsonify({"error": "An error occurred while loading problems"}), 500
+
+    solutions = {}
+    if targets:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)),
+                                thread_name_prefix="batch-generate") as executor:
+            outcomes = executor.map(lambda p: _generate_for_batch(p, student_level, force_regenerate), targets)
+            for problem, (status, detail) in zip(targets, outcomes):
+                problem_id = problem['problem_id']
+                result = {"problem_id": problem_id, "status": status}
+                if status == "generated":
+                    solutions[problem_id] = detail
+                else:
+                    logging.error(f"Batch generation failed for problem {problem_id} ({status}): {detail}")
+                    result["error"] = detail
+                results[problem_id] = result
+
+    updated_ids = []
+    if solutions:
+        try:
+            updated_ids = update_problem_solutions(solutions)
+        except Exception as e:
+            logging.exception("Error committing batch generated solutions")
+            return jsonify({"error": "Solutions were generated but could not be saved"}), 500
+        for problem_id in set(solutions) - set(updated_ids):
+            results[problem_id] = {"problem_id": problem_id, "status": "deleted"}
+
+    ordered_ids = list(dict.fromkeys(problem_ids)) if problem_ids is not None else [p['problem_id'] for p in targets]
+    items = [results[pid] for pid in ordered_ids if pid in results]
+    summary = {}
+    for item in items:
+        summary[item["status"]] = summary.get(item["status"], 0) + 1
+    return jsonify({"updated": len(updated_ids), "summary": summary, "results": items}), 200
 
 @app.route('/api/problems/<problem_id>', methods=['PUT'])
 def update_existing_problem(problem_id):
     try:
-        all_problems = load_problems()
+        if not get_problem_by_id(problem_id):
+            return jsonify({"error": "Problem not found"}), 404
     except Exception as e:
         logging.exception("Error loading problems for update")
         return jsonify({"error": "Failed to load problem data for update."}), 500
 
-    problem_to_update = None
-    problem_idx = -1
-    for i, p in enumerate(all_problems):
-        if p.get('problem_id') == problem_id: # Corrected 'id' to 'problem_id'
-            problem_to_update = p
-            problem_idx = i
-            break
-
-    if not problem_to_update:
-        return jsonify({"error": "Problem not found"}), 404
-
     try:
         update_data = request.get_json()
         if not update_data:
@@ -190,43 +643,143 @@ def update_existing_problem(problem_id):
         logging.exception(f"Error getting JSON for update problem {problem_id}")
         return jsonify({"error": "Invalid JSON payload for update"}), 400
 
-    # Fields that can be updated
-    updatable_fields = ['problem_text', 'problem_type', 'answer', 'source', 'solution_steps_gemini']
-    updated_fields_count = 0
-
-    for field in updatable_fields:
-        if field in update_data:
-            problem_to_update[field] = update_data[field]
-            updated_fields_count +=1
-
-    if updated_fields_count == 0:
-        # If only timestamps are updated, this might be an issue.
-        # However, the task is to *set* updated_time, implying other fields might not change.
-        # For now, let's assume an update request should change at least one of the updatable_fields.
-        # If the only change is intended to be 'updated_time', this logic might need adjustment.
-        # Given the current structure, updated_time is added regardless.
-        pass # No return here if only updated_time is the change.
-
-    # Set/update the updated_time field
-    current_time_iso = datetime.now(timezone.utc).isoformat()
-    problem_to_update['updated_time'] = current_time_iso
-    # Ensure created_time is preserved if it exists, or set if this is an old record format.
-    if 'created_time' not in problem_to_update or not problem_to_update['created_time']:
-        # This case handles records that might have existed before created_time was introduced
-        # and are now being updated. It's a sensible default to set created_time to updated_time
-        # if it's missing, assuming this update is the first time it's being "timestamped".
-        problem_to_update['created_time'] = current_time_iso
-
-    all_problems[problem_idx] = problem_to_update
-
+    # Only UPDATABLE_FIELDS are applied; updated_time is set even if none of them is present
     try:
-        save_problems(all_problems)
+        updated_problem = update_problem(problem_id, update_data)
     except Exception as e:
         logging.exception(f"Error saving problems after update for problem_id {problem_id}")
         return jsonify({"error": "Failed to save updated problem data."}), 500
+    if updated_problem is None:
+        return jsonify({"error": "Problem not found"}), 404 # Deleted in the meantime
 
     # Return the modified problem dictionary
-    return jsonify(problem_to_update), 200
+    return jsonify(updated_problem), 200
+
+def _validate_patch(fields):
+    """Returns (cleaned fields, None) or (None, error) for a bulk update patch."""
+    if not isinstance(fields, dict) or not fields:
+        return None, "Patch must be a non-empty object"
+    unknown = [field for field in fields if field not in UPDATABLE_FIELDS]
+    if unknown:
+        return None, f"Fields cannot be updated: {', '.join(unknown)}. Updatable: {', '.join(UPDATABLE_FIELDS)}"
+    cleaned = {}
+    for field, value in fields.items():
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)) and value is not None:
+            return None, f"Field '{field}' must be a string"
+        cleaned[field] = "" if value is None else str(value)
+    blank = [field for field in ('problem_text', 'problem_type', 'answer') if field in cleaned and not cleaned[field].strip()]
+    if blank:
+        return None, f"Required fields cannot be empty: {', '.join(blank)}"
+    return cleaned, None
+
+def _bulk_filter(request_data):
+    """(problem_type, source) from {"filter": {...}}; raises ValueError if neither is given."""
+    bulk_filter = request_data.get('filter')
+    if not isinstance(bulk_filter, dict):
+        raise ValueError("'filter' must be an object with problem_type and/or source")
+    problem_type, source = bulk_filter.get('problem_type'), bulk_filter.get('source')
+    if not problem_type and not source:
+        raise ValueError("'filter' needs problem_type and/or source")
+    return problem_type, source
+
+def _id_list(request_data):
+    problem_ids = request_data.get('problem_ids')
+    if not isinstance(problem_ids, list) or not all(isinstance(pid, str) for pid in problem_ids):
+        raise ValueError("'problem_ids' must be a list of problem ID strings")
+    return problem_ids
+
+@app.route('/api/problems/bulk_update', methods=['POST'])
+def bulk_update_problems():
+    """
+    Applies many updates in one storage commit, all with the same updated_time. JSON body, one of:
+      {"patches": [{"problem_id": "P001", "answer": "8", ...}, ...]}   individual patches
+      {"problem_ids": [...], "set": {...}}                              one patch for listed problems
+      {"filter": {"problem_type": ..., "source": ...}, "set": {...}}    one patch for all matches
+    Returns per-item outcomes: updated | not_found | invalid.
+    """
+    request_data = request.get_json(silent=True)
+    if not isinstance(request_data, dict):
+        return jsonify({"error": "Invalid JSON payload"}), 400
+
+    results = {}
+    patches = {}
+    try:
+        if 'patches' in request_data:
+            if not isinstance(request_data['patches'], list):
+                raise ValueError("'patches' must be a list")
+            for item in request_data['patches']:
+                problem_id = item.get('problem_id') if isinstance(item, dict) else None
+                if not isinstance(problem_id, str):
+                    raise ValueError("Every patch needs a problem_id string")
+                fields, error = _validate_patch({k: v for k, v in item.items() if k != 'problem_id'})
+                if error:
+                    results[problem_id] = {"problem_id": problem_id, "status": "invalid", "error": error}
+                else:
+                    patches[problem_id] = fields
+                    results[problem_id] = None # Keeps request order; filled in below
+        else:
+            fields, error = _validate_patch(request_data.get('set'))
+            if error:
+                raise ValueError(f"Invalid 'set': {error}")
+            if 'filter' in request_data:
+                problem_type, source = _bulk_filter(request_data)
+                updated = update_problems_matching(fields, problem_type=problem_type, source=source)
+                return jsonify({
+                    "updated": len(updated),
+                    "updated_time": updated[0]['updated_time'] if updated else None,
+                    "results": [{"problem_id": p['problem_id'], "status": "updated"} for p in updated],
+                }), 200
+            patches = {problem_id: fields for problem_id in _id_list(request_data)}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in bulk_update_problems")
+        return jsonify({"error": "An unexpected error occurred during the bulk update"}), 500
+
+    updated_time = None
+    if patches:
+        try:
+            outcomes = update_problems(patches)
+        except Exception as e:
+            logging.exception("Error in bulk_update_problems")
+            return jsonify({"error": "An unexpected error occurred during the bulk update"}), 500
+        for problem_id, problem in outcomes.items():
+            if problem is None:
+                results[problem_id] = {"problem_id": problem_id, "status": "not_found"}
+            else:
+                results[problem_id] = {"problem_id": problem_id, "status": "updated"}
+                updated_time = problem['updated_time']
+    return jsonify({
+        "updated": sum(1 for result in results.values() if result["status"] == "updated"),
+        "updated_time": updated_time,
+        "results": list(results.values()),
+    }), 200
+
+@app.route('/api/problems/bulk_delete', methods=['POST'])
+def bulk_delete_problems():
+    """
+    Deletes many problems in one storage commit. JSON body: {"problem_ids": [...]} or
+    {"filter": {"problem_type": ..., "source": ...}}. Returns per-item outcomes: deleted | not_found.
+    """
+    request_data = request.get_json(silent=True)
+    if not isinstance(request_data, dict):
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    try:
+        if 'filter' in request_data:
+            problem_type, source = _bulk_filter(request_data)
+            deleted = delete_problems_matching(problem_type=problem_type, source=source)
+            results = [{"problem_id": problem_id, "status": "deleted"} for problem_id in deleted]
+        else:
+            problem_ids = list(dict.fromkeys(_id_list(request_data)))
+            deleted = set(delete_problems(problem_ids))
+            results = [{"problem_id": problem_id, "status": "deleted" if problem_id in deleted else "not_found"}
+                       for problem_id in problem_ids]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in bulk_delete_problems")
+        return jsonify({"error": "An unexpected error occurred during the bulk delete"}), 500
+    return jsonify({"deleted": len(deleted), "results": results}), 200
 
 @app.route('/api/problems/<problem_id>', methods=['DELETE'])
 def delete_problem_endpoint(problem_id):
@@ -242,58 +795,205 @@ def delete_problem_endpoint(problem_id):
 
 @app.route('/api/export/problems', methods=['GET'])
 def export_problems_route():
+    """
+    Exports problems as a download. Query parameters: type (problem_type filter), export_full
+    (default true: include answers and solution steps) and format (html, markdown, jsonl or pdf;
+    default html). Every format is rendered and streamed incrementally.
+    """
     try:
         # Retrieve query parameters
         filter_type = request.args.get('type', None)
         export_full_str = request.args.get('export_full', 'true').lower()
         export_full_flag = export_full_str == 'true'
-
-        # Load problems
+        export_format_name = request.args.get('format', 'html').lower()
+        export_format = get_export_format(export_format_name)
+        if export_format is None:
+            return jsonify({"error": f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        filename = f"problems_export.{export_format.extension}"
+
+        # An unchanged bank exported with the same options yields the same file
+        data_version = get_data_version()
+        etag = _make_etag(data_version, (filter_type or '').lower(), export_full_flag, export_format_name)
+        last_modified = get_last_modified()
+        not_modified = _not_modified_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = ExportCache.make_key(filter_type, export_full_flag, data_version, export_format_name)
+        cached_export = export_cache.get(cache_key)
+        if cached_export is not None:
+            if isinstance(cached_export, bytes):
+                response = make_response(cached_export)
+            else:
+                # Disk tier: an open file, sent by the server even if another worker purges it meanwhile
+                response = send_file(cached_export, mimetype=export_format.mimetype, conditional=False)
+            response.headers['Content-Type'] = export_format.mimetype
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return _with_validators(response, etag, last_modified), 200
+
+        # Iterate problems lazily, filtered by type if specified
         try:
-            all_problems = load_problems()
+            problems_to_export = iter_problems(problem_type=filter_type)
+            first_problem = next(problems_to_export, None)
         except Exception as e:
             logging.exception("Error loading problems for export")
             return jsonify({"error": "Failed to load problem data for export."}), 500
 
-        # Filter problems if type is specified
-        problems_to_export = []
-        if filter_type:
-            for p in all_problems:
-                if p.get('problem_type', '').lower() == filter_type.lower():
-                    problems_to_export.append(p)
-        else:
-            problems_to_export = all_problems
-
-        if not problems_to_export:
+        if first_problem is None:
             return jsonify({"message": "No problems found matching the criteria for export."}), 404
 
-        # Call exporter
-        # ASSUMPTION: export_problems_to_html returns the HTML content as a string.
-        # If it writes to a file, we'd need to use a temp file and send_file.
-        # e.g., temp_filepath = f"/tmp/{uuid.uuid4()}.html"
-        #       export_problems_to_html(problems_to_export, output_filename=temp_filepath, export_full=export_full_flag)
-        #       return send_file(temp_filepath, as_attachment=True, download_name='problems_export.html', mimetype='text/html')
-        #       # Remember to os.remove(temp_filepath) in a finally or after_this_request
+        # Render and send the document chunk by chunk: memory stays flat regardless of the
+        # bank size and the download starts as soon as the first chunk is ready.
+        # The first chunk is rendered eagerly so setup errors still produce a proper 500.
         try:
-            html_content = export_problems_to_html(problems_to_export, export_full=export_full_flag)
-            if not html_content:
-                logging.warning("Export function returned empty content.")
-                return jsonify({"error": "Failed to generate HTML content for export."}), 500
+            chunks = export_format.render(
+                itertools.chain([first_problem], problems_to_export), export_full=export_full_flag
+            )
+            first_chunk = next(chunks)
         except Exception as e:
-            logging.exception("Error during HTML export process")
+            logging.exception(f"Error during {export_format_name} export process")
             return jsonify({"error": "An unexpected error occurred during the export process."}), 500
 
-        # Create and return response
-        response = make_response(html_content)
-        response.headers['Content-Type'] = 'text/html'
-        response.headers['Content-Disposition'] = 'attachment; filename="problems_export.html"'
-        return response, 200
+        def generate():
+            yield first_chunk
+            try:
+                yield from chunks
+            except Exception:
+                # Headers are already sent; all we can do is log and cut the download short.
+                logging.exception(f"Error while streaming {export_format_name} export")
+                raise
+
+        # The export is recorded into the cache while it streams to this client
+        response = Response(stream_with_context(export_cache.tee(cache_key, generate())), mimetype=export_format.mimetype)
+        response.headers['Content-Type'] = export_format.mimetype
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return _with_validators(response, etag, last_modified), 200
 
     except Exception as e:
         # Catch-all for any other unexpected errors
         logging.exception("Unexpected error in export_problems_route")
         return jsonify({"error": "An unexpected server error occurred."}), 500
 
+def _worksheet_response(worksheet, export_full, title, export_format):
+    """Renders a worksheet through an exporter, with its ID and seed in the headers."""
+    problems = worksheet_problems(worksheet)
+    chunks = export_format.render(problems, export_full=export_full, title=title)
+    response = make_response(b"".join(chunk.encode('utf-8') if isinstance(chunk, str) else chunk for chunk in chunks))
+    response.headers['Content-Type'] = export_format.mimetype
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="worksheet_{worksheet["worksheet_id"]}.{export_format.extension}"'
+    )
+    response.headers['X-Worksheet-Id'] = worksheet["worksheet_id"]
+    response.headers['X-Worksheet-Seed'] = str(worksheet["seed"])
+    return response
+
+@app.route('/api/worksheets', methods=['POST'])
+def create_worksheet():
+    """
+    Generates a printable worksheet. JSON body:
+      counts       {"problem_type": number of problems, ...} (required, types match case-insensitively)
+      seed         integer; the same seed over an unchanged bank and history gives the same sheet
+      avoid_last   don't repeat problems from this many recent worksheets (default WORKSHEET_AVOID_LAST)
+      export_full  include answers and solution steps (default false)
+      title        heading of the sheet
+      format       html (default), markdown, jsonl or pdf
+    Returns the document (201); X-Worksheet-Id / Location identify it for re-rendering,
+    e.g. as an answer key with GET /api/worksheets/<id>?export_full=true.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    export_format = get_export_format(data.get('format') or 'html')
+    if export_format is None:
+        return jsonify({"error": f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    avoid_last = data.get('avoid_last')
+    if avoid_last is not None and (not isinstance(avoid_last, int) or isinstance(avoid_last, bool) or avoid_last < 0):
+        return jsonify({"error": "avoid_last must be a non-negative integer"}), 400
+    try:
+        worksheet = generate_worksheet(data.get('counts'), seed=data.get('seed'), avoid_last=avoid_last)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception("Error in create_worksheet")
+        return jsonify({"error": "An unexpected error occurred while generating the worksheet"}), 500
+
+    response = _worksheet_response(worksheet, bool(data.get('export_full', False)), data.get('title') or "Worksheet",
+                                   export_format)
+    response.headers['Location'] = f"/api/worksheets/{worksheet['worksheet_id']}"
+    return response, 201
+
+@app.route('/api/worksheets/<worksheet_id>', methods=['GET'])
+def get_worksheet_route(worksheet_id):
+    """
+    Re-renders a recent worksheet; export_full=true gives its answer key, title sets the heading
+    and format the output format.
+    """
+    worksheet = get_worksheet(worksheet_id)
+    if worksheet is None:
+        return jsonify({"error": "Worksheet not found"}), 404
+    export_format = get_export_format(request.args.get('format', 'html'))
+    if export_format is None:
+        return jsonify({"error": f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    export_full = request.args.get('export_full', 'false').lower() == 'true'
+    return _worksheet_response(worksheet, export_full, request.args.get('title') or "Worksheet", export_format), 200
+
+@app.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """
+    Renders an export in the background instead of in this request. Takes the query parameters
+    of GET /api/export/problems (type, export_full, format) and returns 202 with the job. Poll
+    GET /api/jobs/<job_id>; once it has succeeded, its result holds the download_url.
+    """
+    export_format_name = request.args.get('format', 'html').lower()
+    if get_export_format(export_format_name) is None:
+        return jsonify({"error": f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        job = job_queue.submit("export", {
+            "type": request.args.get('type') or None,
+            "export_full": request.args.get('export_full', 'true').lower() == 'true',
+            "format": export_format_name,
+        })
+    except Exception as e:
+        logging.exception("Error queueing export job")
+        return jsonify({"error": "An error occurred while queueing the export"}), 500
+
+    status_url = f"/api/jobs/{job['job_id']}"
+    response = make_response(jsonify(dict(job, status_url=status_url)), 202)
+    response.headers['Location'] = status_url
+    return response
+
+@app.route('/api/exports/<file_name>', methods=['GET'])
+def download_export(file_name):
+    """Downloads a finished background export by the file name (token) from its job's result."""
+    path = export_files.path(file_name)
+    if path is None:
+        return jsonify({"error": "Export not found or expired"}), 404
+    extension = file_name.rsplit('.', 1)[-1]
+    mimetype = next((export_format.mimetype for export_format in EXPORT_FORMATS.values()
+                     if export_format.extension == extension), 'application/octet-stream')
+    # send_file hands the open file to the server (wsgi.file_wrapper, i.e. sendfile under gunicorn)
+    response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=f"problems_export.{extension}")
+    response.headers['Content-Type'] = mimetype # The registry's value names the charset; don't let Flask add another
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Cache and throughput counters of this worker process."""
+    solution_cache = get_solution_cache()
+    return jsonify({
+        "export_cache": export_cache.stats(),
+        "export_fragment_cache": fragment_cache_stats(),
+        "jobs": job_queue.stats(),
+        "export_files": export_files.stats(),
+        "gemini_throttle": gemini_throttle.stats(),
+        "gemini_coalescing": gemini_single_flight.stats(),
+        "local_solver": local_solver_stats(),
+        "search_index": get_search_index().stats(),
+        "duplicate_index": get_duplicate_index().stats(),
+        "worksheet_pools": get_worksheet_pools().stats(),
+        "gemini_cache": solution_cache.stats() if solution_cache is not None else None,
+    }), 200
+
 if __name__ == '__main__':
     # Consider whether to run with debug=True in production or rely on logging
     logging.info("Starting Flask app")
@@ -0,0 +1,334 @@
+import io
+import os
+import csv
+import sys
+import json
+import logging
+import argparse
+
+from problem_manager import DEFAULT_FILEPATH, add_problems
+from duplicate_index import DUPLICATE_POLICIES, find_batch_duplicates
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "jsonl")
+REQUIRED_FIELDS = ("problem_text", "problem_type", "answer")
+OPTIONAL_FIELDS = ("source", "solution_steps_gemini")
+# Per-row errors listed in a summary; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+# Checking every row for near-duplicates costs several times the import itself, so it is opt-in
+DEFAULT_IMPORT_DUPLICATE_POLICY = "allow"
+
+def detect_format(filename=None, content_type=None):
+    """Import format from a file name (.csv, .jsonl/.ndjson) or a Content-Type; None if unknown."""
+    if filename:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".csv":
+            return "csv"
+        if extension in (".jsonl", ".ndjson"):
+            return "jsonl"
+    if content_type:
+        content_type = content_type.split(";")[0].strip().lower()
+        if content_type in ("text/csv", "application/csv"):
+            return "csv"
+        if content_type in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines", "application/json-lines"):
+            return "jsonl"
+    return None
+
+def _iter_records(text_stream, import_format):
+    """Yields (row_number, record or None, error or None) without reading the whole input first."""
+    if import_format == "csv":
+        reader = csv.DictReader(text_stream)
+        if reader.fieldnames is None:
+            return
+        missing = [field for field in REQUIRED_FIELDS if field not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"CSV header is missing required columns: {', '.join(missing)}")
+        for row_number, record in enumerate(reader, start=1):
+            yield row_number, record, None
+    elif import_format == "jsonl":
+        row_number = 0
+        for line in text_stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_number, None, "Each line must be a JSON object"
+                continue
+            yield row_number, record, None
+    else:
+        raise ValueError(f"Unsupported import format '{import_format}'. Use one of: {', '.join(IMPORT_FORMATS)}")
+
+def validate_record(record, default_source=""):
+    """Returns (problem, None) for a usable record or (None, error). Unknown fields and problem_id are ignored."""
+    problem = {}
+    for field in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+        value = record.get(field)
+        if value is None:
+            value = ""
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value) # e.g. {"answer": 8} in JSON Lines
+        elif not isinstance(value, str):
+            return None, f"Field '{field}' must be a string"
+        problem[field] = value.strip()
+    missing = [field for field in REQUIRED_FIELDS if not problem[field]]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+    if not problem["source"]:
+        problem["source"] = default_source
+    return problem, None
+
+def import_problems(stream, import_format, filepath=DEFAULT_FILEPATH, default_source="", strict=False, dry_run=False,
+                    on_duplicate=DEFAULT_IMPORT_DUPLICATE_POLICY):
+    """
+    Validates rows from a CSV (header row required) or JSON Lines stream as they are read, then adds
+    all valid rows with add_problems: one bulk ID allocation and one storage write.
+
+    `stream` may be text or binary (decoded as UTF-8, a BOM is skipped). With `strict`, any invalid
+    row aborts the whole import; otherwise invalid rows are skipped. `dry_run` validates only.
+    Rows whose problem_text nearly duplicates an existing problem or an earlier row are reported
+    ({"row", "problem_id" or "duplicate_of_row", "similarity"}); with `on_duplicate` "reject" or
+    "link" they are not imported, with "warn" they are, and "allow" (the default) skips the check.
+    Returns a summary with counts, the range of new IDs and per-row errors ({"row", "error"}).
+    """
+    if on_duplicate not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy '{on_duplicate}'. Use one of: {', '.join(DUPLICATE_POLICIES)}")
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    valid = []
+    valid_rows = []
+    errors = []
+    failed = 0
+    total = 0
+    for row_number, record, error in _iter_records(stream, import_format):
+        total += 1
+        if error is None:
+            problem, error = validate_record(record, default_source)
+        if error is not None:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": row_number, "error": error})
+            continue
+        valid.append(problem)
+        valid_rows.append(row_number)
+
+    duplicates = []
+    if on_duplicate != "allow" and valid and not (strict and failed):
+        matches = find_batch_duplicates([problem["problem_text"] for problem in valid], filepath=filepath)
+        keep = []
+        for position, (problem, match) in enumerate(zip(valid, matches)):
+            if match is not None:
+                report = {"row": valid_rows[position], "similarity": match["similarity"]}
+                if "row" in match:
+                    report["duplicate_of_row"] = valid_rows[match["row"]]
+                else:
+                    report["problem_id"] = match["problem_id"]
+                duplicates.append(report)
+                if on_duplicate in ("reject", "link"):
+                    continue
+            keep.append(problem)
+        valid = keep
+
+    summary = {
+        "total_rows": total,
+        "imported": 0,
+        "failed": failed,
+        "first_problem_id": None,
+        "last_problem_id": None,
+        "errors": errors,
+        "errors_truncated": failed > len(errors),
+        "duplicates_found": len(duplicates),
+        "skipped_duplicates": len(duplicates) if on_duplicate in ("reject", "link") else 0,
+        "duplicates": duplicates[:MAX_REPORTED_ERRORS],
+        "dry_run": bool(dry_run),
+    }
+    if dry_run or not valid or (strict and failed):
+        if strict and failed:
+            logger.warning(f"Strict import aborted: {failed} of {total} rows are invalid")
+        return summary
+
+    created = add_problems(valid, filepath=filepath)
+    summary.update(imported=len(created), first_problem_id=created[0]["problem_id"],
+                   last_problem_id=created[-1]["problem_id"])
+    logger.info(f"Imported {len(created)} problems ({summary['first_problem_id']}-{summary['last_problem_id']}), "
+                f"{failed} rows rejected, {len(duplicates)} near-duplicates")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Import problems from a CSV (with a header row) or JSON Lines file in one bulk write."
+    )
+    parser.add_argument("input", help="File to import, or '-' for standard input")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Input format (default: from the file extension)")
+    parser.add_argument("--source", default="", help="Source recorded for rows that don't have one")
+    parser.add_argument("--filepath", default=DEFAULT_FILEPATH, help=f"Problem bank to import into (default: {DEFAULT_FILEPATH})")
+    parser.add_argument("--strict", action="store_true", help="Import nothing if any row is invalid")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only, don't write anything")
+    parser.add_argument("--on-duplicate", choices=DUPLICATE_POLICIES, default=DEFAULT_IMPORT_DUPLICATE_POLICY,
+                        help="Near-duplicate rows: don't check (allow, the default), import and report them (warn) "
+                             "or skip them (reject/link)")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    import_format = args.format or detect_format(filename=args.input if args.input != "-" else None)
+    if import_format is None:
+        parser.error("Cannot tell the format from the file name; pass --format csv or --format jsonl")
+
+    try:
+        if args.input == "-":
+            summary = import_problems(sys.stdin.buffer, import_format, args.filepath, args.source, args.strict, args.dry_run,
+                                      args.on_duplicate)
+        else:
+            with open(args.input, mode="rb") as f:
+                summary = import_problems(f, import_format, args.filepath, args.source, args.strict, args.dry_run,
+                                          args.on_duplicate)
+    except (OSError, ValueError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        verb = "Validated" if args.dry_run else "Imported"
+        count = summary["total_rows"] - summary["failed"] if args.dry_run else summary["imported"]
+        id_range = f" ({summary['first_problem_id']}-{summary['last_problem_id']})" if summary["imported"] else ""
+        print(f"{verb} {count} of {summary['total_rows']} rows{id_range}.")
+        for error in summary["errors"][:20]:
+            print(f"  row {error['row']}: {error['error']}")
+        if summary["failed"] > 20:
+            print(f"  ... and {summary['failed'] - 20} more invalid rows")
+        for duplicate in summary["duplicates"][:20]:
+            original = duplicate.get("problem_id") or f"row {duplicate.get('duplicate_of_row')}"
+            print(f"  row {duplicate['row']}: near-duplicate of {original} (similarity {duplicate['similarity']})")
+        if summary["skipped_duplicates"]:
+            print(f"Skipped {summary['skipped_duplicates']} near-duplicate rows.")
+        if args.strict and summary["failed"]:
+            print("Nothing was imported (--strict).")
+    return 1 if summary["failed"] else 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) > 1:
+        sys.exit(main())
+
+    import time
+    import shutil
+    import tempfile
+    from problem_manager import load_problems
+
+    print("Running basic tests for bulk_import...")
+    temp_dir = tempfile.mkdtemp(prefix="bulk_import_")
+    try:
+        def bank(name):
+            return os.path.join(temp_dir, name)
+
+        csv_bytes = ("\ufeffproblem_text,problem_type,answer,source\n"
+                     "计算 1 + 2,算术,3,\n"
+                     "一个正方形边长 4 厘米，面积是多少？,几何,16,教材\n"
+                     ",算术,5,\n").encode("utf-8")
+
+        # Binary input with a BOM: decoded, invalid rows skipped and reported, default source applied
+        summary = import_problems(io.BytesIO(csv_bytes), "csv", filepath=bank("basic.csv"), default_source="练习册")
+        assert summary["total_rows"] == 3 and summary["imported"] == 2 and summary["failed"] == 1
+        assert summary["errors"] == [{"row": 3, "error": "Missing required fields: problem_text"}]
+        imported = load_problems(bank("basic.csv"))
+        assert [p["problem_text"] for p in imported] == ["计算 1 + 2", "一个正方形边长 4 厘米，面积是多少？"]
+        assert [p["source"] for p in imported] == ["练习册", "教材"]
+        assert summary["first_problem_id"] == imported[0]["problem_id"]
+        assert summary["last_problem_id"] == imported[-1]["problem_id"]
+
+        # Strict: one bad row aborts everything
+        summary = import_problems(io.BytesIO(csv_bytes), "csv", filepath=bank("strict.csv"), strict=True)
+        assert summary["imported"] == 0 and summary["failed"] == 1 and not os.path.exists(bank("strict.csv"))
+
+        # Dry run validates without writing
+        summary = import_problems(io.BytesIO(csv_bytes), "csv", filepath=bank("dry.csv"), dry_run=True)
+        assert summary["dry_run"] and summary["imported"] == 0 and summary["failed"] == 1
+        assert load_problems(bank("dry.csv")) == []
+
+        # A CSV without the required columns is rejected as a whole
+        try:
+            import_problems(io.StringIO("problem_text,answer\n1 + 1,2\n"), "csv", filepath=bank("header.csv"))
+            assert False, "A missing header column should be rejected"
+        except ValueError as e:
+            assert "problem_type" in str(e)
+
+        # Bytes that aren't UTF-8 fail the import instead of being imported garbled
+        try:
+            import_problems(io.BytesIO(b"problem_text,problem_type,answer\n\xff\xfe\x00,x,1\n"), "csv",
+                            filepath=bank("binary.csv"))
+            assert False, "Undecodable input should be rejected"
+        except ValueError:
+            pass
+        assert load_problems(bank("binary.csv")) == []
+
+        # JSON Lines: blank lines are skipped, numbers accepted, non-objects and bad JSON reported
+        jsonl = "\n".join([
+            json.dumps({"problem_text": "3 × 4 = ?", "problem_type": "算术", "answer": 12}),
+            "",
+            json.dumps(["not", "an", "object"]),
+            "{not json",
+            json.dumps({"problem_text": "x + 1 = 2", "problem_type": "代数", "answer": "1", "extra": True}),
+        ])
+        summary = import_problems(io.StringIO(jsonl), "jsonl", filepath=bank("lines.csv"))
+        assert summary["total_rows"] == 4 and summary["imported"] == 2
+        assert [error["row"] for error in summary["errors"]] == [2, 3]
+        assert summary["errors"][0]["error"] == "Each line must be a JSON object"
+        assert load_problems(bank("lines.csv"))[0]["answer"] == "12"
+
+        # Beyond MAX_REPORTED_ERRORS, invalid rows are only counted
+        bad_rows = "".join(f",算术,{i}\n" for i in range(MAX_REPORTED_ERRORS + 5))
+        summary = import_problems(io.StringIO("problem_text,problem_type,answer\n" + bad_rows), "csv",
+                                  filepath=bank("errors.csv"))
+        assert summary["failed"] == MAX_REPORTED_ERRORS + 5 and len(summary["errors"]) == MAX_REPORTED_ERRORS
+        assert summary["errors_truncated"]
+
+        # Near-duplicates of the bank and of earlier rows are reported; reject skips them
+        duplicate_rows = "\n".join(json.dumps(record, ensure_ascii=False) for record in [
+            {"problem_text": "计算 1 + 2 。", "problem_type": "算术", "answer": "3"},
+            {"problem_text": "小明有 5 个苹果，吃了 2 个，还剩几个？", "problem_type": "应用题", "answer": "3"},
+            {"problem_text": "小明有 5 个苹果, 吃了 2 个, 还剩几个", "problem_type": "应用题", "answer": "3"},
+            {"problem_text": "小明有 7 个苹果，吃了 2 个，还剩几个？", "problem_type": "应用题", "answer": "5"},
+        ])
+        summary = import_problems(io.StringIO(duplicate_rows), "jsonl", filepath=bank("basic.csv"), dry_run=True,
+                                  on_duplicate="warn")
+        assert summary["duplicates_found"] == 2 and summary["skipped_duplicates"] == 0
+        assert summary["duplicates"][0]["row"] == 1 and summary["duplicates"][0]["problem_id"] == imported[0]["problem_id"]
+        assert summary["duplicates"][1] == {"row": 3, "duplicate_of_row": 2,
+                                            "similarity": summary["duplicates"][1]["similarity"]}
+        summary = import_problems(io.StringIO(duplicate_rows), "jsonl", filepath=bank("basic.csv"), on_duplicate="reject")
+        assert summary["imported"] == 2 and summary["skipped_duplicates"] == 2
+        summary = import_problems(io.StringIO(duplicate_rows), "jsonl", filepath=bank("basic.csv"))
+        assert summary["imported"] == 4 and summary["duplicates_found"] == 0, "Not checked by default"
+
+        # 100k rows with the default policy into a bank of 100k, then checking 100k more for duplicates
+        types = ["算术", "几何", "代数", "应用题"]
+        def rows(offset):
+            lines = ["problem_text,problem_type,answer"]
+            for i in range(offset, offset + 100000):
+                lines.append(f"小明有 {i} 个苹果，又买了 {i % 97} 个，现在一共有几个？,{types[i % 4]},{i + i % 97}")
+            return ("\n".join(lines) + "\n").encode("utf-8")
+        import_problems(io.BytesIO(rows(0)), "csv", filepath=bank("large.csv"))
+        started = time.perf_counter()
+        summary = import_problems(io.BytesIO(rows(100000)), "csv", filepath=bank("large.csv"))
+        elapsed = time.perf_counter() - started
+        print(f"Imported 100000 rows into a 100k bank ({DEFAULT_IMPORT_DUPLICATE_POLICY}): {elapsed:.2f} s")
+        assert summary["imported"] == 100000 and summary["last_problem_id"] == "P200000"
+        assert elapsed < 20, f"100k import took {elapsed:.1f} s"
+
+        started = time.perf_counter()
+        summary = import_problems(io.BytesIO(rows(150000)), "csv", filepath=bank("large.csv"), dry_run=True,
+                                  on_duplicate="warn")
+        elapsed = time.perf_counter() - started
+        print(f"Checked 100000 rows against a 200k bank (warn): {elapsed:.2f} s")
+        assert summary["duplicates_found"] == 50000 and summary["duplicates"][0]["problem_id"] == "P150001"
+        assert elapsed < 120, f"Duplicate check of 100k rows took {elapsed:.1f} s"
+    finally:
+        shutil.rmtree(temp_dir)
+    print("Basic tests for bulk_import completed.")
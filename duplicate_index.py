@@ -0,0 +1,372 @@
+import os
+import re
+import heapq
+import logging
+import operator
+import threading
+
+from problem_manager import DEFAULT_FILEPATH, get_repository
+from search_index import BankIndex, normalize
+
+logger = logging.getLogger(__name__)
+
+# "warn": add anyway and report the candidates, "reject": refuse, "link": return the existing
+# problem instead of adding, "allow": don't check at all
+DUPLICATE_POLICIES = ("warn", "reject", "link", "allow")
+DEFAULT_DUPLICATE_POLICY = "warn"
+DUPLICATE_THRESHOLD_ENV_VAR = "DUPLICATE_THRESHOLD"
+DEFAULT_DUPLICATE_THRESHOLD = 0.7
+DEFAULT_CANDIDATE_LIMIT = 5
+# Candidates verified per lookup at most: those sharing the most LSH bands with the text
+MAX_CANDIDATES = 50
+
+SHINGLE_SIZE = 2
+SIGNATURE_SIZE = 64
+BANDS = 16 # of 4 rows: pairs from about 0.5 Jaccard similarity up become candidates (0.7: 99%)
+_ROWS = SIGNATURE_SIZE // BANDS
+_HASH_MASK = (1 << 64) - 1
+_EMPTY = 1 << 64
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+def duplicate_threshold():
+    """Minimum Jaccard similarity of two texts' shingles for a duplicate (DUPLICATE_THRESHOLD, default 0.7)."""
+    try:
+        return float(os.getenv(DUPLICATE_THRESHOLD_ENV_VAR, DEFAULT_DUPLICATE_THRESHOLD))
+    except ValueError:
+        return DEFAULT_DUPLICATE_THRESHOLD
+
+def _shingles(normalized_text):
+    canonical = _NON_WORD_RE.sub("", normalized_text)
+    if len(canonical) <= SHINGLE_SIZE:
+        return {canonical} if canonical else set()
+    return set(map(operator.add, canonical, canonical[1:]))
+
+def shingles(text):
+    """Character bigrams of the text with case, full-width forms, spaces and punctuation folded away."""
+    return _shingles(normalize(text))
+
+def _numbers(text):
+    return tuple(_NUMBER_RE.findall(normalize(text)))
+
+def _features(text):
+    """(shingles, signature, numbers) of a text, normalizing it once."""
+    normalized = normalize(text)
+    text_shingles = _shingles(normalized)
+    return text_shingles, signature(text_shingles), tuple(_NUMBER_RE.findall(normalized))
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+def signature(shingle_set):
+    """
+    MinHash signature by one-permutation hashing: each shingle's hash goes to one of
+    SIGNATURE_SIZE bins, which keep their minimum; empty bins borrow from the next filled bin
+    (rotation densification). One hash per shingle instead of one per shingle and bin.
+    Hashes are per process (str hash), so signatures are never stored or shared.
+    """
+    if not shingle_set:
+        return None
+    bins = [_EMPTY] * SIGNATURE_SIZE
+    for value in map(hash, shingle_set):
+        value &= _HASH_MASK
+        position, value = value % SIGNATURE_SIZE, value // SIGNATURE_SIZE
+        if value < bins[position]:
+            bins[position] = value
+    # One pass backwards round the ring; bins after the last filled one borrow from the first
+    following = SIGNATURE_SIZE
+    while bins[following - SIGNATURE_SIZE] == _EMPTY:
+        following += 1
+    borrowed = bins[following - SIGNATURE_SIZE] + following * _EMPTY
+    result = list(bins)
+    for position in range(SIGNATURE_SIZE - 1, -1, -1):
+        value = bins[position]
+        if value == _EMPTY:
+            result[position] = borrowed - position * _EMPTY
+        else:
+            borrowed = value + position * _EMPTY
+    return tuple(result)
+
+class MinHashLSH:
+    """
+    Locality-sensitive hashing over MinHash signatures: each signature is cut into BANDS bands
+    and filed under every band. Texts sharing any band are candidates, so a lookup costs one
+    dict probe per band no matter how many texts are indexed.
+
+    Every band key also carries the text's `group` (its sequence of numbers), so only texts of
+    the same group meet in a bucket. Templated problems ("小明有{n}个苹果...") share nearly all
+    their wording; without the group they would all share buckets and every lookup would
+    degenerate into a scan of the template's problems.
+
+    Band keys are stored as hashes and a bucket holding one key is the key itself, not a set:
+    most buckets hold a single text, and a large bank would otherwise keep millions of small
+    containers alive for the garbage collector to walk. Texts colliding on a hash only become
+    extra candidates, which are verified anyway.
+    """
+
+    def __init__(self):
+        self._bands = [{} for _ in range(BANDS)]
+        self._band_keys_by_key = {}
+
+    @staticmethod
+    def _band_keys(signature, group):
+        return tuple([hash((group, signature[band * _ROWS:(band + 1) * _ROWS])) for band in range(BANDS)])
+
+    def add(self, key, signature, group=()):
+        self.remove(key)
+        band_keys = self._band_keys_by_key[key] = self._band_keys(signature, group)
+        for buckets, band_key in zip(self._bands, band_keys):
+            bucket = buckets.get(band_key)
+            if bucket is None:
+                buckets[band_key] = key
+            elif isinstance(bucket, set):
+                bucket.add(key)
+            elif bucket != key:
+                buckets[band_key] = {bucket, key}
+
+    def remove(self, key):
+        band_keys = self._band_keys_by_key.pop(key, None)
+        if band_keys is None:
+            return
+        for buckets, band_key in zip(self._bands, band_keys):
+            bucket = buckets.get(band_key)
+            if isinstance(bucket, set):
+                bucket.discard(key)
+                if len(bucket) == 1:
+                    buckets[band_key] = bucket.pop()
+            elif bucket == key:
+                del buckets[band_key]
+
+    def candidates(self, signature, group=(), limit=MAX_CANDIDATES):
+        """Keys sharing a band with the signature; beyond `limit`, those sharing the most bands."""
+        shared = {}
+        for buckets, band_key in zip(self._bands, self._band_keys(signature, group)):
+            bucket = buckets.get(band_key)
+            if bucket is None:
+                continue
+            for key in (bucket if isinstance(bucket, set) else (bucket,)):
+                shared[key] = shared.get(key, 0) + 1
+        if len(shared) <= limit:
+            return list(shared)
+        return heapq.nlargest(limit, shared, key=shared.get)
+
+class _DuplicateData:
+    """Signatures of every problem_text in the bank, keyed by problem_id."""
+
+    def __init__(self):
+        self.lsh = MinHashLSH()
+        self.fingerprints = {}
+
+    def ids(self):
+        return self.fingerprints.keys()
+
+    def put(self, problem):
+        problem_id = problem.get('problem_id')
+        if not problem_id:
+            return
+        text = problem.get('problem_text') or ""
+        if self.fingerprints.get(problem_id) == hash(text):
+            return
+        self.fingerprints[problem_id] = hash(text)
+        _, problem_signature, numbers = _features(text)
+        if problem_signature is None:
+            self.lsh.remove(problem_id)
+        else:
+            self.lsh.add(problem_id, problem_signature, numbers)
+
+    def remove(self, problem_id):
+        self.fingerprints.pop(problem_id, None)
+        self.lsh.remove(problem_id)
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self):
+        pass
+
+class DuplicateIndex(BankIndex):
+    """
+    Finds existing problems whose text is a near-duplicate of a new one, without comparing it
+    against every problem: LSH yields a handful of candidates, which are then checked exactly
+    (Jaccard similarity of shingles). Texts with different numbers (5+3 vs 6+3) are different
+    exercises and never count as duplicates.
+    """
+
+    data_class = _DuplicateData
+    name = "Duplicate index"
+
+    def __init__(self, repository):
+        super().__init__(repository)
+        self._stats.update(checks=0, candidates=0, duplicates=0)
+
+    def find(self, problem_text, threshold=None, limit=DEFAULT_CANDIDATE_LIMIT):
+        """Returns [{"problem_id", "problem_text", "similarity"}, ...], most similar first."""
+        return self._find(*_features(problem_text), threshold, limit)
+
+    def _find(self, new_shingles, new_signature, new_numbers, threshold, limit):
+        threshold = duplicate_threshold() if threshold is None else threshold
+        if new_signature is None:
+            return []
+        self.ensure_current()
+        with self._lock:
+            candidate_ids = self._data.lsh.candidates(new_signature, new_numbers)
+            self._stats["checks"] += 1
+            self._stats["candidates"] += len(candidate_ids)
+        duplicates = []
+        for problem_id in candidate_ids:
+            problem = self._repository.get(problem_id)
+            if problem is None or _numbers(problem.get('problem_text')) != new_numbers:
+                continue
+            similarity = jaccard(new_shingles, shingles(problem.get('problem_text')))
+            if similarity >= threshold:
+                duplicates.append({"problem_id": problem_id, "problem_text": problem.get('problem_text'),
+                                   "similarity": round(similarity, 3)})
+        duplicates.sort(key=lambda duplicate: (-duplicate["similarity"], len(duplicate["problem_id"]), duplicate["problem_id"]))
+        with self._lock:
+            self._stats["duplicates"] += bool(duplicates)
+        return duplicates[:limit]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_duplicate_index(filepath=DEFAULT_FILEPATH):
+    key = os.path.abspath(filepath)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = DuplicateIndex(get_repository(filepath))
+        return index
+
+def find_duplicates(problem_text, threshold=None, limit=DEFAULT_CANDIDATE_LIMIT, filepath=DEFAULT_FILEPATH):
+    """Existing problems that are near-duplicates of `problem_text`, most similar first."""
+    return get_duplicate_index(filepath).find(problem_text, threshold=threshold, limit=limit)
+
+def find_batch_duplicates(texts, threshold=None, filepath=DEFAULT_FILEPATH):
+    """
+    For each text of a batch (e.g. an import), its best match: {"problem_id", "similarity"} for a
+    problem already in the bank, {"row": index, "similarity"} for an earlier text of the batch,
+    or None. Earlier texts are matched through their own LSH, so the batch isn't compared pairwise.
+    """
+    threshold = duplicate_threshold() if threshold is None else threshold
+    index = get_duplicate_index(filepath)
+    batch = MinHashLSH()
+    matches = []
+    for position, text in enumerate(texts):
+        text_shingles, text_signature, text_numbers = _features(text)
+        existing = index._find(text_shingles, text_signature, text_numbers, threshold, 1)
+        match = {"problem_id": existing[0]["problem_id"], "similarity": existing[0]["similarity"]} if existing else None
+        if text_signature is not None:
+            if match is None:
+                best = None
+                for earlier in sorted(batch.candidates(text_signature, text_numbers)):
+                    similarity = jaccard(text_shingles, shingles(texts[earlier]))
+                    if similarity >= threshold and (best is None or similarity > best[1]):
+                        best = (earlier, similarity)
+                if best is not None:
+                    match = {"row": best[0], "similarity": round(best[1], 3)}
+            batch.add(position, text_signature, text_numbers)
+        matches.append(match)
+    return matches
+
+if __name__ == '__main__':
+    import time
+    import random
+    import shutil
+    import tempfile
+    from problem_manager import add_problem, add_problems, update_problem, delete_problem
+
+    print("Running basic tests for duplicate_index...")
+    assert shingles("A b，C!") == {"ab", "bc"} and shingles("x") == {"x"} and shingles("  ") == set()
+    same = "小明有5个苹果，又买了3个苹果，一共有几个苹果？"
+    assert signature(shingles(same)) == signature(shingles(same + " "))
+    assert jaccard(shingles(same), shingles("小明有5个苹果，又买了3个苹果，一共有多少个苹果？")) > 0.7
+
+    test_dir = tempfile.mkdtemp(prefix="duplicate_index_")
+    filepath = os.path.join(test_dir, "problems.csv")
+    p1 = add_problem(same, "加法", "8", filepath=filepath)
+    p2 = add_problem("树上有10只鸟，飞走了4只，还剩几只？", "减法", "6", filepath=filepath)
+
+    def duplicate_ids(text, **kwargs):
+        return [duplicate["problem_id"] for duplicate in find_duplicates(text, filepath=filepath, **kwargs)]
+
+    assert duplicate_ids("小明有5个苹果, 又买了3个苹果. 一共有几个苹果?") == [p1["problem_id"]], "Punctuation only"
+    assert duplicate_ids("小明有5个苹果，又买了3个苹果，一共有几个苹果呢？") == [p1["problem_id"]], "One extra word"
+    assert duplicate_ids("小明有6个苹果，又买了3个苹果，一共有几个苹果？") == [], "Different numbers"
+    assert duplicate_ids("树上有10只鸟") == [], "Too different"
+    assert duplicate_ids("") == []
+
+    # The index follows updates and deletes
+    update_problem(p2["problem_id"], {"problem_text": "河里有10条鱼，游走了4条，还剩几条？"}, filepath=filepath)
+    assert duplicate_ids("树上有10只鸟，飞走了4只，还剩几只？") == []
+    assert duplicate_ids("河里有10条鱼，游走了4条，还剩几条?") == [p2["problem_id"]]
+    delete_problem(p1["problem_id"], filepath=filepath)
+    assert duplicate_ids(same) == []
+
+    # Batches: matches against the bank and against earlier rows
+    matches = find_batch_duplicates([
+        "河里有10条鱼，游走了4条，还剩几条？",
+        "一辆车有12个座位，上来了5人，还有几个空座？",
+        "一辆车有12个座位，上来了5人，还有几个空座位？",
+        "一辆车有12个座位，上来了7人，还有几个空座？",
+    ], filepath=filepath)
+    assert matches[0]["problem_id"] == p2["problem_id"] and matches[1] is None
+    assert matches[2]["row"] == 1 and matches[3] is None, matches
+
+    # Candidates come from LSH buckets, not a scan
+    random.seed(3)
+    chars = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    big_path = os.path.join(test_dir, "big.csv")
+    texts = ["".join(random.choice(chars) for _ in range(30)) for _ in range(20000)]
+    add_problems([{"problem_text": text, "problem_type": "t", "answer": "1"} for text in texts], filepath=big_path)
+    big_index = get_duplicate_index(big_path)
+    big_index.sync()
+    started = time.perf_counter()
+    for text in texts[:200]:
+        found = big_index.find(text[:-1] + "的")
+        assert found and found[0]["problem_text"] == text
+    print(f"Duplicate lookup among 20000 problems: {(time.perf_counter() - started) * 1000 / 200:.3f} ms")
+    stats = big_index.stats()
+    print(f"Index stats: {stats}")
+    assert stats["candidates"] < stats["checks"] * 5
+
+    # Templated textbook problems share nearly all their wording and differ only in numbers:
+    # they must not all land in the same buckets
+    templates = [
+        "小明有{}个苹果，又买了{}个苹果，一共有几个苹果？",
+        "小明有{}个苹果，吃掉了{}个，还剩几个苹果？",
+        "一本书有{}页，小红每天看{}页，几天能看完？",
+        "一个长方形长{}厘米，宽{}厘米，它的面积是多少平方厘米？",
+        "A train travels {} km in {} hours. What is its average speed?",
+    ]
+    random.seed(5)
+    templated = [random.choice(templates).format(random.randint(1, 999), random.randint(1, 999)) for _ in range(10000)]
+    templated_path = os.path.join(test_dir, "templated.csv")
+    add_problems([{"problem_text": text, "problem_type": "t", "answer": "1"} for text in templated], filepath=templated_path)
+    templated_index = get_duplicate_index(templated_path)
+    templated_index.sync()
+    started = time.perf_counter()
+    for text in templated[:500]:
+        found = templated_index.find(text.replace("？", "呢？"))
+        assert found and all(_numbers(f["problem_text"]) == _numbers(text) for f in found), text
+    elapsed_ms = (time.perf_counter() - started) * 1000 / 500
+    stats = templated_index.stats()
+    print(f"Templated lookup among 10000 problems: {elapsed_ms:.3f} ms, "
+          f"{stats['candidates'] / stats['checks']:.1f} candidates per check")
+    assert stats["candidates"] < stats["checks"] * 5, stats
+    assert elapsed_ms < 5, elapsed_ms
+
+    # A templated import batch is checked row by row through LSH, not pairwise
+    rows = [random.choice(templates).format(random.randint(1, 999), random.randint(1, 999)) for _ in range(10000)]
+    started = time.perf_counter()
+    matches = find_batch_duplicates(rows, filepath=templated_path)
+    elapsed = time.perf_counter() - started
+    print(f"Templated batch of 10000 rows: {elapsed:.2f} s, {sum(m is not None for m in matches)} duplicates")
+    assert elapsed < 10, elapsed
+    for position, match in enumerate(matches):
+        if match is not None and "row" in match:
+            assert _numbers(rows[match["row"]]) == _numbers(rows[position]) and match["row"] < position
+
+    shutil.rmtree(test_dir)
+    print("Basic tests for duplicate_index completed.")
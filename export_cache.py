@@ -0,0 +1,308 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Environment variable enabling the on-disk tier (e.g. "exports/cache")
+EXPORT_CACHE_DIR_ENV_VAR = "EXPORT_CACHE_DIR"
+
+class ExportCache:
+    """
+    Cache for fully rendered exports.
+
+    Entries are keyed by (type filter, export_full, data version). Because the data version
+    changes on every add/update/delete, a change to any problem makes every older entry
+    unreachable; in memory those entries are purged as soon as a different version is seen.
+
+    Two tiers:
+      * an in-process LRU bounded by entry count and total bytes, and
+      * an optional directory (e.g. exports/cache) shared by all worker processes and kept
+        under a byte quota, least recently used first. Disk hits are returned as an open file, so
+        they can be sent with send_file even if another worker deletes the file meanwhile. Versions are opaque, and another worker may already serve a
+        version this one hasn't seen yet, so files of other versions are only deleted once they
+        have gone unused for `stale_disk_seconds`.
+
+    Exports are cached while they stream to the first client (see `tee`), so a miss costs no
+    more than an uncached export. Documents larger than `max_entry_bytes` skip the memory tier.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024,
+                 disk_dir=None, max_disk_bytes=512 * 1024 * 1024, stale_disk_seconds=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        # Absolute, so paths handed to send_file don't depend on the app's root path
+        self.disk_dir = os.path.abspath(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.stale_disk_seconds = stale_disk_seconds
+        self._entries = OrderedDict()
+        self._size = 0
+        self._current_version = None
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(filter_type, export_full, data_version, export_format="html"):
+        return (export_format, (filter_type or "").lower(), bool(export_full), str(data_version))
+
+    def _disk_path(self, key):
+        export_format, _, _, data_version = key
+        # The version prefix lets stale files be recognised without any index
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.disk_dir, f"{data_version}-{digest}.{export_format}")
+
+    def _observe_version(self, data_version):
+        """
+        Drops every memory entry rendered from another data version, and disk files of other
+        versions (including temporary files of crashed renders) unused for stale_disk_seconds.
+        Caller holds the lock.
+        """
+        if data_version == self._current_version:
+            return
+        self._current_version = data_version
+        for key in [key for key in self._entries if key[3] != data_version]:
+            self._size -= len(self._entries.pop(key))
+            self._counters["evictions"] += 1
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            now = time.time()
+            for name in os.listdir(self.disk_dir):
+                if name.startswith(f"{data_version}-"):
+                    continue
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    if now - os.stat(path).st_mtime <= self.stale_disk_seconds:
+                        continue # Possibly the current version of a worker that is ahead of this one
+                except OSError:
+                    continue
+                self._remove_file(path)
+                self._counters["evictions"] += 1
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass # Already removed by another worker
+
+    def get(self, key):
+        """
+        Returns the cached export as bytes (memory tier), as a binary file opened for reading
+        (disk tier; the caller closes it), or None on a miss.
+        """
+        with self._lock:
+            self._observe_version(key[3])
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return content
+            if self.disk_dir:
+                path = self._disk_path(key)
+                try:
+                    # Open before anything else: once open, the contents survive a purge by another worker
+                    cached_file = open(path, 'rb')
+                except OSError:
+                    pass # Not cached (or just evicted)
+                else:
+                    try:
+                        os.utime(cached_file.fileno()) # Marks it recently used for the quota and stale purges
+                    except OSError:
+                        pass
+                    self._counters["disk_hits"] += 1
+                    return cached_file
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, content):
+        """Stores rendered bytes in the memory tier, evicting least recently used entries."""
+        if len(content) > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._observe_version(key[3])
+            if key[3] != self._current_version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = content
+            self._size += len(content)
+            self._counters["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._counters["evictions"] += 1
+
+    def _enforce_disk_quota(self):
+        """Deletes the least recently used cached files until the directory fits in max_disk_bytes."""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".tmp"):
+                continue # Still being written
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove_file(path)
+            total -= size
+            with self._lock:
+                self._counters["evictions"] += 1
+
+    def tee(self, key, chunks, encoding='utf-8'):
+        """
+        Passes rendered chunks through (encoded to bytes) while recording them.
+        Only a stream that runs to completion is stored, so an aborted download never
+        leaves a truncated document in the cache.
+        """
+        buffer = []
+        buffered_bytes = 0
+        disk_file = None
+        temp_path = None
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                # Version prefix so the purge by this worker leaves it alone; others see a fresh mtime
+                fd, temp_path = tempfile.mkstemp(prefix=f"{key[3]}-", suffix=".tmp", dir=self.disk_dir)
+                disk_file = os.fdopen(fd, 'wb')
+            except OSError as e:
+                logger.warning(f"Export disk cache unavailable at {self.disk_dir}: {e}")
+                disk_file = None
+
+        completed = False
+        try:
+            for chunk in chunks:
+                data = chunk.encode(encoding) if isinstance(chunk, str) else chunk
+                if buffer is not None:
+                    buffer.append(data)
+                    buffered_bytes += len(data)
+                    if buffered_bytes > self.max_entry_bytes:
+                        buffer = None # Too big for the memory tier
+                if disk_file is not None:
+                    disk_file.write(data)
+                yield data
+            completed = True
+        finally:
+            if disk_file is not None:
+                disk_file.close()
+                if completed:
+                    os.replace(temp_path, self._disk_path(key))
+                    self._enforce_disk_quota()
+                else:
+                    self._remove_file(temp_path)
+            if completed and buffer is not None:
+                self.put(key, b"".join(buffer))
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["memory_hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            hits = lookups - self._counters["misses"]
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                bytes=self._size,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+if __name__ == '__main__':
+    import shutil
+
+    print("Running basic tests for export_cache...")
+    cache_dir = tempfile.mkdtemp(prefix="export_cache_")
+    cache = ExportCache(max_entries=2, max_entry_bytes=1024, disk_dir=cache_dir)
+
+    key_v1 = ExportCache.make_key("Arithmetic", True, "v1")
+    assert cache.get(key_v1) is None
+    streamed = b"".join(cache.tee(key_v1, ["<html>", "body", "</html>"]))
+    assert streamed == b"<html>body</html>"
+    assert cache.get(key_v1) == streamed, "Completed stream should be served from memory"
+    assert cache.get(ExportCache.make_key("arithmetic", True, "v1")) == streamed, "Type filter is case-insensitive"
+
+    # The disk tier survives a fresh process (a new cache object over the same directory)
+    other_worker = ExportCache(disk_dir=cache_dir)
+    with other_worker.get(key_v1) as disk_hit:
+        assert disk_hit.read() == streamed
+
+    # An open disk hit can still be sent after another worker deletes the file
+    disk_hit = other_worker.get(key_v1)
+    os.remove(disk_hit.name)
+    assert disk_hit.read() == streamed
+    disk_hit.close()
+    assert other_worker.get(key_v1) is None
+    b"".join(other_worker.tee(key_v1, ["<html>", "body", "</html>"]))
+
+    def check_disk(cache, key):
+        """Whether the key is a disk hit (closing the file handed out)."""
+        hit = cache.get(key)
+        if hit is not None:
+            hit.close()
+        return hit is not None
+
+    # Aborted streams are not cached
+    key_partial = ExportCache.make_key(None, False, "v1")
+    aborted = cache.tee(key_partial, iter(["a", "b", "c"]))
+    next(aborted)
+    aborted.close()
+    cache.clear()
+    assert cache.get(key_partial) is None
+
+    # A worker that is behind must not delete files another worker just rendered for a newer version
+    key_v2 = ExportCache.make_key("Arithmetic", True, "v2")
+    assert b"".join(other_worker.tee(key_v2, ["v2 body"])) == b"v2 body"
+    lagging_worker = ExportCache(disk_dir=cache_dir)
+    assert check_disk(lagging_worker, key_v1)
+    assert lagging_worker.get(ExportCache.make_key(None, True, "v0")) is None
+    assert any(name.startswith("v2-") for name in os.listdir(cache_dir)), "Recent files of other versions are kept"
+    assert check_disk(cache, key_v2), "The file written by the other worker is served"
+
+    # Files of other versions are deleted once they have gone unused for stale_disk_seconds
+    stale = time.time() - 2 * cache.stale_disk_seconds
+    for name in os.listdir(cache_dir):
+        if name.startswith("v1-"):
+            os.utime(os.path.join(cache_dir, name), (stale, stale))
+    assert cache.get(ExportCache.make_key("Arithmetic", True, "v3")) is None
+    names = os.listdir(cache_dir)
+    assert not any(name.startswith("v1-") for name in names), "Stale disk entries should be purged"
+    assert any(name.startswith("v2-") for name in names)
+    assert check_disk(cache, key_v2)
+
+    # Disk quota evicts the least recently used file, refreshed by hits
+    quota_dir = tempfile.mkdtemp(prefix="export_cache_quota_")
+    quota_cache = ExportCache(max_entry_bytes=0, disk_dir=quota_dir, max_disk_bytes=25)
+    quota_keys = [ExportCache.make_key(f"Q{i}", True, "v2") for i in range(3)]
+    for i, quota_key in enumerate(quota_keys[:2]):
+        b"".join(quota_cache.tee(quota_key, ["x" * 10]))
+        past = time.time() - 100 + i
+        os.utime(quota_cache._disk_path(quota_key), (past, past))
+    assert check_disk(quota_cache, quota_keys[0]) # Now the most recently used
+    b"".join(quota_cache.tee(quota_keys[2], ["x" * 10]))
+    assert check_disk(quota_cache, quota_keys[0]) and not check_disk(quota_cache, quota_keys[1])
+    shutil.rmtree(quota_dir)
+
+    # LRU bounds
+    for i in range(3):
+        cache.put(ExportCache.make_key(f"T{i}", True, "v2"), b"x" * 10)
+    assert cache.stats()["entries"] == 2
+    cache.put(ExportCache.make_key("huge", True, "v2"), b"x" * 2048)
+    assert cache.get(ExportCache.make_key("huge", True, "v2")) is None, "Entries over max_entry_bytes are skipped"
+
+    stats = cache.stats()
+    print(f"Cache stats: {stats}")
+    assert stats["memory_hits"] >= 2 and stats["misses"] >= 3 and stats["evictions"] >= 1
+
+    shutil.rmtree(cache_dir)
+    print("Basic tests for export_cache completed.")
@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import logging
+import secrets
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_JOBS_DIR = "exports/jobs"
+# Environment variables: where background exports are written, and how long / how much of them is kept
+EXPORT_JOBS_DIR_ENV_VAR = "EXPORT_JOBS_DIR"
+EXPORT_JOBS_MAX_AGE_ENV_VAR = "EXPORT_JOBS_MAX_AGE"
+EXPORT_JOBS_MAX_BYTES_ENV_VAR = "EXPORT_JOBS_MAX_BYTES"
+# Report rendering progress to the job every this many problems
+PROGRESS_INTERVAL = 1000
+
+# "<token>.<extension>"; the token is the only thing a download needs, so it must be unguessable
+_FILE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{32}\.[a-z0-9]+$")
+
+class ExportFileStore:
+    """
+    Directory of finished background exports (exports/jobs by default).
+
+    Each export is written to a temporary file and renamed to "<token>.<extension>" once complete,
+    so a half-written document is never served. The token is random, so the file name doubles as the
+    download credential. Files older than `max_age_seconds` are deleted, and beyond `max_bytes` the
+    oldest files go first; both are enforced whenever an export is written and on collect_garbage().
+    """
+
+    def __init__(self, directory=DEFAULT_EXPORT_JOBS_DIR, max_age_seconds=24 * 3600, max_bytes=1024 * 1024 * 1024):
+        # Absolute, so paths handed to send_file don't depend on the app's root path
+        self.directory = os.path.abspath(directory)
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"written": 0, "expired": 0, "evicted": 0}
+
+    def write(self, chunks, extension):
+        """
+        Writes a rendered document (str or bytes chunks) and returns {"file_name", "bytes"}.
+        Rendering happens while the chunks are consumed, so memory stays flat for any size.
+        """
+        self.collect_garbage()
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = f"{secrets.token_urlsafe(24)}.{extension}"
+        fd, temp_path = tempfile.mkstemp(prefix=".export-", suffix=".tmp", dir=self.directory)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    f.write(data)
+                    size += len(data)
+            os.replace(temp_path, os.path.join(self.directory, file_name))
+        except BaseException:
+            self._remove_file(temp_path)
+            raise
+        with self._lock:
+            self._counters["written"] += 1
+        self.collect_garbage(keep=file_name)
+        return {"file_name": file_name, "bytes": size}
+
+    def path(self, file_name):
+        """Absolute path of a finished export, or None if the name is invalid, unknown or expired."""
+        if not _FILE_NAME_RE.match(file_name or ""):
+            return None
+        path = os.path.join(self.directory, file_name)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.max_age_seconds:
+                return None # Expired; the next collection deletes it
+        except OSError:
+            return None
+        return path
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False # Already removed by another worker
+
+    def _scan(self):
+        """(mtime, size, name) of every file in the directory."""
+        files = []
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return files
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+        return files
+
+    def collect_garbage(self, keep=None):
+        """
+        Deletes exports older than max_age_seconds (and temporary files left by crashed renders),
+        then the oldest exports until the rest fit in max_bytes. `keep` is never evicted for space.
+        Returns the number of files deleted.
+        """
+        now = time.time()
+        expired = evicted = 0
+        remaining = []
+        for mtime, size, name in self._scan():
+            if now - mtime > self.max_age_seconds:
+                expired += self._remove_file(os.path.join(self.directory, name))
+            elif not name.endswith(".tmp"):
+                remaining.append((mtime, size, name))
+        total = sum(size for _, size, _ in remaining)
+        for _, size, name in sorted(remaining):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            evicted += self._remove_file(os.path.join(self.directory, name))
+            total -= size
+        with self._lock:
+            self._counters["expired"] += expired
+            self._counters["evicted"] += evicted
+        if expired or evicted:
+            logger.info(f"Removed {expired} expired and {evicted} over-quota exports from {self.directory}")
+        return expired + evicted
+
+    def stats(self):
+        files = [(size, name) for _, size, name in self._scan() if not name.endswith(".tmp")]
+        with self._lock:
+            return dict(self._counters, files=len(files), bytes=sum(size for size, _ in files),
+                        max_bytes=self.max_bytes, max_age_seconds=self.max_age_seconds)
+
+def with_progress(problems, report_progress, interval=PROGRESS_INTERVAL):
+    """Passes problems through, reporting the running count every `interval` problems."""
+    count = 0
+    for problem in problems:
+        yield problem
+        count += 1
+        if count % interval == 0:
+            report_progress("rendering", problems=count)
+
+def get_default_store():
+    """A store configured from EXPORT_JOBS_DIR, EXPORT_JOBS_MAX_AGE (seconds) and EXPORT_JOBS_MAX_BYTES."""
+    return ExportFileStore(
+        directory=os.getenv(EXPORT_JOBS_DIR_ENV_VAR) or DEFAULT_EXPORT_JOBS_DIR,
+        max_age_seconds=float(os.getenv(EXPORT_JOBS_MAX_AGE_ENV_VAR) or 24 * 3600),
+        max_bytes=int(os.getenv(EXPORT_JOBS_MAX_BYTES_ENV_VAR) or 1024 * 1024 * 1024),
+    )
+
+if __name__ == '__main__':
+    import shutil
+
+    print("Running basic tests for export_jobs...")
+    directory = tempfile.mkdtemp(prefix="export_jobs_")
+    try:
+        store = ExportFileStore(directory, max_age_seconds=3600, max_bytes=250)
+
+        # Written atomically under a random name, found again by that name only
+        first = store.write(iter(["<html>", "x" * 94]), "html")
+        assert first["bytes"] == 100 and first["file_name"].endswith(".html")
+        with open(store.path(first["file_name"]), encoding='utf-8') as f:
+            assert f.read() == "<html>" + "x" * 94
+        assert store.path("../" + first["file_name"]) is None
+        assert store.path("short.html") is None
+        assert store.path(first["file_name"].replace(".html", ".pdf")) is None
+        assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+        # A failed render leaves nothing behind
+        def failing():
+            yield b"partial"
+            raise RuntimeError("render failed")
+        try:
+            store.write(failing(), "pdf")
+            assert False, "The render error should propagate"
+        except RuntimeError:
+            pass
+        assert sorted(os.listdir(directory)) == [first["file_name"]]
+
+        # Quota: the oldest exports go first, never the one just written
+        second = store.write([b"y" * 100], "pdf")
+        os.utime(store.path(first["file_name"]), (time.time() - 20, time.time() - 20))
+        os.utime(store.path(second["file_name"]), (time.time() - 10, time.time() - 10))
+        third = store.write([b"z" * 100], "md")
+        assert store.path(first["file_name"]) is None
+        assert store.path(second["file_name"]) and store.path(third["file_name"])
+        oversized = store.write([b"w" * 300], "jsonl")
+        assert store.path(oversized["file_name"]) and store.path(third["file_name"]) is None
+
+        # Age: expired exports (and stale temporary files) are deleted
+        stale_temp = os.path.join(directory, ".export-crashed.tmp")
+        open(stale_temp, 'w').close()
+        old = time.time() - 7200
+        os.utime(stale_temp, (old, old))
+        os.utime(store.path(oversized["file_name"]), (old, old))
+        assert store.path(oversized["file_name"]) is None
+        assert store.collect_garbage() == 2 and os.listdir(directory) == []
+
+        # Progress is reported while the document renders
+        reports = []
+        assert list(with_progress(range(5), lambda stage, **info: reports.append(info["problems"]), interval=2)) == list(range(5))
+        assert reports == [2, 4]
+        print(f"Store stats: {store.stats()}")
+    finally:
+        shutil.rmtree(directory)
+    print("Basic tests for export_jobs completed.")
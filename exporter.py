@@ -1,6 +1,12 @@
 import html
 import os
+import re
+import json
 import logging
+import threading
+from collections import namedtuple
+
+from pdf_exporter import iter_problems_pdf
 
 logger = logging.getLogger(__name__)
 
@@ -10,6 +16,257 @@ def _escape(text):
         return ""
     return html.escape(str(text))
 
+# Flush rendered HTML in chunks of roughly this many characters when streaming
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_HTML_HEADER_LINES = [
+    # Start HTML5 boilerplate
+    "<!DOCTYPE html>",
+    "<html lang=\"en\">",
+    "<head>",
+    "    <meta charset=\"UTF-8\">",
+    "    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">",
+    "    <title>Math Problems Export</title>",
+    "    <style>",
+    "        body { font-family: sans-serif; margin: 20px; line-height: 1.6; }",
+    "        .page-container { max-width: 800px; margin: auto; }", # For better A4 centering
+    "        .problem-container { page-break-inside: avoid; margin-bottom: 25px; padding-bottom: 15px; border-bottom: 1px solid #eee; }",
+    "        .problem-header { margin-bottom: 10px; }",
+    "        .problem-id { font-weight: bold; color: #333; font-size: 1.1em; }",
+    "        .problem-type { font-style: italic; color: #555; margin-left: 10px; font-size: 0.9em; }",
+    "        .problem-text { margin-top: 5px; margin-bottom: 10px; font-size: 1.2em; color: #000; }",
+    "        .answer-section { margin-left: 20px; margin-bottom: 10px; }",
+    "        .answer-label { font-weight: bold; color: #4CAF50; }", # Green for answer
+    "        .answer-text { margin-left: 5px; }",
+    "        .solution-steps-label { font-weight: bold; color: #007BFF; margin-top:10px }", # Blue for solution
+    "        .solution-steps { margin-left: 20px; white-space: pre-wrap; background-color: #f9f9f9; border: 1px solid #ddd; padding: 10px; border-radius: 4px; }",
+    "        h1 { text-align: center; color: #333; border-bottom: 2px solid #333; padding-bottom:10px; }",
+    "        @media print {", # Specific styles for printing
+    "            body { margin: 0.5in; font-size: 10pt; }", # Adjust margins for A4
+    "            .problem-container { border-bottom: 1px solid #ccc; }",
+    "            h1 { font-size: 18pt; }",
+    "            .page-container { max-width: 100%; margin: 0; }", # Use full width for print
+    "            .solution-steps { background-color: #fff; border: 1px solid #eee; }", # Lighter for print
+    "        }",
+    "    </style>",
+    "</head>",
+    "<body>",
+    "<div class=\"page-container\">",
+    "    <h1>Math Problems</h1>",
+]
+
+_HTML_FOOTER_LINES = [
+    "</div>", # End page-container
+    "</body>",
+    "</html>",
+]
+
+def _html_header(title=None):
+    """The document head; `title` replaces the default page title and heading."""
+    header = "\n".join(_HTML_HEADER_LINES)
+    if title:
+        header = header.replace("<title>Math Problems Export</title>", f"<title>{_escape(title)}</title>")
+        header = header.replace("<h1>Math Problems</h1>", f"<h1>{_escape(title)}</h1>")
+    return header
+
+def _render_problem_block(problem, export_full=True):
+    """Renders the HTML block (without trailing newline) for a single problem."""
+    html_content = []
+    html_content.append("    <div class=\"problem-container\">")
+    html_content.append("        <div class=\"problem-header\">")
+    html_content.append(f"            <span class=\"problem-id\">Problem ID: {_escape(problem.get('problem_id', 'N/A'))}</span>")
+    html_content.append(f"            <span class=\"problem-type\">Type: {_escape(problem.get('problem_type', 'N/A'))}</span>")
+    html_content.append("        </div>")
+    html_content.append(f"        <div class=\"problem-text\">{_escape(problem.get('problem_text', 'No problem text provided.'))}</div>")
+
+    if export_full:
+        html_content.append("        <div class=\"answer-section\">")
+        html_content.append(f"            <span class=\"answer-label\">Answer:</span>")
+        html_content.append(f"            <span class=\"answer-text\">{_escape(problem.get('answer', 'N/A'))}</span>")
+        html_content.append("        </div>")
+
+        solution_steps = problem.get('solution_steps_gemini')
+        if solution_steps: # Only show solution section if steps are available
+            html_content.append("        <div>") # Added div for better structure of label + steps
+            html_content.append(f"            <div class=\"solution-steps-label\">Solution Steps:</div>")
+            html_content.append(f"            <div class=\"solution-steps\">{_escape(solution_steps)}</div>")
+            html_content.append("        </div>")
+        else:
+            html_content.append("        <div>")
+            html_content.append(f"            <div class=\"solution-steps-label\">Solution Steps:</div>")
+            html_content.append(f"            <div class=\"solution-steps\">No solution steps provided.</div>") # Placeholder if empty
+            html_content.append("        </div>")
+
+    html_content.append("    </div>") # End problem-container
+    return "\n".join(html_content)
+
+class _FragmentCache:
+    """
+    Bounded cache of rendered problem blocks, one per (problem_id, export_full), valid while the
+    problem's updated_time is unchanged. Every change made through the API bumps updated_time, so
+    an unchanged problem is escaped and formatted once and then reused by every later export.
+
+    Full exports walk the whole bank in the same order, which flushes an LRU smaller than the bank
+    on every pass. So once full the cache stops admitting other problems and keeps the ones it has
+    (a changed problem still replaces its own entry). After max_entries misses it could not admit,
+    entries unused since the previous such sweep (mostly deleted problems) are dropped for new ones.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._fragments = {} # (problem_id, export_full) -> [updated_time, fragment, used since the last sweep]
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, problem, export_full):
+        problem_id = problem.get('problem_id')
+        updated_time = problem.get('updated_time')
+        if not problem_id or not updated_time or self.max_entries <= 0:
+            # Without both parts there is no safe key; render every time.
+            return _render_problem_block(problem, export_full)
+        key = (problem_id, bool(export_full))
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is not None and entry[0] == updated_time:
+                entry[2] = True
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        fragment = _render_problem_block(problem, export_full)
+        with self._lock:
+            if key in self._fragments or len(self._fragments) < self.max_entries:
+                self._fragments[key] = [updated_time, fragment, True]
+            else:
+                self._rejected += 1
+                if self._rejected >= self.max_entries:
+                    self._sweep()
+        return fragment
+
+    def _sweep(self):
+        """Drops the entries not used since the last sweep. Caller holds the lock."""
+        self._fragments = {key: entry for key, entry in self._fragments.items() if entry[2]}
+        for entry in self._fragments.values():
+            entry[2] = False
+        self._rejected = 0
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self._rejected = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._fragments), "hits": self.hits, "misses": self.misses}
+
+# Bounds memory to roughly this many rendered blocks (~1-2 KB each with solutions)
+FRAGMENT_CACHE_MAX_ENTRIES = 10000
+_fragment_cache = _FragmentCache(FRAGMENT_CACHE_MAX_ENTRIES)
+
+def fragment_cache_stats():
+    """Returns hit/miss counters and the size of the per-problem fragment cache."""
+    return _fragment_cache.stats()
+
+def clear_fragment_cache():
+    _fragment_cache.clear()
+
+def iter_problems_html(problems_data, export_full=True, chunk_size=DEFAULT_CHUNK_SIZE, title=None):
+    """
+    Renders the export document incrementally.
+
+    Args:
+        problems_data (iterable): Problem dictionaries; may be a generator, it is consumed once.
+        export_full (bool): Same meaning as in export_problems_to_html.
+        chunk_size (int): Rendered problems are buffered until roughly this many characters
+                          are pending, so consumers get a few large writes instead of many tiny ones.
+        title (str, optional): Page title and heading instead of "Math Problems".
+
+    Yields:
+        str: Consecutive pieces of the document. Joined together they are exactly the string
+             export_problems_to_html returns, but only one chunk is held in memory at a time.
+    """
+    yield _html_header(title)
+
+    def pieces():
+        has_problems = False
+        for problem in problems_data:
+            has_problems = True
+            yield "\n" + _fragment_cache.render(problem, export_full)
+        if not has_problems:
+            yield "\n<p>No problems to display.</p>"
+        yield "\n" + "\n".join(_HTML_FOOTER_LINES)
+
+    yield from _buffered(pieces(), chunk_size)
+
+def _buffered(pieces, chunk_size):
+    """Joins consecutive pieces into chunks of roughly `chunk_size` characters."""
+    pending = []
+    pending_size = 0
+    for piece in pieces:
+        pending.append(piece)
+        pending_size += len(piece)
+        if pending_size >= chunk_size:
+            yield "".join(pending)
+            pending = []
+            pending_size = 0
+    if pending:
+        yield "".join(pending)
+
+# Characters with a meaning in Markdown, escaped in problem text and answers
+_MARKDOWN_SPECIAL_RE = re.compile(r"([\\`*_\[\]<>#|])")
+
+def _escape_markdown(text):
+    return _MARKDOWN_SPECIAL_RE.sub(r"\\\1", str(text))
+
+def _render_problem_markdown(problem, export_full=True):
+    """Markdown section for one problem. Solution steps are kept as they are (Gemini writes Markdown)."""
+    lines = [
+        f"## Problem ID: {_escape_markdown(problem.get('problem_id', 'N/A'))}",
+        "",
+        f"*Type: {_escape_markdown(problem.get('problem_type', 'N/A'))}*",
+        "",
+        _escape_markdown(problem.get('problem_text') or 'No problem text provided.'),
+        "",
+    ]
+    if export_full:
+        lines.extend([f"**Answer:** {_escape_markdown(problem.get('answer', 'N/A'))}", "", "**Solution Steps:**", ""])
+        lines.append(problem.get('solution_steps_gemini') or "No solution steps provided.")
+        lines.append("")
+    lines.extend(["---", ""])
+    return "\n".join(lines)
+
+def iter_problems_markdown(problems_data, export_full=True, chunk_size=DEFAULT_CHUNK_SIZE, title=None):
+    """Renders problems as a Markdown document, chunk by chunk like iter_problems_html."""
+    def pieces():
+        yield f"# {_escape_markdown(title or 'Math Problems')}\n\n"
+        has_problems = False
+        for problem in problems_data:
+            has_problems = True
+            yield _render_problem_markdown(problem, export_full) + "\n"
+        if not has_problems:
+            yield "No problems to display.\n"
+
+    yield from _buffered(pieces(), chunk_size)
+
+# Fields of a JSON Lines record when export_full is off: what a worksheet may show
+_JSONL_QUESTION_FIELDS = ("problem_id", "problem_type", "problem_text", "source")
+
+def iter_problems_jsonl(problems_data, export_full=True, chunk_size=DEFAULT_CHUNK_SIZE, title=None):
+    """
+    Streams one JSON object per problem and line, in the format bulk_import.py reads back.
+    Without export_full, answers and solution steps are left out. `title` is ignored.
+    """
+    def pieces():
+        for problem in problems_data:
+            if not export_full:
+                problem = {field: problem.get(field) for field in _JSONL_QUESTION_FIELDS}
+            yield json.dumps(problem, ensure_ascii=False) + "\n"
+
+    yield from _buffered(pieces(), chunk_size)
+
 def export_problems_to_html(problems_data, output_filename=None, export_full=True):
     """
     Exports a list of problem dictionaries to an HTML file or returns as an HTML string.
@@ -28,80 +285,6 @@ def export_problems_to_html(problems_data, output_filename=None, export_full=Tru
         str or bool: If output_filename is None, returns the HTML content as a string.
                      If output_filename is provided, returns True on successful file export, False on failure.
     """
-    html_content = []
-
-    # Start HTML5 boilerplate
-    html_content.append("<!DOCTYPE html>")
-    html_content.append("<html lang=\"en\">")
-    html_content.append("<head>")
-    html_content.append("    <meta charset=\"UTF-8\">")
-    html_content.append("    <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">")
-    html_content.append("    <title>Math Problems Export</title>")
-    html_content.append("    <style>")
-    html_content.append("        body { font-family: sans-serif; margin: 20px; line-height: 1.6; }")
-    html_content.append("        .page-container { max-width: 800px; margin: auto; }") # For better A4 centering
-    html_content.append("        .problem-container { page-break-inside: avoid; margin-bottom: 25px; padding-bottom: 15px; border-bottom: 1px solid #eee; }")
-    html_content.append("        .problem-header { margin-bottom: 10px; }")
-    html_content.append("        .problem-id { font-weight: bold; color: #333; font-size: 1.1em; }")
-    html_content.append("        .problem-type { font-style: italic; color: #555; margin-left: 10px; font-size: 0.9em; }")
-    html_content.append("        .problem-text { margin-top: 5px; margin-bottom: 10px; font-size: 1.2em; color: #000; }")
-    html_content.append("        .answer-section { margin-left: 20px; margin-bottom: 10px; }")
-    html_content.append("        .answer-label { font-weight: bold; color: #4CAF50; }") # Green for answer
-    html_content.append("        .answer-text { margin-left: 5px; }")
-    html_content.append("        .solution-steps-label { font-weight: bold; color: #007BFF; margin-top:10px }") # Blue for solution
-    html_content.append("        .solution-steps { margin-left: 20px; white-space: pre-wrap; background-color: #f9f9f9; border: 1px solid #ddd; padding: 10px; border-radius: 4px; }")
-    html_content.append("        h1 { text-align: center; color: #333; border-bottom: 2px solid #333; padding-bottom:10px; }")
-    html_content.append("        @media print {") # Specific styles for printing
-    html_content.append("            body { margin: 0.5in; font-size: 10pt; }") # Adjust margins for A4
-    html_content.append("            .problem-container { border-bottom: 1px solid #ccc; }")
-    html_content.append("            h1 { font-size: 18pt; }")
-    html_content.append("            .page-container { max-width: 100%; margin: 0; }") # Use full width for print
-    html_content.append("            .solution-steps { background-color: #fff; border: 1px solid #eee; }") # Lighter for print
-    html_content.append("        }")
-    html_content.append("    </style>")
-    html_content.append("</head>")
-    html_content.append("<body>")
-    html_content.append("<div class=\"page-container\">")
-    html_content.append("    <h1>Math Problems</h1>")
-
-    if not problems_data:
-        html_content.append("<p>No problems to display.</p>")
-
-    for problem in problems_data:
-        html_content.append("    <div class=\"problem-container\">")
-        html_content.append("        <div class=\"problem-header\">")
-        html_content.append(f"            <span class=\"problem-id\">Problem ID: {_escape(problem.get('problem_id', 'N/A'))}</span>")
-        html_content.append(f"            <span class=\"problem-type\">Type: {_escape(problem.get('problem_type', 'N/A'))}</span>")
-        html_content.append("        </div>")
-        html_content.append(f"        <div class=\"problem-text\">{_escape(problem.get('problem_text', 'No problem text provided.'))}</div>")
-
-        if export_full:
-            html_content.append("        <div class=\"answer-section\">")
-            html_content.append(f"            <span class=\"answer-label\">Answer:</span>")
-            html_content.append(f"            <span class=\"answer-text\">{_escape(problem.get('answer', 'N/A'))}</span>")
-            html_content.append("        </div>")
-
-            solution_steps = problem.get('solution_steps_gemini')
-            if solution_steps: # Only show solution section if steps are available
-                html_content.append("        <div>") # Added div for better structure of label + steps
-                html_content.append(f"            <div class=\"solution-steps-label\">Solution Steps:</div>")
-                html_content.append(f"            <div class=\"solution-steps\">{_escape(solution_steps)}</div>")
-                html_content.append("        </div>")
-            else:
-                html_content.append("        <div>")
-                html_content.append(f"            <div class=\"solution-steps-label\">Solution Steps:</div>")
-                html_content.append(f"            <div class=\"solution-steps\">No solution steps provided.</div>") # Placeholder if empty
-                html_content.append("        </div>")
-
-
-        html_content.append("    </div>") # End problem-container
-
-    html_content.append("</div>") # End page-container
-    html_content.append("</body>")
-    html_content.append("</html>")
-
-    final_html_string = "\n".join(html_content)
-
     if output_filename:
         try:
             # Ensure output directory exists if output_filename includes a path
@@ -109,8 +292,10 @@ def export_problems_to_html(problems_data, output_filename=None, export_full=Tru
             if output_dir and not os.path.exists(output_dir):
                 os.makedirs(output_dir, exist_ok=True)
 
+            # Written chunk by chunk, so large exports never exist as one big string
             with open(output_filename, 'w', encoding='utf-8') as f:
-                f.write(final_html_string)
+                for chunk in iter_problems_html(problems_data, export_full=export_full):
+                    f.write(chunk)
             logger.info(f"Successfully exported problems to {output_filename}")
             return True
         except IOError as e:
@@ -121,7 +306,24 @@ def export_problems_to_html(problems_data, output_filename=None, export_full=Tru
             return False
     else:
         # If output_filename is None, return the HTML string
-        return final_html_string
+        return "".join(iter_problems_html(problems_data, export_full=export_full))
+
+# Output formats of the export endpoints. `render(problems, export_full=..., title=...)` yields
+# str or bytes chunks of the document; register_export_format() adds or replaces a format.
+ExportFormat = namedtuple("ExportFormat", ["render", "mimetype", "extension"])
+EXPORT_FORMATS = {}
+
+def register_export_format(name, render, mimetype, extension):
+    EXPORT_FORMATS[name] = ExportFormat(render, mimetype, extension)
+
+def get_export_format(name):
+    """The registered format called `name` (case-insensitive), or None."""
+    return EXPORT_FORMATS.get((name or "").lower())
+
+register_export_format("html", iter_problems_html, "text/html; charset=utf-8", "html")
+register_export_format("markdown", iter_problems_markdown, "text/markdown; charset=utf-8", "md")
+register_export_format("jsonl", iter_problems_jsonl, "application/x-ndjson; charset=utf-8", "jsonl")
+register_export_format("pdf", iter_problems_pdf, "application/pdf", "pdf")
 
 if __name__ == '__main__':
     print("Testing Exporter Module...")
@@ -236,4 +438,72 @@ if __name__ == '__main__':
     assert _escape(123) == "123"
     print("\n_escape function tests passed (unchanged).")
 
+    # Streaming output must match the string output exactly, including for generators
+    print("\n--- Test Case 8: Streaming Export ---")
+    chunks = list(iter_problems_html(iter(sample_problems), export_full=True, chunk_size=1))
+    assert len(chunks) > 2, "Expected the document to be streamed in several chunks"
+    assert "".join(chunks) == html_string_full
+    assert "".join(iter_problems_html([], export_full=True)) == html_string_empty
+    with open(full_export_filename, encoding='utf-8') as f:
+        assert f.read() == html_string_full
+    print("Streaming export test passed.")
+
+    # Fragment cache: unchanged problems are rendered once, changed ones (new updated_time) again
+    print("\n--- Test Case 9: Fragment Cache ---")
+    clear_fragment_cache()
+    timed_problems = [dict(p, updated_time="2024-01-01T00:00:00+00:00") for p in sample_problems]
+    first_render = export_problems_to_html(timed_problems, export_full=True)
+    assert fragment_cache_stats()["misses"] == len(timed_problems)
+    assert export_problems_to_html(timed_problems, export_full=True) == first_render
+    assert fragment_cache_stats()["hits"] == len(timed_problems)
+    timed_problems[0] = dict(timed_problems[0], problem_text="What is 3 + 3?", updated_time="2024-02-01T00:00:00+00:00")
+    changed_render = export_problems_to_html(timed_problems, export_full=True)
+    assert "What is 3 + 3?" in changed_render and "What is 2 + 2?" not in changed_render
+    assert export_problems_to_html(timed_problems, output_filename=full_export_filename, export_full=False)
+    assert fragment_cache_stats()["misses"] == len(timed_problems) + 1 + len(timed_problems) # export_full is part of the key
+    export_problems_to_html(sample_problems, output_filename=full_export_filename, export_full=True) # Restore the sample file
+
+    # A bank larger than the cache: repeated full exports keep hitting the part that fits instead
+    # of evicting it, and once problems are deleted their entries make room for others
+    small_cache = _FragmentCache(100)
+    bank = [{"problem_id": f"P{i:03d}", "problem_text": f"{i} + 1", "updated_time": "t"} for i in range(150)]
+    for _ in range(3):
+        for problem in bank:
+            small_cache.render(problem, True)
+    assert small_cache.stats() == {"entries": 100, "hits": 200, "misses": 250}, small_cache.stats()
+    bank = bank[100:] + [dict(problem, problem_id=f"Q{i:03d}") for i, problem in enumerate(bank[:100])]
+    for _ in range(3):
+        for problem in bank:
+            small_cache.render(problem, True)
+    hits = small_cache.hits
+    for problem in bank:
+        small_cache.render(problem, True)
+    assert small_cache.hits - hits == 100, small_cache.stats()
+    print("Fragment cache test passed.")
+
+    print("\n--- Test Case 10: Custom Title ---")
+    html_titled = "".join(iter_problems_html(sample_problems[:1], export_full=False, title="Worksheet <1>"))
+    assert "<h1>Worksheet &lt;1&gt;</h1>" in html_titled and "<title>Worksheet &lt;1&gt;</title>" in html_titled
+    assert "".join(iter_problems_html([])) == html_string_empty
+    print("Custom title test passed.")
+
+    print("\n--- Test Case 11: Other Formats ---")
+    assert sorted(EXPORT_FORMATS) == ["html", "jsonl", "markdown", "pdf"] and get_export_format("PDF").extension == "pdf"
+    assert get_export_format("docx") is None
+    markdown = "".join(iter_problems_markdown(sample_problems, export_full=True))
+    assert markdown.startswith("# Math Problems\n") and "## Problem ID: P001" in markdown
+    assert "**Answer:** 4" in markdown and "1. Imagine you have 2 apples." in markdown
+    assert "Explain like I'm five." in markdown
+    partial_markdown = "".join(iter_problems_markdown(sample_problems, export_full=False, chunk_size=10))
+    assert "**Answer:**" not in partial_markdown and "This problem only has text" in partial_markdown
+    assert "".join(iter_problems_markdown([])).endswith("No problems to display.\n")
+    assert _escape_markdown("a*b_[c]#") == "a\\*b\\_\\[c\\]\\#"
+    records = [json.loads(line) for line in "".join(iter_problems_jsonl(sample_problems)).splitlines()]
+    assert records == sample_problems
+    records = [json.loads(line) for line in "".join(iter_problems_jsonl(sample_problems, export_full=False)).splitlines()]
+    assert all(set(record) == set(_JSONL_QUESTION_FIELDS) for record in records)
+    pdf = b"".join(get_export_format("pdf").render(sample_problems, export_full=True, title="Test"))
+    assert pdf.startswith(b"%PDF") and pdf.endswith(b"%%EOF\n")
+    print("Other formats test passed.")
+
     print("\nAll exporter tests completed.")
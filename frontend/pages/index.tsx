@@ -11,21 +11,41 @@
         // Add other fields if your ProblemList component expects them for linking or display
     }
 
+    interface ProblemPage {
+        items: Problem[];
+        next_cursor: string | null;
+    }
+
+    // The list only shows these columns, so the (long) solution text is never downloaded here
+    const LIST_FIELDS = 'problem_id,problem_text,problem_type';
+    const PAGE_SIZE = 50;
+
     const HomePage: React.FC = () => {
         const [problems, setProblems] = useState<Problem[]>([]);
+        const [nextCursor, setNextCursor] = useState<string | null>(null);
         const [isLoading, setIsLoading] = useState(true);
         const [error, setError] = useState<string | null>(null);
 
-        const fetchProblems = async () => {
+        // Loads one page; without a cursor the list starts over from the newest problems
+        const fetchProblems = async (cursor: string | null = null) => {
             setIsLoading(true);
             setError(null);
             try {
-                const response = await fetch('/api/problems'); // Assuming API is proxied or on same domain
+                const params = new URLSearchParams({
+                    limit: String(PAGE_SIZE),
+                    fields: LIST_FIELDS,
+                    sort: '-created_time',
+                });
+                if (cursor) {
+                    params.set('cursor', cursor);
+                }
+                const response = await fetch(`/api/problems?${params.toString()}`); // Assuming API is proxied or on same domain
                 if (!response.ok) {
                     throw new Error(`Failed to fetch problems: ${response.statusText}`);
                 }
-                const data = await response.json();
-                setProblems(data);
+                const data: ProblemPage = await response.json();
+                setProblems(previous => (cursor ? [...previous, ...data.items] : data.items));
+                setNextCursor(data.next_cursor);
             } catch (err) {
                 if (err instanceof Error) {
                     setError(err.message);
@@ -33,6 +53,7 @@
                     setError('An unknown error occurred');
                 }
                 setProblems([]); // Clear problems on error
+                setNextCursor(null);
             } finally {
                 setIsLoading(false);
             }
@@ -72,7 +93,7 @@
                         For now, a manual refresh button could be an option or rely on user manually refreshing.
                         A better UX would be automatic refresh.
                     */}
-                    <button onClick={fetchProblems} disabled={isLoading}>
+                    <button onClick={() => fetchProblems()} disabled={isLoading}>
                         {isLoading ? 'Refreshing Problems...' : 'Refresh Problem List'}
                     </button>
                      <button onClick={handleExport} style={{ marginLeft: '10px' }}>
@@ -81,7 +102,13 @@
 
                     {isLoading && <p>Loading problems...</p>}
                     {error && <p style={{ color: 'red' }}>Error fetching problems: {error}</p>}
-                    {!isLoading && !error && <ProblemList problems={problems} />}
+                    {/* Keep already loaded pages visible while the next one loads */}
+                    {!error && (!isLoading || problems.length > 0) && <ProblemList problems={problems} />}
+                    {!error && nextCursor && (
+                        <button onClick={() => fetchProblems(nextCursor)} disabled={isLoading}>
+                            {isLoading ? 'Loading...' : 'Load More Problems'}
+                        </button>
+                    )}
                 </main>
 
                 <footer>
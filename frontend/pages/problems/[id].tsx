@@ -1,5 +1,5 @@
 // frontend/pages/problems/[id].tsx
-    import React, { useEffect, useState } from 'react';
+    import React, { useEffect, useRef, useState } from 'react';
     import { useRouter } from 'next/router';
     import Head from 'next/head';
     import Link from 'next/link';
@@ -17,12 +17,33 @@
         updated_time?: string;
     }
 
+    // Background job returned by POST /generate_solution and GET /api/jobs/<id>
+    interface GenerationJob {
+        job_id: string;
+        status: 'queued' | 'running' | 'retrying' | 'succeeded' | 'failed';
+        attempts: number;
+        progress?: { stage: string };
+        result?: { problem: ProblemData } | null;
+        error?: string | null;
+    }
+
+    const JOB_POLL_INTERVAL_MS = 1000;
+
     const ProblemDetailPage: React.FC = () => { // Added React.FC type for consistency
         const [problem, setProblem] = useState<ProblemData | null>(null);
         const [isLoading, setIsLoading] = useState(true);
         const [error, setError] = useState<string | null>(null);
         const [generatingSolution, setGeneratingSolution] = useState(false);
+        const [generationStage, setGenerationStage] = useState<string | null>(null);
+        const pollTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+        const eventSource = useRef<EventSource | null>(null);
         const router = useRouter();
+
+        // Stop polling / streaming when leaving the page
+        useEffect(() => () => {
+            if (pollTimer.current) clearTimeout(pollTimer.current);
+            if (eventSource.current) eventSource.current.close();
+        }, []);
         const { id } = router.query; // Get problem_id from URL
 
         useEffect(() => {
@@ -55,11 +76,43 @@
             }
         }, [id, router.isReady]); // Added router.isReady to dependencies
 
-        const handleGenerateSolution = async (problemId: string, studentLevel: string) => {
-            if (!problemId) return;
-            setGeneratingSolution(true);
-            setError(null);
+        const finishGeneration = () => {
+            pollTimer.current = null;
+            if (eventSource.current) {
+                eventSource.current.close();
+                eventSource.current = null;
+            }
+            setGeneratingSolution(false);
+            setGenerationStage(null);
+        };
+
+        const pollJob = async (statusUrl: string) => {
             try {
+                const response = await fetch(statusUrl);
+                if (!response.ok) {
+                    throw new Error(`Failed to check generation status: ${response.statusText}`);
+                }
+                const job: GenerationJob = await response.json();
+                if (job.status === 'succeeded' && job.result) {
+                    setProblem(job.result.problem); // Update problem data with the new solution
+                    finishGeneration();
+                } else if (job.status === 'failed') {
+                    throw new Error(job.error || 'Failed to generate solution.');
+                } else {
+                    setGenerationStage(job.status === 'retrying' ? 'retrying' : job.progress?.stage || job.status);
+                    pollTimer.current = setTimeout(() => pollJob(statusUrl), JOB_POLL_INTERVAL_MS);
+                }
+            } catch (err) {
+                setError(err instanceof Error ? err.message : 'An unknown error occurred while generating solution.');
+                finishGeneration();
+            }
+        };
+
+        // Fallback without EventSource: queue a background job and poll it
+        const generateViaJob = async (problemId: string, studentLevel: string) => {
+            setGenerationStage('queued');
+            try {
+                // The server queues the work and answers 202 with a job to poll
                 const response = await fetch(`/api/problems/${problemId}/generate_solution`, {
                     method: 'POST',
                     headers: {
@@ -71,17 +124,66 @@
                     const errorData = await response.json();
                     throw new Error(errorData.error || `Failed to generate solution: ${response.statusText}`);
                 }
-                const updatedProblem = await response.json();
-                setProblem(updatedProblem); // Update problem data with the new solution
+                const job: GenerationJob & { status_url?: string } = await response.json();
+                pollJob(job.status_url || `/api/jobs/${job.job_id}`);
             } catch (err) {
                 if (err instanceof Error) {
                     setError(err.message);
                 } else {
                     setError('An unknown error occurred while generating solution.');
                 }
-            } finally {
-                setGeneratingSolution(false);
+                finishGeneration();
+            }
+        };
+
+        const handleGenerateSolution = (problemId: string, studentLevel: string) => {
+            if (!problemId) return;
+            setGeneratingSolution(true);
+            setError(null);
+            if (typeof window === 'undefined' || !('EventSource' in window)) {
+                generateViaJob(problemId, studentLevel);
+                return;
             }
+
+            // Stream the steps so they appear as Gemini writes them
+            const previousSolution = problem?.solution_steps_gemini;
+            const showSolution = (text?: string) =>
+                setProblem(prev => (prev ? { ...prev, solution_steps_gemini: text } : prev));
+            let streamedText = '';
+            const source = new EventSource(
+                `/api/problems/${problemId}/generate_solution/stream?student_level=${encodeURIComponent(studentLevel)}`
+            );
+            eventSource.current = source;
+            setGenerationStage('streaming');
+
+            source.addEventListener('chunk', (event) => {
+                streamedText += JSON.parse((event as MessageEvent).data).text;
+                showSolution(streamedText);
+            });
+            source.addEventListener('done', (event) => {
+                setProblem(JSON.parse((event as MessageEvent).data)); // Saved problem with the full solution
+                finishGeneration();
+            });
+            source.addEventListener('generation_error', (event) => {
+                const data = JSON.parse((event as MessageEvent).data);
+                showSolution(previousSolution);
+                setError(data.error || 'Failed to generate solution.');
+                finishGeneration();
+            });
+            source.onerror = () => {
+                // Connection failed or was refused (e.g. 404/400): before any text arrived, the job
+                // endpoint reports the actual error; afterwards the partial text can't be resumed.
+                if (eventSource.current !== source) return;
+                source.close();
+                eventSource.current = null;
+                if (!streamedText) {
+                    generateViaJob(problemId, studentLevel);
+                } else {
+                    showSolution(previousSolution);
+                    setError('Connection lost while generating the solution. Please try again.');
+                    finishGeneration();
+                }
+            };
         };
 
         // Display loading state until router.isReady and id is processed
@@ -102,6 +204,9 @@
                         onGenerateSolution={handleGenerateSolution}
                         generatingSolution={generatingSolution}
                     />
+                    {generatingSolution && generationStage && (
+                        <p className="generation-status">Solution generation: {generationStage}...</p>
+                    )}
                 </main>
                  <style jsx>{`
                     main {
@@ -1,9 +1,14 @@
 import os
 import logging
+import threading
 import google.generativeai as genai
 # To handle potential API errors specifically, though a general Exception is also used.
 from google.api_core import exceptions as google_exceptions
 
+from solution_cache import get_default_cache, cache_key
+from rate_limiter import Throttle, ThrottleTimeout
+from local_solver import solve_locally
+
 # Environment variable for the API key
 API_KEY_ENV_VAR = "GEMINI_API_KEY"
 
@@ -13,42 +18,168 @@ logger = logging.getLogger(__name__)
 MOCK_SOLUTION_ENABLED = True # Set to False to disable mock response when API key is missing
 MOCK_SOLUTION_TEXT = "Solution steps would be generated here by Gemini API. (Mock Response)"
 
-def generate_solution_steps(problem_text, problem_type, answer=None, student_level=None):
+# Model used for generation, overridable with GEMINI_MODEL and per student level with e.g.
+# GEMINI_MODEL_LOWER_ELEMENTARY. Mock responses are cached under their own model name.
+# Using 'gemini-1.0-pro' as 'gemini-pro' might be an alias that changes.
+DEFAULT_MODEL_NAME = 'gemini-1.0-pro'
+MODEL_ENV_VAR = "GEMINI_MODEL"
+MOCK_MODEL_NAME = 'mock'
+
+class GeminiModelRegistry:
     """
-    Generates step-by-step solution for a given problem using the Gemini API.
+    Process-wide holder of the configured Gemini client and its GenerativeModel objects.
 
-    Args:
-        problem_text (str): The text of the problem.
-        problem_type (str): The type of the problem (e.g., "arithmetic", "algebra").
-        answer (str, optional): The correct answer to the problem. Defaults to None.
-        student_level (str, optional): The target student level (e.g., "lower_elementary", "upper_elementary").
-                                      Defaults to None for a general prompt.
+    The client is configured once and each model is built once, then reused by every request and
+    thread. The API key is compared on each use, so a rotated key (a new GEMINI_API_KEY value)
+    reconfigures the client and rebuilds the models automatically; `reload()` forces the same
+    and also picks up changed model settings.
+    """
 
-    Returns:
-        str: The generated solution steps as a string,
-             a mock solution if API key is missing and MOCK_SOLUTION_ENABLED is True,
-             or an error message string if an error occurs.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured_key = None
+        self._models = {}
+
+    @staticmethod
+    def model_name_for(student_level=None):
+        """Model for a student level: GEMINI_MODEL_<LEVEL>, else GEMINI_MODEL, else the default."""
+        if student_level:
+            level_model = os.getenv(f"{MODEL_ENV_VAR}_{str(student_level).upper()}")
+            if level_model:
+                return level_model
+        return os.getenv(MODEL_ENV_VAR) or DEFAULT_MODEL_NAME
+
+    def get_model(self, api_key, model_name):
+        """Returns the shared GenerativeModel for `model_name`, configuring the client for `api_key` if needed."""
+        with self._lock:
+            if api_key != self._configured_key:
+                try:
+                    genai.configure(api_key=api_key)
+                except Exception as e:
+                    raise GeminiError(f"Error configuring Gemini API: {e}") from e
+                if self._configured_key is not None:
+                    logger.info("Gemini API key changed; client reconfigured.")
+                self._configured_key = api_key
+                self._models = {}
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+            return model
+
+    def reload(self):
+        """Drops the configured client and models; the next request sets them up again."""
+        with self._lock:
+            self._configured_key = None
+            self._models = {}
+
+model_registry = GeminiModelRegistry()
+
+def reload_client():
+    """Call after rotating GEMINI_API_KEY or changing the model settings."""
+    model_registry.reload()
+
+# Prefixes of the error strings generate_solution_steps returns instead of raising
+ERROR_RESPONSE_PREFIXES = ("Error", "Gemini API Error:", "An unexpected error occurred during Gemini API interaction")
+
+# Set to "0"/"false" to send every problem to Gemini, even plain arithmetic
+LOCAL_SOLVER_ENV_VAR = "LOCAL_SOLVER_ENABLED"
+
+def _solve_locally(problem_text, answer, student_level):
+    """Local fast path for arithmetic and simple equations; None means ask Gemini."""
+    if os.getenv(LOCAL_SOLVER_ENV_VAR, "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    return solve_locally(problem_text, answer, student_level)
+
+def is_error_response(text):
+    """Returns True when `text` is empty or one of the error strings produced by generate_solution_steps."""
+    return not text or text.startswith(ERROR_RESPONSE_PREFIXES)
+
+class GeminiError(Exception):
+    """Raised by request_solution_steps when no usable solution could be produced."""
+
+# Client-side limits for real API calls (cache hits and mock responses are not limited).
+# Set GEMINI_THROTTLE_DIR (e.g. data/throttle) to share them between worker processes.
+RATE_PER_MINUTE_ENV_VAR = "GEMINI_RATE_PER_MINUTE"
+BURST_ENV_VAR = "GEMINI_BURST"
+MAX_IN_FLIGHT_ENV_VAR = "GEMINI_MAX_IN_FLIGHT"
+QUEUE_TIMEOUT_ENV_VAR = "GEMINI_QUEUE_TIMEOUT"
+THROTTLE_DIR_ENV_VAR = "GEMINI_THROTTLE_DIR"
+
+throttle = Throttle(
+    rate_per_minute=float(os.getenv(RATE_PER_MINUTE_ENV_VAR) or 60),
+    burst=int(os.getenv(BURST_ENV_VAR) or 10),
+    max_in_flight=int(os.getenv(MAX_IN_FLIGHT_ENV_VAR) or 4),
+    timeout=float(os.getenv(QUEUE_TIMEOUT_ENV_VAR) or 60),
+    state_dir=os.getenv(THROTTLE_DIR_ENV_VAR) or None,
+)
+
+# Errors worth retrying: rate limiting, overload and timeouts on Google's side
+TRANSIENT_API_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.Aborted,
+)
+
+def is_transient_error(error):
+    """Returns True for API errors (and local throttle timeouts) that may succeed when retried later."""
+    return isinstance(error, TRANSIENT_API_ERRORS + (ThrottleTimeout,))
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) runs the function,
+    callers arriving while it is in flight wait and share its result or exception.
+    Nothing is remembered after the call completes; the response cache covers that.
     """
-    api_key = os.getenv(API_KEY_ENV_VAR)
 
-    if not api_key:
-        if MOCK_SOLUTION_ENABLED:
-            logger.warning(f"Environment variable {API_KEY_ENV_VAR} not set. Returning mock solution.")
-            return MOCK_SOLUTION_TEXT
-        else:
-            error_msg = f"Error: Gemini API key not found. Set the environment variable {API_KEY_ENV_VAR}."
-            logger.error(error_msg)
-            # Depending on desired behavior, could raise ValueError(error_msg)
-            return error_msg
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
 
-    try:
-        genai.configure(api_key=api_key)
-    except Exception as e:
-        error_msg = f"Error configuring Gemini API: {e}"
-        logger.error(error_msg)
-        return error_msg
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = self._Call()
+                self._stats["leaders"] += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
 
-    # Construct the prompt based on student_level
+single_flight = SingleFlight()
+
+def build_prompt(problem_text, problem_type, answer=None, student_level=None):
+    """Builds the tutoring prompt sent to Gemini for a problem and target student level."""
     base_prompt = ""
     if student_level == 'lower_elementary':
         base_prompt = "You are a kind and patient tutor for young children (grades 1-3). Explain how to solve this math problem using very simple words and short sentences. If you can, use a fun story or a real-life example that a small child would understand. Break down the solution into tiny, easy steps."
@@ -66,35 +197,181 @@ def generate_solution_steps(problem_text, problem_type, answer=None, student_lev
         prompt_lines.append(f"Correct Answer: {answer}")
     prompt_lines.append("\nProvide the solution steps clearly:") # Added a newline for clarity before steps
 
-    prompt = "\n\n".join(prompt_lines) # Use double newline for better separation of preamble and problem details
+    return "\n\n".join(prompt_lines) # Use double newline for better separation of preamble and problem details
 
-    try:
-        # Initialize the generative model
-        # Using 'gemini-1.0-pro' as 'gemini-pro' might be an alias that changes.
-        # Check documentation for the latest recommended model names.
-        model = genai.GenerativeModel('gemini-1.0-pro')
-
-        # Generate content
-        response = model.generate_content(prompt)
-
-        if response and response.parts:
-            # Assuming the response structure contains text in `response.text`
-            # or assembled from parts. For simple text, response.text is common.
-            # If the response is streamed or complex, this part might need adjustment.
-            # Based on Gemini API, `response.text` should be available.
-            solution_text = response.text
-            if solution_text:
-                return solution_text.strip()
-            else:
-                # This case might occur if the response was successful but contained no text,
-                # or if the model refused to answer (e.g. safety settings).
-                logger.warning("Gemini API returned an empty response.")
-                return "Error: Gemini API returned an empty response."
+def _call_gemini(api_key, model_name, prompt):
+    """Sends one prompt to Gemini and returns the stripped response text."""
+    model = model_registry.get_model(api_key, model_name)
+
+    # Generate content, waiting for rate limit and concurrency capacity first
+    with throttle.slot():
+        try:
+            response = model.generate_content(prompt)
+        except google_exceptions.TooManyRequests:
+            throttle.drain() # Quota exhausted upstream: make everyone else back off too
+            raise
+
+    if response and response.parts:
+        # Based on Gemini API, `response.text` should be available.
+        solution_text = response.text
+        if solution_text:
+            return solution_text.strip()
+        # This case might occur if the response was successful but contained no text,
+        # or if the model refused to answer (e.g. safety settings).
+        logger.warning("Gemini API returned an empty response.")
+        raise GeminiError("Error: Gemini API returned an empty response.")
+    # Handle cases where the response object itself is not as expected or parts are missing.
+    logger.warning("Gemini API response structure was not as expected or was empty.")
+    raise GeminiError("Error: Gemini API returned an invalid or empty response structure.")
+
+def request_solution_steps(problem_text, problem_type, answer=None, student_level=None, force_regenerate=False):
+    """
+    Raising variant of generate_solution_steps, for callers that retry or report errors themselves.
+
+    Plain arithmetic and one-unknown linear equations whose answer checks out are solved by
+    local_solver without any API call (or cache, or throttle); everything else goes to Gemini.
+
+    Successful responses are kept in the persistent response cache (see solution_cache), keyed by
+    the final prompt and model name, so a duplicate problem or a repeated request at the same
+    student_level doesn't call the API again. `force_regenerate=True` skips the lookup and
+    replaces the cached entry with the fresh response. Concurrent identical requests within this
+    process are coalesced into one call (see SingleFlight).
+
+    Returns:
+        str: The generated solution steps (or the mock text when the API key is missing
+        and MOCK_SOLUTION_ENABLED is True).
+    Raises:
+        google_exceptions.GoogleAPIError: The API call failed (see is_transient_error).
+        ThrottleTimeout: No rate limit capacity within the queue timeout (transient).
+        GeminiError: Missing key, configuration failure or an empty response.
+    """
+    local_solution = _solve_locally(problem_text, answer, student_level)
+    if local_solution is not None:
+        return local_solution
+
+    api_key = os.getenv(API_KEY_ENV_VAR)
+    if not api_key and not MOCK_SOLUTION_ENABLED:
+        raise GeminiError(f"Error: Gemini API key not found. Set the environment variable {API_KEY_ENV_VAR}.")
+
+    prompt = build_prompt(problem_text, problem_type, answer, student_level)
+    model_name = model_registry.model_name_for(student_level) if api_key else MOCK_MODEL_NAME
+
+    # Identical requests in flight at the same time share one cache lookup and API call.
+    # Forced regenerations only coalesce with each other, never with a cache-served call.
+    return single_flight.do(
+        (cache_key(prompt, model_name), bool(force_regenerate)),
+        lambda: _cached_solution(api_key, model_name, prompt, force_regenerate)
+    )
+
+def _cached_solution(api_key, model_name, prompt, force_regenerate):
+    """Response cache lookup, then the API (or mock) call on a miss."""
+    cache = get_default_cache()
+    if cache is not None:
+        if force_regenerate:
+            cache.record_bypass()
+        else:
+            cached = cache.get(prompt, model_name)
+            if cached is not None:
+                return cached
+
+    if api_key:
+        solution_text = _call_gemini(api_key, model_name, prompt)
+    else:
+        logger.warning(f"Environment variable {API_KEY_ENV_VAR} not set. Returning mock solution.")
+        solution_text = MOCK_SOLUTION_TEXT
+
+    if cache is not None:
+        cache.put(prompt, model_name, solution_text)
+    return solution_text
+
+def stream_solution_steps(problem_text, problem_type, answer=None, student_level=None, force_regenerate=False):
+    """
+    Streaming variant of request_solution_steps: yields the solution text in chunks as Gemini
+    produces them (generate_content with stream=True), so the first words can be shown right away.
+
+    Local solutions and cached responses are yielded as a single chunk; the mock response is
+    yielded word by word.
+    The complete text is stored in the response cache once the stream finishes. The throttle slot
+    is held for the whole stream, and closing the generator early releases it.
+    Raises the same errors as request_solution_steps.
+    """
+    local_solution = _solve_locally(problem_text, answer, student_level)
+    if local_solution is not None:
+        yield local_solution
+        return
+
+    api_key = os.getenv(API_KEY_ENV_VAR)
+    if not api_key and not MOCK_SOLUTION_ENABLED:
+        raise GeminiError(f"Error: Gemini API key not found. Set the environment variable {API_KEY_ENV_VAR}.")
+
+    prompt = build_prompt(problem_text, problem_type, answer, student_level)
+    model_name = model_registry.model_name_for(student_level) if api_key else MOCK_MODEL_NAME
+
+    cache = get_default_cache()
+    if cache is not None:
+        if force_regenerate:
+            cache.record_bypass()
         else:
-            # Handle cases where the response object itself is not as expected or parts are missing.
-            logger.warning("Gemini API response structure was not as expected or was empty.")
-            return "Error: Gemini API returned an invalid or empty response structure."
+            cached = cache.get(prompt, model_name)
+            if cached is not None:
+                yield cached
+                return
+
+    parts = []
+    if api_key:
+        model = model_registry.get_model(api_key, model_name)
+        with throttle.slot():
+            try:
+                response = model.generate_content(prompt, stream=True)
+                for chunk in response:
+                    text = chunk.text if chunk.parts else ""
+                    if text:
+                        parts.append(text)
+                        yield text
+            except google_exceptions.TooManyRequests:
+                throttle.drain() # Quota exhausted upstream: make everyone else back off too
+                raise
+    else:
+        logger.warning(f"Environment variable {API_KEY_ENV_VAR} not set. Returning mock solution.")
+        for word in MOCK_SOLUTION_TEXT.split(" "):
+            text = word if not parts else " " + word
+            parts.append(text)
+            yield text
+
+    solution_text = "".join(parts).strip()
+    if not solution_text:
+        logger.warning("Gemini API returned an empty response.")
+        raise GeminiError("Error: Gemini API returned an empty response.")
+    if cache is not None:
+        cache.put(prompt, model_name, solution_text)
 
+def generate_solution_steps(problem_text, problem_type, answer=None, student_level=None, force_regenerate=False):
+    """
+    Generates step-by-step solution for a given problem using the Gemini API.
+
+    Args:
+        problem_text (str): The text of the problem.
+        problem_type (str): The type of the problem (e.g., "arithmetic", "algebra").
+        answer (str, optional): The correct answer to the problem. Defaults to None.
+        student_level (str, optional): The target student level (e.g., "lower_elementary", "upper_elementary").
+                                      Defaults to None for a general prompt.
+        force_regenerate (bool, optional): Bypass the response cache and call the API again.
+
+    Returns:
+        str: The generated solution steps as a string,
+             a mock solution if API key is missing and MOCK_SOLUTION_ENABLED is True,
+             or an error message string if an error occurs.
+    """
+    try:
+        return request_solution_steps(problem_text, problem_type, answer, student_level, force_regenerate)
+    except GeminiError as e:
+        error_msg = str(e)
+        logger.error(error_msg)
+        return error_msg
+    except ThrottleTimeout as e:
+        error_msg = f"Error: {e}"
+        logger.error(error_msg)
+        return error_msg
     except google_exceptions.GoogleAPIError as e:
         error_msg = f"Gemini API Error: {e}"
         logger.error(error_msg)
@@ -105,7 +382,16 @@ def generate_solution_steps(problem_text, problem_type, answer=None, student_lev
         return f"An unexpected error occurred during Gemini API interaction: {e}" # Ensure an error string is returned
 
 if __name__ == '__main__':
+    import shutil
+    import tempfile
+    from solution_cache import CACHE_PATH_ENV_VAR
+
     print("Testing Gemini Integration Module...")
+    # Keep test responses out of the real cache
+    cache_dir = tempfile.mkdtemp(prefix="gemini_cache_")
+    os.environ[CACHE_PATH_ENV_VAR] = os.path.join(cache_dir, "cache.db")
+    # The sample problems are plain arithmetic; keep the local solver out of the way until test case 1f
+    os.environ[LOCAL_SOLVER_ENV_VAR] = "0"
 
     # Test case 1: API Key potentially missing (will use mock if enabled)
     print("\n--- Test Case 1: API Key Not Set (or mock response) ---")
@@ -130,6 +416,98 @@ if __name__ == '__main__':
         assert solution1 == MOCK_SOLUTION_TEXT or API_KEY_ENV_VAR in solution1 # Checks if it's mock or the specific error message
         print("(API key not set, mock response or error message expected)")
 
+    # Test case 1b: the repeat is served from the response cache (mock responses are cached under "mock")
+    if not os.getenv(API_KEY_ENV_VAR):
+        print("\n--- Test Case 1b: Response cache (mock path) ---")
+        cache = get_default_cache()
+        hits_before = cache.stats()["hits"]
+        assert generate_solution_steps(problem1_text, problem1_type, problem1_answer, student_level="lower_elementary") == solution1
+        assert cache.stats()["hits"] == hits_before + 1
+        # A different student level is a different prompt, so a separate entry
+        generate_solution_steps(problem1_text, problem1_type, problem1_answer, student_level="upper_elementary")
+        assert cache.stats()["hits"] == hits_before + 1
+        # Forced regeneration skips the lookup
+        generate_solution_steps(problem1_text, problem1_type, problem1_answer, student_level="lower_elementary", force_regenerate=True)
+        stats = cache.stats()
+        assert stats["hits"] == hits_before + 1 and stats["bypasses"] == 1
+        print(f"Cache stats: {stats}")
+
+    # Test case 1c: the model registry reuses the client and models, and reconfigures on key rotation
+    print("\n--- Test Case 1c: Model registry ---")
+    original_configure, original_model_class = genai.configure, genai.GenerativeModel
+    configured_keys = []
+    genai.configure = lambda api_key: configured_keys.append(api_key)
+    genai.GenerativeModel = lambda model_name: ("model", model_name)
+    try:
+        registry = GeminiModelRegistry()
+        first = registry.get_model("key-1", "gemini-1.0-pro")
+        assert registry.get_model("key-1", "gemini-1.0-pro") is first and configured_keys == ["key-1"]
+        assert registry.get_model("key-2", "gemini-1.0-pro") is not first and configured_keys == ["key-1", "key-2"]
+        registry.reload()
+        registry.get_model("key-2", "gemini-1.0-pro")
+        assert configured_keys == ["key-1", "key-2", "key-2"]
+        original_env = {name: os.environ.pop(name, None) for name in (MODEL_ENV_VAR, f"{MODEL_ENV_VAR}_LOWER_ELEMENTARY")}
+        os.environ[MODEL_ENV_VAR] = "model-a"
+        os.environ[f"{MODEL_ENV_VAR}_LOWER_ELEMENTARY"] = "model-b"
+        assert registry.model_name_for(None) == "model-a"
+        assert registry.model_name_for("upper_elementary") == "model-a"
+        assert registry.model_name_for("lower_elementary") == "model-b"
+        for name, value in original_env.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+        assert registry.model_name_for(None) == os.getenv(MODEL_ENV_VAR, DEFAULT_MODEL_NAME)
+    finally:
+        genai.configure, genai.GenerativeModel = original_configure, original_model_class
+
+    # Test case 1d: streaming yields the same text in pieces, then serves the cached copy in one chunk
+    if not os.getenv(API_KEY_ENV_VAR):
+        print("\n--- Test Case 1d: Streaming (mock path) ---")
+        chunks = list(stream_solution_steps("What is 2 + 2?", "Addition", "4", force_regenerate=True))
+        assert len(chunks) > 1 and "".join(chunks) == MOCK_SOLUTION_TEXT
+        assert list(stream_solution_steps("What is 2 + 2?", "Addition", "4")) == [MOCK_SOLUTION_TEXT]
+
+    # Test case 1e: concurrent identical calls are coalesced into one
+    print("\n--- Test Case 1e: Request coalescing ---")
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    flight = SingleFlight()
+    executions = []
+
+    def slow_call():
+        executions.append(1)
+        time.sleep(0.2)
+        return "shared result"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(lambda _: flight.do("same prompt", slow_call), range(5)))
+    assert results == ["shared result"] * 5 and len(executions) == 1
+    assert flight.stats() == {"leaders": 1, "coalesced": 4, "in_flight": 0}, flight.stats()
+
+    def failing_call():
+        time.sleep(0.1)
+        raise GeminiError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flight.do, "bad prompt", failing_call) for _ in range(3)]
+    assert all(isinstance(f.exception(), GeminiError) for f in futures), "Waiters share the leader's error"
+    assert flight.do("same prompt", lambda: "fresh") == "fresh", "Finished calls are not remembered"
+
+    # Test case 1f: the local solver answers plain arithmetic without the API, cache or mock
+    print("\n--- Test Case 1f: Local solver fast path ---")
+    os.environ[LOCAL_SOLVER_ENV_VAR] = "1"
+    cache = get_default_cache()
+    lookups_before = cache.stats()["hits"] + cache.stats()["misses"]
+    local_steps = generate_solution_steps("What is 4 multiplied by 6?", "Multiplication", "24", student_level="upper_elementary")
+    print(local_steps)
+    assert local_steps.endswith("Answer: 24") and MOCK_SOLUTION_TEXT not in local_steps
+    assert cache.stats()["hits"] + cache.stats()["misses"] == lookups_before, "Local answers skip the cache"
+    assert list(stream_solution_steps("2x + 3 = 11", "Algebra", "4")) == [generate_solution_steps("2x + 3 = 11", "Algebra", "4")]
+    # A wrong answer key or a word problem still goes to Gemini (the mock here)
+    if not os.getenv(API_KEY_ENV_VAR):
+        assert generate_solution_steps("What is 4 multiplied by 6?", "Multiplication", "25") == MOCK_SOLUTION_TEXT
+    os.environ[LOCAL_SOLVER_ENV_VAR] = "0"
+
     MOCK_SOLUTION_ENABLED = original_mock_setting # Restore mock setting
 
     # Test case 2: Example with a (potentially) valid API key
@@ -166,6 +544,7 @@ if __name__ == '__main__':
         print("\n--- Test Case 2 & 3 Skipped: GEMINI_API_KEY environment variable not set. ---")
         print("Set the GEMINI_API_KEY to run live API tests.")
 
+    shutil.rmtree(cache_dir)
     print("\nGemini Integration Module testing finished.")
     # Example of how to set the API key for testing if needed, though it's best done in the environment:
     # os.environ[API_KEY_ENV_VAR] = "YOUR_ACTUAL_API_KEY_HERE"
@@ -0,0 +1,493 @@
+import os
+import json
+import heapq
+import random
+import logging
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from problem_manager import interprocess_lock, fsync_directory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = "data/jobs.json"
+
+# Job states. Only the last two are terminal.
+QUEUED, RUNNING, RETRYING, SUCCEEDED, FAILED = "queued", "running", "retrying", "succeeded", "failed"
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+# Progress reports reach the store (for other processes' polling) at most this often per job
+PROGRESS_SAVE_INTERVAL = 1.0
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _process_instance(pid):
+    """
+    Identifies one run of a process: the boot ID and the process's start time (clock ticks since
+    boot), from /proc. A PID reused by a later process, or after a reboot, gets a different value.
+    None where /proc isn't available.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id", encoding='utf-8') as f:
+            boot_id = f.read().strip()
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat = f.read()
+        # The command name (field 2) may contain spaces and parentheses; the fields after it don't
+        start_time = int(stat.rsplit(b")", 1)[1].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+    return f"{boot_id}:{start_time}"
+
+def _owner():
+    """The owner fields recorded on a job this process runs."""
+    pid = os.getpid()
+    return {"owner_pid": pid, "owner_instance": _process_instance(pid)}
+
+def _owner_alive(job):
+    """
+    True if the process that owns a job still runs. The PID alone could have been reused since
+    (common in containers, where every restart counts from the same low PIDs), so the owner's
+    instance is compared too whenever both sides have one.
+    """
+    pid = job.get("owner_pid")
+    if not _process_alive(pid):
+        return False
+    recorded = job.get("owner_instance")
+    current = _process_instance(pid)
+    return recorded is None or current is None or recorded == current
+
+def _process_alive(pid):
+    """True if a process with this PID exists."""
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # Exists, owned by another user
+    except OSError:
+        return False
+    return True
+
+class JobQueue:
+    """
+    Background job runner with a local worker pool and a JSON file store.
+
+    Handlers are registered per job kind with `register_handler(kind, func)`. A handler is called as
+    `func(params, report_progress)` and returns a JSON-serialisable result. `report_progress(stage, **info)`
+    records how far it got, for status polling.
+
+    A failing handler is retried with exponential backoff (plus jitter) when `is_transient(error)` says
+    the error is worth retrying, up to `max_attempts` in total; any other error fails the job at once.
+
+    Every state change is written atomically and durably to `store_path`; progress reports are
+    written at most every PROGRESS_SAVE_INTERVAL seconds, without fsync. The store is shared by all worker
+    processes: each process merges its own jobs into the file under an inter-process lock, and jobs
+    left unfinished by a process that no longer exists (e.g. after a restart) are picked up again by
+    `start()`. Finished jobs are kept in the store for `retention_seconds` so their result can still
+    be fetched; once a finished job is stored, this process no longer keeps it in memory.
+    """
+
+    def __init__(self, store_path=DEFAULT_STORE_PATH, workers=2, max_attempts=3, base_delay=1.0,
+                 max_delay=60.0, is_transient=None, retention_seconds=7 * 24 * 3600):
+        self.store_path = store_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_transient = is_transient or (lambda error: False)
+        self.retention_seconds = retention_seconds
+        self._handlers = {}
+        self._jobs = {} # This process's unfinished jobs (and finished ones not stored yet)
+        self._finished = {state: 0 for state in TERMINAL_STATES}
+        self._progress_saved = {} # job_id -> monotonic time its progress was last stored
+        self._ready = [] # heap of (run_at monotonic time, sequence, job_id)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._store_lock = threading.Lock()
+
+    def register_handler(self, kind, func):
+        self._handlers[kind] = func
+
+    # --- store -----------------------------------------------------------
+
+    def _read_store(self):
+        try:
+            with open(self.store_path, mode='r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read job store {self.store_path}: {e}")
+            return {}
+
+    def _write_store(self, jobs, durable=True):
+        """Atomically replaces the store. Unless `durable`, a crash may leave the previous version."""
+        directory = os.path.dirname(self.store_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".jobs-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as f:
+                json.dump(jobs, f, ensure_ascii=False)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.store_path)
+            if durable:
+                fsync_directory(directory)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _expired(self, job, now):
+        if job.get("status") not in TERMINAL_STATES:
+            return False
+        try:
+            finished = datetime.fromisoformat(job.get("finished_time") or job["updated_time"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return (now - finished).total_seconds() > self.retention_seconds
+
+    def _save(self, job_ids, durable=True):
+        """Merges this process's copies of `job_ids` into the shared store file. Returns True if written."""
+        now = datetime.now(timezone.utc)
+        with self._condition:
+            snapshot = {job_id: dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs}
+            # Finished jobs that could not be stored are only kept for as long as the store would
+            for job_id in [job_id for job_id, job in self._jobs.items() if self._expired(job, now)]:
+                del self._jobs[job_id]
+        with self._store_lock, interprocess_lock(self.store_path + ".lock"):
+            stored = self._read_store()
+            stored.update(snapshot)
+            stored = {job_id: job for job_id, job in stored.items() if not self._expired(job, now)}
+            try:
+                self._write_store(stored, durable)
+            except OSError as e:
+                logger.error(f"Could not persist jobs to {self.store_path}: {e}")
+                return False
+        return True
+
+    def _recover(self):
+        """Takes over unfinished jobs whose owning process is gone."""
+        recovered = []
+        with self._store_lock, interprocess_lock(self.store_path + ".lock"):
+            stored = self._read_store()
+            for job_id, job in stored.items():
+                if job.get("status") in TERMINAL_STATES or _owner_alive(job):
+                    continue
+                job.update(_owner())
+                if job.get("status") == RUNNING:
+                    job["status"] = QUEUED # Interrupted mid-attempt; that attempt doesn't count
+                    job["attempts"] = max(0, job.get("attempts", 1) - 1)
+                job["updated_time"] = _now_iso()
+                recovered.append(job)
+            if recovered:
+                try:
+                    self._write_store(stored)
+                except OSError as e:
+                    logger.error(f"Could not persist recovered jobs to {self.store_path}: {e}")
+        with self._condition:
+            for job in recovered:
+                self._jobs[job["job_id"]] = job
+                self._schedule(job["job_id"], 0)
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} unfinished job(s) from {self.store_path}")
+        return len(recovered)
+
+    # --- scheduling ------------------------------------------------------
+
+    def _schedule(self, job_id, delay):
+        """Queues a job to run after `delay` seconds. Caller holds the condition."""
+        self._sequence += 1
+        heapq.heappush(self._ready, (time.monotonic() + delay, self._sequence, job_id))
+        self._condition.notify()
+
+    def start(self):
+        """Recovers orphaned jobs from the store and starts the worker threads (idempotent)."""
+        with self._condition:
+            if self._threads:
+                return
+            self._stopping = False
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+                self._threads.append(thread)
+        self._recover()
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, kind, params):
+        """Queues a job and returns its public view (including `job_id`)."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        current_time_iso = _now_iso()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "status": QUEUED,
+            "attempts": 0,
+            "progress": {"stage": "queued"},
+            "result": None,
+            "error": None,
+            "created_time": current_time_iso,
+            "updated_time": current_time_iso,
+            "finished_time": None,
+            "next_attempt_time": None,
+            **_owner(),
+        }
+        with self._condition:
+            self._jobs[job["job_id"]] = job
+        self._save([job["job_id"]])
+        with self._condition:
+            self._schedule(job["job_id"], 0)
+        self.start()
+        return self.get(job["job_id"])
+
+    def get(self, job_id):
+        """
+        Returns a copy of a job's public fields, or None. Finished jobs and other processes' jobs
+        are read from the store; jobs past `retention_seconds` are gone.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job else None
+        if job is None:
+            job = self._read_store().get(job_id)
+        if job is None or self._expired(job, datetime.now(timezone.utc)):
+            return None
+        job.pop("owner_pid", None)
+        job.pop("owner_instance", None)
+        return job
+
+    def _update(self, job_id, **changes):
+        with self._condition:
+            job = self._jobs[job_id]
+            job.update(changes)
+            job["updated_time"] = _now_iso()
+        if self._save([job_id]) and job["status"] in TERMINAL_STATES:
+            # Stored for get(); the result needn't stay in this process's memory too
+            with self._condition:
+                self._jobs.pop(job_id, None)
+                self._progress_saved.pop(job_id, None)
+                self._finished[job["status"]] += 1
+
+    def _report_progress(self, job_id, progress):
+        """
+        Records a handler's progress. This process sees it at once; the store only gets it every
+        PROGRESS_SAVE_INTERVAL seconds and not durably, since the next state change stores it anyway.
+        """
+        now = time.monotonic()
+        with self._condition:
+            job = self._jobs[job_id]
+            job["progress"] = progress
+            job["updated_time"] = _now_iso()
+            last_saved = self._progress_saved.get(job_id)
+            if last_saved is not None and now - last_saved < PROGRESS_SAVE_INTERVAL:
+                return
+            self._progress_saved[job_id] = now
+        self._save([job_id], durable=False)
+
+    def _next_job(self):
+        """Blocks until a job is due; returns its ID, or None when stopping."""
+        with self._condition:
+            while not self._stopping:
+                if self._ready:
+                    run_at, _, job_id = self._ready[0]
+                    wait = run_at - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self._ready)
+                        return job_id
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            return None
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _work(self):
+        while True:
+            job_id = self._next_job()
+            if job_id is None:
+                return
+            self._run(job_id)
+
+    def _run(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in TERMINAL_STATES:
+                return
+            kind, params, attempt = job["kind"], job["params"], job["attempts"] + 1
+        self._update(job_id, status=RUNNING, attempts=attempt, next_attempt_time=None)
+
+        def report_progress(stage, **info):
+            self._report_progress(job_id, dict(info, stage=stage))
+
+        try:
+            result = self._handlers[kind](params, report_progress)
+        except Exception as e:
+            if self.is_transient(e) and attempt < self.max_attempts:
+                delay = self._backoff(attempt)
+                logger.warning(f"Job {job_id} attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                next_attempt = datetime.fromtimestamp(time.time() + delay, timezone.utc).isoformat()
+                self._update(job_id, status=RETRYING, error=str(e), next_attempt_time=next_attempt)
+                with self._condition:
+                    self._schedule(job_id, delay)
+            else:
+                logger.error(f"Job {job_id} ({kind}) failed after {attempt} attempt(s): {e}")
+                self._update(job_id, status=FAILED, error=str(e), finished_time=_now_iso())
+            return
+        self._update(job_id, status=SUCCEEDED, result=result, error=None,
+                     progress={"stage": "done"}, finished_time=_now_iso())
+
+    def stats(self):
+        with self._condition:
+            counts = {state: count for state, count in self._finished.items() if count}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"jobs": counts, "scheduled": len(self._ready), "workers": len(self._threads)}
+
+if __name__ == '__main__':
+    import shutil
+
+    print("Running basic tests for job_queue...")
+    store_dir = tempfile.mkdtemp(prefix="job_queue_")
+    store_path = os.path.join(store_dir, "jobs.json")
+
+    class Flaky(Exception):
+        pass
+
+    calls = {"flaky": 0}
+
+    def flaky_handler(params, report_progress):
+        report_progress("working", attempt=calls["flaky"] + 1)
+        calls["flaky"] += 1
+        if calls["flaky"] < params["fail_times"] + 1:
+            raise Flaky("temporarily unavailable")
+        return {"value": params["value"] * 2}
+
+    def broken_handler(params, report_progress):
+        raise ValueError("bad input")
+
+    def wait_for(queue, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = queue.get(job_id)
+            if job["status"] in TERMINAL_STATES:
+                return job
+            time.sleep(0.01)
+        raise AssertionError(f"Job {job_id} did not finish: {queue.get(job_id)}")
+
+    def wait_until_stored(queue, timeout=10):
+        """Finished jobs are stored (and dropped from memory) just after their status changes."""
+        deadline = time.time() + timeout
+        while queue._jobs and time.time() < deadline:
+            time.sleep(0.01)
+
+    queue = JobQueue(store_path=store_path, workers=2, base_delay=0.01, is_transient=lambda e: isinstance(e, Flaky))
+    queue.register_handler("flaky", flaky_handler)
+    queue.register_handler("broken", broken_handler)
+
+    # Transient errors are retried with backoff until the job succeeds
+    job = wait_for(queue, queue.submit("flaky", {"value": 21, "fail_times": 2})["job_id"])
+    assert job["status"] == SUCCEEDED and job["result"] == {"value": 42} and job["attempts"] == 3, job
+
+    # Transient errors that outlast max_attempts fail the job
+    calls["flaky"] = 0
+    job = wait_for(queue, queue.submit("flaky", {"value": 1, "fail_times": 5})["job_id"])
+    assert job["status"] == FAILED and job["attempts"] == 3, job
+
+    # Other errors are not retried
+    job = wait_for(queue, queue.submit("broken", {})["job_id"])
+    assert job["status"] == FAILED and job["attempts"] == 1 and "bad input" in job["error"], job
+
+    # Finished jobs are served from the store, not kept in memory, and disappear once expired
+    wait_until_stored(queue)
+    assert not queue._jobs and queue.stats()["jobs"] == {SUCCEEDED: 1, FAILED: 2}, queue.stats()
+    assert queue.get(job["job_id"])["error"] == job["error"]
+    queue.retention_seconds = 0
+    assert queue.get(job["job_id"]) is None
+    queue.retention_seconds = 7 * 24 * 3600
+
+    # Frequent progress reports are visible at once here but only reach the store now and then, without fsync
+    writes = []
+    write_store = queue._write_store
+    queue._write_store = lambda jobs, durable=True: writes.append(durable) or write_store(jobs, durable)
+
+    def chatty_handler(params, report_progress):
+        for done in range(1, 1001):
+            report_progress("counting", done=done)
+        assert queue.get(current["job_id"])["progress"] == {"stage": "counting", "done": 1000}
+        return done
+
+    queue.register_handler("chatty", chatty_handler)
+    current = queue.submit("chatty", {})
+    assert wait_for(queue, current["job_id"])["result"] == 1000
+    wait_until_stored(queue)
+    assert len(writes) < 10 and writes.count(False) >= 1 and writes[-1] is True, writes
+    queue._write_store = write_store
+
+    try:
+        queue.submit("unknown", {})
+        assert False, "Unknown job kinds should be rejected"
+    except ValueError:
+        pass
+    queue.stop()
+
+    # Jobs persist: a new queue (e.g. after a restart) can report finished jobs...
+    restarted = JobQueue(store_path=store_path)
+    assert restarted.get(job["job_id"])["status"] == FAILED
+
+    # ...and picks up jobs left unfinished by a process that is gone
+    stored = restarted._read_store()
+    orphan_id = "orphan"
+    stored[orphan_id] = dict(stored[job["job_id"]], job_id=orphan_id, kind="flaky", params={"value": 5, "fail_times": 0},
+                             status=RUNNING, attempts=1, finished_time=None, owner_pid=2 ** 22 + 12345)
+    restarted._write_store(stored)
+    restarted.register_handler("flaky", flaky_handler)
+    calls["flaky"] = 0
+    restarted.start()
+    recovered = wait_for(restarted, orphan_id)
+    assert recovered["status"] == SUCCEEDED and recovered["result"] == {"value": 10} and recovered["attempts"] == 1, recovered
+    restarted.stop()
+
+    # Owners are told apart by PID and instance: a live PID only keeps its jobs if it is the same process
+    parent = os.getppid()
+    assert _owner_alive(_owner()) and _owner_alive({"owner_pid": parent})
+    assert _owner_alive({"owner_pid": parent, "owner_instance": _process_instance(parent)})
+    assert not _owner_alive({"owner_pid": 2 ** 22 + 12345, "owner_instance": None})
+    if _process_instance(parent) is not None:
+        assert not _owner_alive({"owner_pid": parent, "owner_instance": "an earlier boot:1"}), "A reused PID"
+        stored = restarted._read_store()
+        stored["reused"] = dict(stored[orphan_id], job_id="reused", status=QUEUED, attempts=0, finished_time=None,
+                                owner_pid=parent, owner_instance="an earlier boot:1")
+        stored["alive"] = dict(stored["reused"], job_id="alive", owner_instance=_process_instance(parent))
+        restarted._write_store(stored)
+        restarted.start()
+        assert wait_for(restarted, "reused")["status"] == SUCCEEDED
+        assert restarted.get("alive")["status"] == QUEUED, "Jobs of a running process are left alone"
+        restarted.stop()
+
+    print(f"Job stats: {restarted.stats()}")
+    shutil.rmtree(store_dir)
+    print("Basic tests for job_queue completed.")
@@ -0,0 +1,482 @@
+import re
+import logging
+import threading
+import unicodedata
+from fractions import Fraction
+
+logger = logging.getLogger(__name__)
+
+# Phrasing per language; student levels override only what they say differently.
+# Placeholders: {n} step number, {a} {b} operands, {c} result, {op} operator symbol,
+# {lhs} {rhs} equation sides, {u} the unknown, {k} a number moved/divided, {v} the solution.
+_TEMPLATES = {
+    "en": {
+        "default": {
+            "intro": "Let's work it out step by step.",
+            "order": "Remember the order of operations: brackets first, then × and ÷, then + and − from left to right.",
+            "step": "Step {n}: {a} {op} {b} = {c}",
+            "answer": "Answer: {c}",
+            "eq_intro": "We need to find the value of {u} in {lhs} = {rhs}.",
+            "eq_simplify": "Step {n}: Simplify both sides: {lhs} = {rhs}",
+            "eq_move_unknown": "Step {n}: Subtract {k}{u} from both sides: {lhs} = {rhs}",
+            "eq_add_unknown": "Step {n}: Add {k}{u} to both sides: {lhs} = {rhs}",
+            "eq_swap": "Step {n}: Swap the two sides: {lhs} = {rhs}",
+            "eq_subtract": "Step {n}: Subtract {k} from both sides: {lhs} = {rhs}",
+            "eq_add": "Step {n}: Add {k} to both sides: {lhs} = {rhs}",
+            "eq_divide": "Step {n}: Divide both sides by {k}: {lhs} = {rhs}",
+            "eq_check": "Check: putting {u} = {v} back in gives {lhs} = {rhs}. ✓",
+            "eq_answer": "Answer: {u} = {v}",
+        },
+        "lower_elementary": {
+            "intro": "Let's solve it together, one small step at a time!",
+            "order": "First we do what is inside the brackets, then × and ÷, and last + and −.",
+            "+": "Step {n}: Put {a} and {b} together. {a} + {b} = {c}",
+            "-": "Step {n}: Start with {a} and take away {b}. {a} − {b} = {c}",
+            "*": "Step {n}: {a} groups of {b} make {c}. {a} × {b} = {c}",
+            "/": "Step {n}: Share {a} into {b} equal groups. Each group gets {c}. {a} ÷ {b} = {c}",
+            "answer": "So the answer is {c}. Great job!",
+            "eq_intro": "We are looking for the missing number {u} in {lhs} = {rhs}.",
+            "eq_subtract": "Step {n}: Take {k} away from both sides to keep them equal: {lhs} = {rhs}",
+            "eq_add": "Step {n}: Add {k} to both sides to keep them equal: {lhs} = {rhs}",
+            "eq_divide": "Step {n}: Split both sides into {k} equal parts: {lhs} = {rhs}",
+            "eq_check": "Let's check: with {u} = {v}, {lhs} = {rhs}. It works!",
+            "eq_answer": "So the missing number is {v}. Great job!",
+        },
+        "upper_elementary": {
+            "step": "Step {n}: Calculate {a} {op} {b} = {c}",
+            "eq_intro": "Solve the equation {lhs} = {rhs} for {u} by doing the same thing to both sides.",
+            "eq_check": "Check: substitute {u} = {v}: the left side is {lhs} and the right side is {rhs}, so they match. ✓",
+        },
+    },
+    "zh": {
+        "default": {
+            "intro": "我们一步一步来计算。",
+            "order": "运算顺序：先算括号里的，再算乘除，最后算加减，同级运算从左往右。",
+            "step": "第{n}步：{a} {op} {b} = {c}",
+            "answer": "答案：{c}",
+            "eq_intro": "求方程 {lhs} = {rhs} 中 {u} 的值。",
+            "eq_simplify": "第{n}步：化简两边：{lhs} = {rhs}",
+            "eq_move_unknown": "第{n}步：两边同时减去 {k}{u}：{lhs} = {rhs}",
+            "eq_add_unknown": "第{n}步：两边同时加上 {k}{u}：{lhs} = {rhs}",
+            "eq_swap": "第{n}步：交换等号两边：{lhs} = {rhs}",
+            "eq_subtract": "第{n}步：两边同时减去 {k}：{lhs} = {rhs}",
+            "eq_add": "第{n}步：两边同时加上 {k}：{lhs} = {rhs}",
+            "eq_divide": "第{n}步：两边同时除以 {k}：{lhs} = {rhs}",
+            "eq_check": "检验：把 {u} = {v} 代入，左边 = {lhs}，右边 = {rhs}，两边相等。✓",
+            "eq_answer": "答案：{u} = {v}",
+        },
+        "lower_elementary": {
+            "intro": "小朋友，我们一起一步一步来算吧！",
+            "order": "先算括号里面的，再算乘法和除法，最后算加法和减法。",
+            "+": "第{n}步：把 {a} 和 {b} 合起来，{a} + {b} = {c}",
+            "-": "第{n}步：从 {a} 里面拿走 {b}，{a} − {b} = {c}",
+            "*": "第{n}步：{a} 个 {b} 是 {c}，{a} × {b} = {c}",
+            "/": "第{n}步：把 {a} 平均分成 {b} 份，每份是 {c}，{a} ÷ {b} = {c}",
+            "answer": "所以答案是 {c}。你真棒！",
+            "eq_intro": "我们要找出 {lhs} = {rhs} 里缺少的数 {u}。",
+            "eq_check": "检查一下：{u} = {v} 时，{lhs} = {rhs}，两边一样多！",
+            "eq_answer": "所以缺少的数是 {v}。你真棒！",
+        },
+        "upper_elementary": {
+            "step": "第{n}步：计算 {a} {op} {b} = {c}",
+            "eq_intro": "解方程 {lhs} = {rhs}：根据等式的性质，两边同时进行相同的运算。",
+        },
+    },
+}
+
+_DISPLAY_OPERATORS = {"+": "+", "-": "−", "*": "×", "/": "÷"}
+
+# Phrases around the expression itself ("What is ...?", "计算：...", "..., x = ?")
+_PREFIX_PATTERN = re.compile(
+    r"^(?:what\s+is|what's|how\s+much\s+is|calculate|compute|evaluate|work\s+out|"
+    r"solve(?:\s+for\s+[x□])?|find(?:\s+the\s+value\s+of)?\s+[x□]|find|"
+    r"计算|算一算|口算|求|解方程|解)\s*[:：]?\s*"
+)
+_SUFFIX_PATTERN = re.compile(
+    r"(?:[,，;；]?\s*[x□]\s*=\s*[?？]|\s*=\s*[?？]|是多少|等于多少|得多少|多少|equals\s+what)?\s*[?？。.!！]*\s*$"
+)
+# Word operators, longest first so "multiplied by" wins over "by"
+_WORD_OPERATORS = [
+    ("multiplied by", "*"), ("divided by", "/"), ("is equal to", "="), ("equals", "="),
+    ("times", "*"), ("plus", "+"), ("minus", "-"),
+    ("乘以", "*"), ("乘上", "*"), ("除以", "/"), ("加上", "+"), ("减去", "-"), ("等于", "="),
+    ("乘", "*"), ("加", "+"), ("减", "-"),
+]
+_SYMBOL_OPERATORS = {"×": "*", "✕": "*", "·": "*", "÷": "/", "−": "-", "–": "-", "—": "-"}
+_TOKEN_PATTERN = re.compile(r"\s*(?:(\d+(?:\.\d+)?)|(.))")
+_NUMBER_PATTERN = re.compile(r"[-+]?\d+(?:\.\d+)?(?:\s*/\s*\d+)?")
+
+class _Unsupported(Exception):
+    """The text is outside what the local solver handles; the caller falls back to Gemini."""
+
+# --- parsing ---------------------------------------------------------------
+
+def _normalize(problem_text):
+    """Reduces the problem text to an expression over 0-9 . + - * / ( ) = x, or raises _Unsupported."""
+    text = unicodedata.normalize("NFKC", problem_text).strip().lower()
+    for symbol, operator in _SYMBOL_OPERATORS.items():
+        text = text.replace(symbol, operator)
+    text = re.sub(r"\(\s*\)|_{2,}|□", "□", text) # Blanks to fill in are the unknown
+    text = _PREFIX_PATTERN.sub("", text, count=1)
+    text = _SUFFIX_PATTERN.sub("", text, count=1)
+    for word, operator in _WORD_OPERATORS:
+        text = text.replace(word, f" {operator} ")
+    text = text.replace("□", "x").replace("?", "x").replace("？", "x")
+    if "=" not in text:
+        text = re.sub(r"(?<=\d)\s*x\s*(?=\d)", "*", text) # "5 x 3" means times when there is no equation
+    if not text or not re.fullmatch(r"[0-9.+\-*/()=x\s]+", text):
+        raise _Unsupported(problem_text)
+    return text
+
+def _tokenize(expression):
+    tokens = []
+    for number, symbol in _TOKEN_PATTERN.findall(expression):
+        if number:
+            token = ("num", Fraction(number))
+        elif symbol.strip():
+            token = ("sym", symbol)
+        else:
+            continue
+        # Implicit multiplication: 2x, 2(3 + 4), (1 + 2)(3 + 4), x(2 + 1), (2 + 1)3.
+        # Two bare numbers in a row ("12 3") stay an error rather than becoming 36.
+        if tokens and (tokens[-1][0] == "num" or tokens[-1][1] in ("x", ")")) \
+                and (token[1] in ("x", "(") or (token[0] == "num" and tokens[-1][0] != "num")):
+            tokens.append(("sym", "*"))
+        tokens.append(token)
+    return tokens
+
+class _Parser:
+    """Recursive descent over the tokens; builds ('num', v) / ('x',) / ('neg', e) / ('op', sym, l, r) nodes."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take_symbol(self, *symbols):
+        kind, value = self._peek()
+        if kind == "sym" and value in symbols:
+            self.position += 1
+            return value
+        return None
+
+    def parse(self):
+        node = self._expression()
+        if self.position != len(self.tokens):
+            raise _Unsupported("trailing tokens")
+        return node
+
+    def _expression(self):
+        node = self._term()
+        while True:
+            symbol = self._take_symbol("+", "-")
+            if symbol is None:
+                return node
+            node = ("op", symbol, node, self._term())
+
+    def _term(self):
+        node = self._factor()
+        while True:
+            symbol = self._take_symbol("*", "/")
+            if symbol is None:
+                return node
+            node = ("op", symbol, node, self._factor())
+
+    def _factor(self):
+        if self._take_symbol("-"):
+            return ("neg", self._factor())
+        if self._take_symbol("+"):
+            return self._factor()
+        if self._take_symbol("("):
+            node = self._expression()
+            if not self._take_symbol(")"):
+                raise _Unsupported("unbalanced brackets")
+            return node
+        kind, value = self._peek()
+        if kind == "num":
+            self.position += 1
+            return ("num", value)
+        if kind == "sym" and value == "x":
+            self.position += 1
+            return ("x",)
+        raise _Unsupported("unexpected token")
+
+def _parse(expression):
+    if not expression.strip():
+        raise _Unsupported("empty side")
+    return _Parser(_tokenize(expression)).parse()
+
+# --- evaluation --------------------------------------------------------------
+
+def _linear(node, steps=None):
+    """
+    Evaluates a node to (a, b) meaning a*x + b. Operations on two plain numbers are appended to
+    `steps` as (symbol, left, right, result) in the order they are carried out.
+    """
+    kind = node[0]
+    if kind == "num":
+        return Fraction(0), node[1]
+    if kind == "x":
+        return Fraction(1), Fraction(0)
+    if kind == "neg":
+        a, b = _linear(node[1], steps)
+        return -a, -b
+    _, symbol, left, right = node
+    la, lb = _linear(left, steps)
+    ra, rb = _linear(right, steps)
+    if symbol == "+":
+        result = (la + ra, lb + rb)
+    elif symbol == "-":
+        result = (la - ra, lb - rb)
+    elif symbol == "*":
+        if la and ra:
+            raise _Unsupported("not linear")
+        result = (la * rb + ra * lb, lb * rb)
+    else:
+        if ra or rb == 0:
+            raise _Unsupported("division by the unknown or by zero")
+        result = (la / rb, lb / rb)
+    if steps is not None and not (la or ra):
+        steps.append((symbol, lb, rb, result[1]))
+    return result
+
+def format_number(value):
+    """Fraction to text: whole numbers as integers, terminating decimals as decimals, otherwise a/b."""
+    value = Fraction(value)
+    if value.denominator == 1:
+        return str(value.numerator)
+    denominator = value.denominator
+    for prime in (2, 5):
+        while denominator % prime == 0:
+            denominator //= prime
+    if denominator == 1:
+        return f"{float(value):.10f}".rstrip("0").rstrip(".")
+    return f"{value.numerator}/{value.denominator}"
+
+def _format_linear(a, b, unknown):
+    if not a:
+        return format_number(b)
+    if a == 1:
+        text = unknown
+    elif a == -1:
+        text = f"-{unknown}"
+    else:
+        text = f"{format_number(a)}{unknown}"
+    if b > 0:
+        text += f" + {format_number(b)}"
+    elif b < 0:
+        text += f" − {format_number(-b)}"
+    return text
+
+def _same_terms(text, a, b, unknown):
+    """Whether a side is already written as the linear form a·unknown + b, in either term order."""
+    compact = lambda side: side.replace(" ", "").replace("−", "-")
+    forms = {compact(_format_linear(a, b, unknown))}
+    if a and b:
+        forms.add(compact(format_number(b) + ("+" if a > 0 else "-") + _format_linear(abs(a), 0, unknown)))
+    return compact(text) in forms
+
+def parse_answer(answer):
+    """The numeric value of an answer field ("8", "x = 8", "3/4", "8 apples"), or None if it isn't one number."""
+    if answer is None:
+        return None
+    text = unicodedata.normalize("NFKC", str(answer)).strip().lower()
+    text = re.sub(r"^[a-z□]\s*=\s*", "", text)
+    numbers = _NUMBER_PATTERN.findall(text)
+    if len(numbers) != 1:
+        return None
+    number = numbers[0].replace(" ", "")
+    if "/" in number:
+        numerator, denominator = number.split("/")
+        if Fraction(denominator) == 0:
+            return None
+        return Fraction(numerator) / Fraction(denominator)
+    return Fraction(number)
+
+# --- explanations ------------------------------------------------------------
+
+def _templates(language, student_level):
+    merged = dict(_TEMPLATES[language]["default"])
+    merged.update(_TEMPLATES[language].get(student_level or "", {}))
+    return merged
+
+def _arithmetic_steps(steps, value, templates, has_brackets):
+    lines = [templates["intro"]]
+    mixes_precedence = len({symbol in "+-" for symbol, _, _, _ in steps}) > 1
+    if len(steps) > 1 and (mixes_precedence or has_brackets):
+        lines.append(templates["order"])
+    for number, (symbol, left, right, result) in enumerate(steps, start=1):
+        template = templates.get(symbol, templates["step"])
+        lines.append(template.format(n=number, a=format_number(left), b=format_number(right),
+                                     c=format_number(result), op=_DISPLAY_OPERATORS[symbol]))
+    lines.append(templates["answer"].format(c=format_number(value)))
+    return "\n".join(lines)
+
+def _equation_steps(lhs_text, rhs_text, lhs, rhs, unknown, templates):
+    (a, b), (c, d) = lhs, rhs
+    show = lambda la, lb: _format_linear(la, lb, unknown)
+    lines = [templates["eq_intro"].format(u=unknown, lhs=lhs_text, rhs=rhs_text)]
+    number = 0
+
+    if not (_same_terms(lhs_text, a, b, unknown) and _same_terms(rhs_text, c, d, unknown)):
+        number += 1
+        lines.append(templates["eq_simplify"].format(n=number, lhs=show(a, b), rhs=show(c, d)))
+    # Take the smaller unknown term away from both sides, so the unknown is left on one side
+    # with a positive coefficient ("20 − x = 5" becomes "20 = x + 5", not "−x = −15")
+    moved = min(a, c)
+    if moved:
+        number += 1
+        a, c = a - moved, c - moved
+        template = templates["eq_move_unknown"] if moved > 0 else templates["eq_add_unknown"]
+        lines.append(template.format(n=number, k=format_number(abs(moved)) if abs(moved) != 1 else "",
+                                     u=unknown, lhs=show(a, b), rhs=show(c, d)))
+    if not a:
+        number += 1
+        a, b, c, d = c, d, a, b
+        lines.append(templates["eq_swap"].format(n=number, lhs=show(a, b), rhs=show(c, d)))
+    if b:
+        number += 1
+        template = templates["eq_subtract"] if b > 0 else templates["eq_add"]
+        moved = abs(b)
+        b, d = Fraction(0), d - b
+        lines.append(template.format(n=number, k=format_number(moved), lhs=show(a, b), rhs=format_number(d)))
+    value = d / a
+    if a != 1:
+        number += 1
+        lines.append(templates["eq_divide"].format(n=number, k=format_number(a), lhs=unknown, rhs=format_number(value)))
+    lines.append(templates["eq_check"].format(u=unknown, v=format_number(value),
+                                              lhs=format_number(lhs[0] * value + lhs[1]),
+                                              rhs=format_number(rhs[0] * value + rhs[1])))
+    lines.append(templates["eq_answer"].format(u=unknown, v=format_number(value)))
+    return value, "\n".join(lines)
+
+# --- entry point -------------------------------------------------------------
+
+_stats_lock = threading.Lock()
+_stats = {"solved": 0, "unsupported": 0, "answer_mismatch": 0}
+
+def _count(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def solve_locally(problem_text, answer=None, student_level=None):
+    """
+    Solves plain arithmetic ("What is 5 + 3?", "4 multiplied by 6", "12 × 3 + 4 = ?", "计算：12乘3加4")
+    and linear equations in one unknown ("2x + 3 = 11", "5 + □ = 8") without calling Gemini.
+
+    Parsing is a small recursive descent over exact Fractions; nothing is evaluated with eval.
+    Returns templated solution steps for the student level (in Chinese when the problem is), or
+    None when the problem is out of scope, or when `answer` is given and doesn't match the computed
+    result (a wrong or non-numeric answer key is left to Gemini rather than contradicted).
+    """
+    if not problem_text:
+        return None
+    try:
+        expression = _normalize(problem_text)
+        language = "zh" if re.search(r"[一-鿿]", problem_text) else "en"
+        templates = _templates(language, student_level)
+        unknown = "□" if re.search(r"□|\(\s*\)|（\s*）|_{2,}", problem_text) else "x"
+
+        if "=" in expression:
+            sides = expression.split("=")
+            if len(sides) != 2 or "x" not in expression:
+                raise _Unsupported("not a single equation in one unknown")
+            lhs, rhs = _linear(_parse(sides[0])), _linear(_parse(sides[1]))
+            if lhs[0] == rhs[0]:
+                raise _Unsupported("no unique solution")
+            display = lambda side: re.sub(r"\s+", " ", side.replace("x", unknown).replace("*", " × ")
+                                           .replace("/", " ÷ ").replace("-", " − ").replace("+", " + ")).strip()
+            value, explanation = _equation_steps(display(sides[0]), display(sides[1]), lhs, rhs, unknown, templates)
+        else:
+            steps = []
+            coefficient, value = _linear(_parse(expression), steps)
+            if coefficient or not steps:
+                raise _Unsupported("nothing to calculate")
+            explanation = _arithmetic_steps(steps, value, templates, "(" in expression)
+    except (_Unsupported, ValueError, ZeroDivisionError, RecursionError):
+        _count("unsupported")
+        return None
+
+    if answer not in (None, ""):
+        expected = parse_answer(answer)
+        if expected is None or expected != value:
+            logger.warning(f"Local solver got {format_number(value)} for '{problem_text}' but the answer is '{answer}'; "
+                           f"leaving it to Gemini.")
+            _count("answer_mismatch")
+            return None
+    _count("solved")
+    return explanation
+
+if __name__ == '__main__':
+    print("Running basic tests for local_solver...")
+
+    assert solve_locally("What is 5 + 3?", "8").endswith("Answer: 8")
+    assert solve_locally("4 multiplied by 6", "24").endswith("Answer: 24")
+    assert "Put 5 and 3 together" in solve_locally("What is 5 + 3?", "8", student_level="lower_elementary")
+
+    # Order of operations and the steps it produces
+    steps = solve_locally("Calculate 2 + 3 × (4 − 1)", "11")
+    assert "Step 1: 4 − 1 = 3" in steps and "Step 2: 3 × 3 = 9" in steps and "Step 3: 2 + 9 = 11" in steps, steps
+    assert solve_locally("What is 7 ÷ 2?", "3.5").endswith("Answer: 3.5")
+    assert solve_locally("1/3 + 1/3", "2/3").endswith("Answer: 2/3")
+    assert solve_locally("1/4 + 1/4", "1/2").endswith("Answer: 0.5"), "Equal values verify in any notation"
+    assert solve_locally("5 x 3 = ?", "15").endswith("Answer: 15")
+
+    # Chinese text and operators
+    steps = solve_locally("计算：12乘3加4等于多少？", "40")
+    assert steps.startswith("我们一步一步来计算") and steps.endswith("答案：40"), steps
+    assert "合起来" in solve_locally("8加7等于多少？", "15", student_level="lower_elementary")
+    assert solve_locally("（12 + 8）÷ 4 = ？", "5").endswith("Answer: 5"), "Full-width symbols alone don't make it Chinese"
+    assert solve_locally("3 × 4 是多少？", "12").endswith("答案：12")
+
+    # Linear equations
+    steps = solve_locally("Solve for x: 2x + 3 = 11", "x = 4")
+    assert "Subtract 3 from both sides: 2x = 8" in steps and "Divide both sides by 2: x = 4" in steps, steps
+    assert solve_locally("x - 7 = 5", "12").endswith("Answer: x = 12")
+    assert solve_locally("3x + 2 = x + 10", "4").endswith("Answer: x = 4")
+    assert solve_locally("5 + □ = 8", "3", student_level="lower_elementary").endswith("So the missing number is 3. Great job!")
+    assert solve_locally("20 - x = 5", "15").endswith("Answer: x = 15")
+
+    # Every intermediate equation must hold: a negative unknown is added to both sides, never
+    # silently negated, and an unknown left on the right is swapped over
+    steps = solve_locally("20 - x = 5", "15")
+    assert ("Step 1: Add x to both sides: 20 = x + 5\nStep 2: Swap the two sides: x + 5 = 20\n"
+            "Step 3: Subtract 5 from both sides: x = 15\n") in steps, steps
+    steps = solve_locally("20 - □ = 5", "15", student_level="lower_elementary")
+    assert "Add □ to both sides: 20 = □ + 5" in steps and "Take 5 away from both sides to keep them equal: □ = 15" in steps, steps
+    steps = solve_locally("12 - ( ) = 7", "5")
+    assert "Add □ to both sides: 12 = □ + 7" in steps and "Subtract 7 from both sides: □ = 5" in steps, steps
+    steps = solve_locally("1 + 2 = x", "3")
+    assert "Step 1: Simplify both sides: 3 = x\nStep 2: Swap the two sides: x = 3\nCheck" in steps, steps
+    steps = solve_locally("-x = 4", "-4")
+    assert ("Step 1: Add x to both sides: 0 = x + 4\nStep 2: Swap the two sides: x + 4 = 0\n"
+            "Step 3: Subtract 4 from both sides: x = -4\n") in steps, steps
+    steps = solve_locally("x + 10 = 3x + 2", "4")
+    assert ("Step 1: Subtract x from both sides: 10 = 2x + 2\nStep 2: Swap the two sides: 2x + 2 = 10\n"
+            "Step 3: Subtract 2 from both sides: 2x = 8\nStep 4: Divide both sides by 2: x = 4") in steps, steps
+    steps = solve_locally("3x + 2 = x + 10", "4")
+    assert "Step 1: Subtract x from both sides: 2x + 2 = 10" in steps and "Step 2: Subtract 2 from both sides: 2x = 8" in steps, steps
+    steps = solve_locally("5 - 2x = x - 4", "3")
+    assert "Step 1: Add 2x to both sides: 5 = 3x − 4" in steps and "Add 4 to both sides: 3x = 9" in steps, steps
+    steps = solve_locally("20减x等于5", "15")
+    assert "第1步：两边同时加上 x：20 = x + 5" in steps and "第2步：交换等号两边：x + 5 = 20" in steps, steps
+    assert solve_locally("解方程：3x = 12", "x=4").endswith("答案：x = 4")
+
+    # Verification of the answer field
+    assert solve_locally("What is 5 + 3?", "9") is None, "A wrong answer key goes to Gemini"
+    assert solve_locally("What is 7 ÷ 2?", "3 remainder 1") is None
+    assert solve_locally("What is 5 + 3?") is not None, "No answer to verify"
+
+    # Out of scope
+    for text in ["What is the capital of France?", "A farmer has 10 apples. He gives away 3. How many are left?",
+                 "x * x = 4", "2 ** 3", "5 / 0", "1 + 1 = 2", "x = x", "12 3", "", "__import__('os')"]:
+        assert solve_locally(text) is None, text
+
+    print(f"Local solver stats: {stats()}")
+    print("Basic tests for local_solver completed.")
@@ -0,0 +1,342 @@
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A4 in PostScript points, with 2 cm margins
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 56.69
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+LINE_SPACING = 1.45
+
+# Latin text uses the standard Helvetica font, everything else Adobe's STSong-Light CJK font.
+# Neither is embedded: PDF viewers supply both, which keeps the renderer free of font files.
+CJK_FONT_NAME = "STSong-Light"
+
+# Helvetica advance widths (1/1000 em) of the printable ASCII characters, from its AFM metrics
+_HELVETICA_WIDTHS = dict(zip(
+    " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~",
+    (278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+     556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+     1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+     667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+     333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+     556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584),
+))
+# STSong-Light glyphs outside ASCII are set full-width
+_CJK_WIDTH = 1000
+
+# Sizes (pt) and gray levels of the parts of a problem block
+_TITLE = (18, 0.0)
+_HEADER = (10, 0.35)
+_TEXT = (12, 0.0)
+_ANSWER = (11, 0.0)
+_STEPS = (10, 0.15)
+_BLOCK_GAP = 14
+_INDENT = 14
+
+def _clean(text):
+    """Tabs become spaces, other control characters and characters outside the BMP become '?'."""
+    text = str(text or "").replace("\r\n", "\n").replace("\t", "    ")
+    return "".join(ch if (ch >= " " or ch == "\n") and ord(ch) <= 0xFFFF else "?" for ch in text)
+
+def _width(ch):
+    return _HELVETICA_WIDTHS.get(ch, _CJK_WIDTH)
+
+def text_width(text, size):
+    return sum(_width(ch) for ch in text) * size / 1000
+
+def wrap_text(text, size, max_width):
+    """
+    Breaks text into lines no wider than `max_width` points: Latin text at spaces (or anywhere
+    if a word alone is too wide), CJK text between any two characters. Newlines are kept.
+    """
+    limit = max_width * 1000 / size
+    lines = []
+    for paragraph in _clean(text).split("\n"):
+        line = []
+        width = 0
+        last_break = None # Position in `line` after a space or a CJK character
+        for ch in paragraph:
+            ch_width = _width(ch)
+            if width + ch_width > limit and line:
+                if ch == " ":
+                    lines.append("".join(line))
+                    line, width, last_break = [], 0, None
+                    continue
+                if ch in _HELVETICA_WIDTHS and last_break:
+                    head, line = line[:last_break], line[last_break:]
+                else:
+                    head, line = line, []
+                lines.append("".join(head).rstrip(" "))
+                while line and line[0] == " ":
+                    line.pop(0)
+                width = sum(_width(c) for c in line)
+                last_break = None
+                for position, c in enumerate(line, start=1):
+                    if c == " " or c not in _HELVETICA_WIDTHS:
+                        last_break = position
+            line.append(ch)
+            width += ch_width
+            if ch == " " or ch not in _HELVETICA_WIDTHS:
+                last_break = len(line)
+        lines.append("".join(line).rstrip(" "))
+    return lines
+
+def _number(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+def _show_text(x, y, text, size, gray):
+    """Content stream operators drawing one line, switching between the Latin and CJK fonts."""
+    ops = [f"BT {_number(gray)} g {_number(x)} {_number(y)} Td"]
+    run = []
+    latin = None
+    for ch in text + "\n": # The sentinel flushes the last run
+        ch_latin = ch in _HELVETICA_WIDTHS
+        if run and (ch == "\n" or ch_latin != latin):
+            chunk = "".join(run)
+            if latin:
+                escaped = chunk.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                ops.append(f"/F1 {size} Tf ({escaped}) Tj")
+            else:
+                ops.append(f"/F2 {size} Tf <{chunk.encode('utf-16-be').hex().upper()}> Tj")
+            run = []
+        run.append(ch)
+        latin = ch_latin
+    ops.append("ET")
+    return " ".join(ops)
+
+def _pdf_string(text):
+    """A PDF text string for metadata (UTF-16BE with BOM, as hex)."""
+    return "<FEFF" + _clean(text).encode("utf-16-be").hex().upper() + ">"
+
+def _problem_lines(problem, export_full):
+    """(text, (size, gray), indent) lines of one problem block, mirroring the HTML export."""
+    lines = []
+    header = f"Problem ID: {problem.get('problem_id', 'N/A')}    Type: {problem.get('problem_type', 'N/A')}"
+    lines.extend((line, _HEADER, 0) for line in wrap_text(header, _HEADER[0], TEXT_WIDTH))
+    problem_text = problem.get('problem_text') or 'No problem text provided.'
+    lines.extend((line, _TEXT, 0) for line in wrap_text(problem_text, _TEXT[0], TEXT_WIDTH))
+    if export_full:
+        answer = f"Answer: {problem.get('answer', 'N/A')}"
+        lines.extend((line, _ANSWER, _INDENT) for line in wrap_text(answer, _ANSWER[0], TEXT_WIDTH - _INDENT))
+        lines.append(("Solution Steps:", _ANSWER, _INDENT))
+        steps = problem.get('solution_steps_gemini') or "No solution steps provided."
+        lines.extend((line, _STEPS, 2 * _INDENT) for line in wrap_text(steps, _STEPS[0], TEXT_WIDTH - 2 * _INDENT))
+    return lines
+
+class _PdfWriter:
+    """
+    Writes a PDF file front to back. Objects 1 (catalog) and 2 (page tree) are reserved and
+    written last, once every page is known, so pages can be emitted as soon as they are full.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_number = 3
+        self.page_numbers = []
+
+    def _object(self, body, number=None):
+        if number is None:
+            number = self.next_number
+            self.next_number += 1
+        data = f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+        self.offsets[number] = self.offset
+        self.offset += len(data)
+        return number, data
+
+    def _dict(self, text, number=None):
+        return self._object(text.encode("latin-1"), number)
+
+    def start(self):
+        """File header and the two fonts shared by every page."""
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offset = len(header)
+        chunks = [header]
+        latin_number, data = self._dict("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        chunks.append(data)
+        descriptor_number, data = self._dict(
+            f"<< /Type /FontDescriptor /FontName /{CJK_FONT_NAME} /Flags 6 /FontBBox [-25 -254 1000 880] "
+            "/ItalicAngle 0 /Ascent 752 /Descent -271 /CapHeight 737 /StemV 58 >>"
+        )
+        chunks.append(data)
+        cid_number, data = self._dict(
+            f"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /{CJK_FONT_NAME} "
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> "
+            f"/FontDescriptor {descriptor_number} 0 R /DW {_CJK_WIDTH} >>"
+        )
+        chunks.append(data)
+        cjk_number, data = self._dict(
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /{CJK_FONT_NAME}-UniGB-UCS2-H "
+            f"/Encoding /UniGB-UCS2-H /DescendantFonts [{cid_number} 0 R] >>"
+        )
+        chunks.append(data)
+        self.resources = f"<< /Font << /F1 {latin_number} 0 R /F2 {cjk_number} 0 R >> >>"
+        return b"".join(chunks)
+
+    def page(self, content):
+        """A page with the given content stream operators (compressed)."""
+        stream = zlib.compress(content.encode("latin-1"))
+        content_number, content_data = self._object(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode("latin-1") + stream + b"\nendstream"
+        )
+        page_number, page_data = self._dict(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_number(PAGE_WIDTH)} {_number(PAGE_HEIGHT)}] "
+            f"/Resources {self.resources} /Contents {content_number} 0 R >>"
+        )
+        self.page_numbers.append(page_number)
+        return content_data + page_data
+
+    def finish(self, title=None):
+        """Page tree, catalog, document info and the cross-reference table."""
+        kids = " ".join(f"{number} 0 R" for number in self.page_numbers)
+        _, pages = self._dict(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_numbers)} >>", number=2)
+        _, catalog = self._dict("<< /Type /Catalog /Pages 2 0 R >>", number=1)
+        info_number, info = self._dict(f"<< /Title {_pdf_string(title or 'Math Problems')} /Producer (Math Problems API) >>")
+        xref_offset = self.offset
+        size = self.next_number
+        xref = [f"xref\n0 {size}\n0000000000 65535 f \n"]
+        xref.extend(f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, size))
+        xref.append(f"trailer\n<< /Size {size} /Root 1 0 R /Info {info_number} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return pages + catalog + info + "".join(xref).encode("latin-1")
+
+class _PageLayout:
+    """Places lines top-down on A4 pages and hands back each page's content stream when it is full."""
+
+    def __init__(self):
+        self.page_count = 0
+        self._new_page()
+
+    def _new_page(self):
+        self.page_count += 1
+        self.ops = []
+        self.y = PAGE_HEIGHT - MARGIN
+        self.empty = True
+
+    def remaining(self):
+        return self.y - MARGIN
+
+    def finish_page(self):
+        """Content of the current page (with its page number); starts the next one."""
+        footer = str(self.page_count)
+        self.ops.append(_show_text((PAGE_WIDTH - text_width(footer, 9)) / 2, MARGIN / 2, footer, 9, 0.5))
+        content = "\n".join(self.ops)
+        self._new_page()
+        return content
+
+    def add_line(self, text, style, indent=0):
+        """Draws a line; returns the finished page's content if the line didn't fit on it, else None."""
+        size, gray = style
+        height = size * LINE_SPACING
+        finished = None
+        if height > self.remaining() and not self.empty:
+            finished = self.finish_page()
+        self.y -= height
+        if text:
+            self.ops.append(_show_text(MARGIN + indent, self.y + (height - size) / 2 + size * 0.2, text, size, gray))
+        self.empty = False
+        return finished
+
+    def add_gap(self, height, rule=False):
+        """Vertical space, optionally with a thin rule across the text width in its middle."""
+        if height >= self.remaining():
+            self.y = MARGIN
+            return
+        if rule:
+            middle = self.y - height / 2
+            self.ops.append(f"0.8 G 0.5 w {_number(MARGIN)} {_number(middle)} m "
+                            f"{_number(PAGE_WIDTH - MARGIN)} {_number(middle)} l S")
+        self.y -= height
+
+def block_height(lines):
+    return sum(style[0] * LINE_SPACING for _, style, _ in lines)
+
+def iter_problems_pdf(problems_data, export_full=True, title=None):
+    """
+    Renders problems as an A4 PDF, yielding bytes as each page fills up, so memory stays flat
+    for large exports. A problem that fits on one page is moved to the next page rather than
+    split; longer ones continue across pages. Same fields as the HTML export.
+    """
+    writer = _PdfWriter()
+    yield writer.start()
+    layout = _PageLayout()
+    for line in wrap_text(title or "Math Problems", _TITLE[0], TEXT_WIDTH):
+        layout.add_line(line, _TITLE)
+    layout.add_gap(_BLOCK_GAP, rule=True)
+
+    has_problems = False
+    for problem in problems_data:
+        has_problems = True
+        lines = _problem_lines(problem, export_full)
+        height = block_height(lines)
+        if height > layout.remaining() and height <= PAGE_HEIGHT - 2 * MARGIN and not layout.empty:
+            yield writer.page(layout.finish_page())
+        for text, style, indent in lines:
+            finished = layout.add_line(text, style, indent)
+            if finished is not None:
+                yield writer.page(finished)
+        layout.add_gap(_BLOCK_GAP, rule=True)
+
+    if not has_problems:
+        layout.add_line("No problems to display.", _TEXT)
+    yield writer.page(layout.finish_page())
+    yield writer.finish(title)
+
+if __name__ == '__main__':
+    import re
+
+    print("Running basic tests for pdf_exporter...")
+
+    # Wrapping: Latin at spaces, CJK anywhere, nothing wider than the limit
+    assert wrap_text("hello world", 10, text_width("hello world", 10)) == ["hello world"]
+    assert wrap_text("hello world", 10, text_width("hello wor", 10)) == ["hello", "world"]
+    assert wrap_text("一二三四五六", 10, 30) == ["一二三", "四五六"]
+    assert wrap_text("abc\n\ndef", 10, 100) == ["abc", "", "def"]
+    assert wrap_text("x" * 30, 10, text_width("x" * 10, 10)) == ["x" * 10] * 3
+    mixed = "小明有 15 apples，他给了小红 7 个，还剩几个？Explain your reasoning step by step. " * 5
+    for line in wrap_text(mixed, 12, TEXT_WIDTH):
+        assert text_width(line, 12) <= TEXT_WIDTH + 0.01, line
+    assert "".join(wrap_text(mixed, 12, TEXT_WIDTH)).replace(" ", "") == mixed.replace(" ", "")
+
+    problems = [
+        {"problem_id": f"P{i:03d}", "problem_type": "算术" if i % 2 else "Geometry",
+         "problem_text": f"计算 {i} + {i} = ? (Show (your) work \\ carefully.) " * (1 + i % 7),
+         "answer": str(2 * i), "solution_steps_gemini": "步骤 1：相加。\n步骤 2：检查。\n" * (i % 5)}
+        for i in range(1, 301)
+    ]
+    chunks = list(iter_problems_pdf(iter(problems), export_full=True, title="练习 Export"))
+    document = b"".join(chunks)
+    assert len(chunks) > 10 # One chunk per page, not one big document
+    assert document.startswith(b"%PDF-1.4") and document.endswith(b"%%EOF\n")
+
+    # Every cross-reference entry points at its object
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF", document).group(1))
+    assert document[startxref:startxref + 4] == b"xref"
+    count = int(re.match(rb"xref\n0 (\d+)\n", document[startxref:]).group(1))
+    entries = re.findall(rb"(\d{10}) 00000 n ", document[startxref:])
+    assert len(entries) == count - 1
+    for number, offset in enumerate(entries, start=1):
+        assert document[int(offset):].startswith(f"{number} 0 obj".encode()), number
+
+    pages = re.search(rb"/Type /Pages /Kids \[([^\]]*)\] /Count (\d+)", document)
+    page_count = int(pages.group(2))
+    assert page_count == len(re.findall(rb"/Type /Page ", document)) > 10
+
+    # Page content: text within the A4 margins, CJK as UTF-16 hex, parentheses escaped
+    streams = [zlib.decompress(m) for m in re.findall(rb"stream\n(.*?)\nendstream", document, re.S)]
+    assert len(streams) == page_count
+    first_page = streams[0].decode("latin-1")
+    assert "<7EC34E60> Tj" in first_page # 练习
+    assert "\\(Show \\(your\\) work \\\\ carefully.\\)" in first_page
+    for stream in streams:
+        for y in re.findall(r" (-?[\d.]+) Td", stream.decode("latin-1")):
+            assert MARGIN / 2 - 1 <= float(y) <= PAGE_HEIGHT - MARGIN, y
+
+    empty = b"".join(iter_problems_pdf([]))
+    assert b"/Count 1" in empty
+    assert b"No problems" in zlib.decompress(re.search(rb"stream\n(.*?)\nendstream", empty, re.S).group(1))
+
+    print(f"{len(problems)} problems -> {page_count} pages, {len(document)} bytes")
+    print("Basic tests for pdf_exporter completed.")
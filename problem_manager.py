@@ -1,27 +1,47 @@
 import csv
+import heapq
+import hashlib
+import itertools
+import json
 import os
 import logging
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
+try:
+    import fcntl
+except ImportError: # Windows has no flock; only in-process locking applies there
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_FILEPATH = "data/problems.csv"
 HEADERS = ["problem_id", "problem_text", "problem_type", "answer", "solution_steps_gemini", "source", "created_time", "updated_time"]
+SORTABLE_FIELDS = ("created_time", "updated_time")
+# Fields callers may change; IDs and timestamps are managed here
+UPDATABLE_FIELDS = ("problem_text", "problem_type", "answer", "source", "solution_steps_gemini")
 
 def _initialize_csv(filepath):
     """Creates the CSV file with headers if it doesn't exist or is empty."""
     if not os.path.exists(os.path.dirname(filepath)):
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
 
-    write_header = not os.path.exists(filepath) or os.path.getsize(filepath) == 0
-    if write_header:
-        with open(filepath, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(HEADERS)
+    if not os.path.exists(filepath):
+        try:
+            # 'x' so a worker starting up can't truncate a file another worker just created
+            with open(filepath, 'x', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(HEADERS)
+        except FileExistsError:
+            pass
+    elif os.path.getsize(filepath) == 0:
+        _write_problems_csv([], filepath)
 
-def load_problems(filepath=DEFAULT_FILEPATH):
+def _read_problems_csv(filepath):
     """
-    Loads problems from a CSV file.
+    Reads every row of a problems CSV file.
     Returns a list of dictionaries, where each dictionary represents a problem.
     Handles FileNotFoundError by returning an empty list and printing a warning.
     """
@@ -54,114 +74,870 @@ def load_problems(filepath=DEFAULT_FILEPATH):
         logger.error(f"Error loading problems from {filepath}: {e}")
     return problems
 
-def save_problems(problems, filepath=DEFAULT_FILEPATH):
+def _write_problems_csv(problems, filepath):
     """
-    Saves the list of problem dictionaries back to the CSV file.
+    Writes the list of problem dictionaries to the CSV file.
     Ensures the header row is written correctly.
+    The rows go to a temporary file in the same directory, which is fsync'd and then renamed
+    over the target, so readers and crashes only ever see the old or the new file.
+    Raises on failure, leaving the previous file untouched.
     """
-    _initialize_csv(filepath) # Ensure directory exists, and file if it was somehow deleted
+    directory = os.path.dirname(filepath) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(filepath) + ".", suffix=".tmp", dir=directory)
     try:
-        with open(filepath, mode='w', newline='', encoding='utf-8') as csvfile:
+        with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=HEADERS)
             writer.writeheader()
             writer.writerows(problems)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        # mkstemp creates 0600 files; keep the permissions the bank already had
+        os.chmod(temp_path, os.stat(filepath).st_mode & 0o777 if os.path.exists(filepath) else 0o644)
+        os.replace(temp_path, filepath)
+        fsync_directory(directory)
     except Exception as e:
         logger.error(f"Error saving problems to {filepath}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def fsync_directory(directory):
+    """Makes a rename in `directory` durable. Not supported (or needed) on Windows."""
+    if os.name != 'posix':
+        return
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _file_signature(filepath):
+    """Returns a (mtime_ns, size, inode) tuple used to detect on-disk changes, or None if missing."""
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _latest_mtime(*filepaths):
+    """Returns the newest modification time of the existing files as an aware UTC datetime, or None."""
+    mtimes = [signature[0] for signature in map(_file_signature, filepaths) if signature is not None]
+    if not mtimes:
+        return None
+    return datetime.fromtimestamp(max(mtimes) / 1e9, tz=timezone.utc)
+
+def _signature_version(signature):
+    """Opaque data version derived from a storage signature (the files' stat data)."""
+    return hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()[:20]
+
+def _problem_id_number(problem_id):
+    """Returns the numeric part of a "P###" ID, or None for malformed IDs."""
+    if problem_id and problem_id.startswith("P") and problem_id[1:].isdigit():
+        return int(problem_id[1:])
+    return None
+
+def _sort_key(value, problem_id):
+    """Order of list pages: the sort column, then problem ID order (P999 before P1000)."""
+    problem_id = problem_id or ""
+    return value or "", len(problem_id), problem_id
+
+def _format_problem_id(number):
+    """Formats an ID number as "P001"; numbers past 999 simply get more digits (P1000)."""
+    return f"P{number:03d}"
+
+@contextmanager
+def interprocess_lock(lock_path):
+    """
+    Holds an exclusive advisory lock on `lock_path` for the duration of the block.
+    Uses flock where available; on platforms without fcntl (Windows) this is a no-op and
+    only the callers' thread locks apply.
+    """
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+class ProblemIdAllocator:
+    """
+    Hands out monotonically increasing problem IDs from a persisted high-water mark.
+
+    The last issued number lives in a small counter file, so allocating an ID is O(1)
+    instead of a scan over every existing ID, and IDs of deleted problems are never reused.
+    The counter is read-incremented-written under a thread lock plus an flock on
+    "<counter>.lock", which keeps concurrent workers from handing out the same ID.
+    """
+
+    def __init__(self, counter_path):
+        self.counter_path = counter_path
+        self._lock = threading.Lock()
+
+    def _read_counter(self):
+        try:
+            with open(self.counter_path, 'r', encoding='utf-8') as counter_file:
+                return int(counter_file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            logger.warning(f"ID counter {self.counter_path} is unreadable; reseeding from existing IDs.")
+            return 0
+
+    def _write_counter(self, value):
+        temp_path = self.counter_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as counter_file:
+            counter_file.write(str(value))
+            counter_file.flush()
+            os.fsync(counter_file.fileno())
+        os.replace(temp_path, self.counter_path)
+
+    def allocate(self, count=1, floor=0):
+        """
+        Reserves `count` consecutive IDs and returns them as a list of strings.
+        `floor` is the highest ID number known to exist; it seeds a missing counter and keeps
+        the counter ahead of rows that were added behind its back (e.g. a hand-edited CSV).
+        """
+        with self._lock, interprocess_lock(self.counter_path + ".lock"):
+            first = max(self._read_counter(), floor) + 1
+            last = first + count - 1
+            self._write_counter(last)
+        return [_format_problem_id(number) for number in range(first, last + 1)]
+
+class CsvStorage:
+    """
+    Stores the whole problem bank in a single CSV file.
+    Every mutation rewrites the file, which keeps it readable by any CSV tool.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def signature(self):
+        return _file_signature(self.filepath)
+
+    def last_modified(self):
+        return _latest_mtime(self.filepath)
+
+    def load(self):
+        return _read_problems_csv(self.filepath)
+
+    def write_all(self, problems):
+        _write_problems_csv(problems, self.filepath)
+
+    def record(self, op, problem, problems):
+        """Persists a single 'put' or 'delete'. The CSV format can only do that by rewriting everything."""
+        self.write_all(problems)
+
+    def record_many(self, changes, problems):
+        """Persists a batch of (op, problem) changes with a single rewrite."""
+        self.write_all(problems)
+
+    def needs_compaction(self):
+        return False
+
+class JournalStorage:
+    """
+    Stores the problem bank as a CSV snapshot plus an append-only journal of mutations.
+
+    The snapshot is a regular problems CSV (same HEADERS), so an existing data/problems.csv is
+    adopted as-is when switching to this backend. Each add/update/delete appends one JSON line
+    ({"op": "put"|"delete", "problem": {...}}) to "<snapshot>.journal", making writes O(1).
+    Once the journal grows past `compact_threshold` records, the repository folds it back
+    into the snapshot on a background thread; compact_journal() does the same on demand,
+    which is also the way back to the plain csv backend.
+
+    Records are full rows, so replaying them is idempotent: a crash between writing the new
+    snapshot and removing the rotated journal segment only replays ops that are already applied.
+    """
+
+    DEFAULT_COMPACT_THRESHOLD = 1000
+
+    def __init__(self, filepath, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        self.filepath = filepath
+        self.journal_path = filepath + ".journal"
+        # The journal is renamed here while a compaction is writing the new snapshot.
+        self.compacting_path = filepath + ".journal.compacting"
+        self.compact_threshold = compact_threshold
+        self._journal_records = 0
+
+    def signature(self):
+        return (
+            _file_signature(self.filepath),
+            _file_signature(self.journal_path),
+            _file_signature(self.compacting_path),
+        )
+
+    def last_modified(self):
+        return _latest_mtime(self.filepath, self.journal_path, self.compacting_path)
+
+    def _replay(self, journal_path, problems):
+        """Applies the records of one journal file to an id -> problem dict. Returns the record count."""
+        applied = 0
+        try:
+            with open(journal_path, mode='r', encoding='utf-8') as journal:
+                for line_number, line in enumerate(journal, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        op = record['op']
+                        problem = {field: record['problem'].get(field, "") for field in HEADERS}
+                    except (ValueError, KeyError, TypeError, AttributeError) as e:
+                        # Most likely a torn write at the tail of the journal after a crash.
+                        logger.warning(f"Skipping unreadable journal record {journal_path}:{line_number}: {e}")
+                        continue
+                    if op == "put":
+                        problems[problem['problem_id']] = problem
+                    elif op == "delete":
+                        problems.pop(problem['problem_id'], None)
+                    else:
+                        logger.warning(f"Skipping journal record with unknown op '{op}' at {journal_path}:{line_number}")
+                        continue
+                    applied += 1
+        except FileNotFoundError:
+            pass
+        return applied
+
+    def load(self):
+        problems = {}
+        for position, row in enumerate(_read_problems_csv(self.filepath)):
+            problems[row.get('problem_id') or f"__row{position}"] = row
+        self._replay(self.compacting_path, problems)
+        self._journal_records = self._replay(self.journal_path, problems)
+        return list(problems.values())
+
+    def write_all(self, problems):
+        _write_problems_csv(problems, self.filepath)
+        for path in (self.compacting_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._journal_records = 0
+
+    def record(self, op, problem, problems):
+        self.record_many([(op, problem)], problems)
+
+    def record_many(self, changes, problems):
+        """Appends a batch of (op, problem) records with one write and one fsync."""
+        _initialize_csv(self.filepath)
+        lines = [
+            json.dumps({"op": op, "problem": {field: problem.get(field, "") for field in HEADERS}}, ensure_ascii=False) + "\n"
+            for op, problem in changes
+        ]
+        with open(self.journal_path, mode='a', encoding='utf-8') as journal:
+            journal.write("".join(lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._journal_records += len(lines)
+
+    def needs_compaction(self):
+        return self._journal_records >= self.compact_threshold
+
+    def begin_compaction(self):
+        """Rotates the live journal aside so new records go to a fresh file during compaction."""
+        if os.path.exists(self.compacting_path):
+            # A previous compaction died half-way; its segment is still needed for replay.
+            return False
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, self.compacting_path)
+        self._journal_records = 0
+        return True
+
+    def write_compacted_snapshot(self, problems):
+        temp_path = self.filepath + ".compacting.tmp"
+        _write_problems_csv(problems, temp_path)
+        return temp_path
+
+    def finish_compaction(self, temp_path):
+        if not os.path.exists(self.compacting_path):
+            # A full rewrite (save_problems) superseded this compaction while the snapshot was written.
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, self.filepath)
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+STORAGE_BACKEND_ENV_VAR = "PROBLEM_STORAGE_BACKEND"
+DEFAULT_STORAGE_BACKEND = "csv"
+
+STORAGE_BACKENDS = ("csv", "journal", "sqlite")
+
+def _configured_backend(backend=None):
+    """Returns the storage backend selected by `backend` or the PROBLEM_STORAGE_BACKEND env var."""
+    backend = (backend or os.getenv(STORAGE_BACKEND_ENV_VAR) or DEFAULT_STORAGE_BACKEND).lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown problem storage backend '{backend}'. Expected one of {', '.join(STORAGE_BACKENDS)}.")
+    return backend
+
+def _create_storage(filepath, backend=None):
+    """Builds the file storage for the csv and journal backends."""
+    if _configured_backend(backend) == "journal":
+        return JournalStorage(filepath)
+    return CsvStorage(filepath)
+
+class ProblemRepository:
+    """
+    Long-lived, in-memory view of a problem bank.
+
+    Problems are kept in a dict indexed by problem_id (insertion order matches file order),
+    so lookups no longer re-parse the CSV. Mutations are written through to the storage
+    backend immediately. The data is only re-read when the backing files change on disk
+    (mtime/size), e.g. because another process or a manual edit touched them.
+    Every mutation holds an flock on "<bank>.lock" and re-reads newer data first, so several
+    gunicorn workers sharing one bank can't lose each other's writes.
+
+    Returned problems are copies; callers may mutate them freely and persist the result
+    with save_problems().
+
+    Listeners registered with add_listener() are called after every write this process makes
+    as listener(changes, version_before, version_after). `changes` is a list of ("put", problem)
+    or ("delete", problem) pairs, or None when the whole bank was replaced; the problems are live
+    records and must not be kept or modified. The versions are data_version() values taken under
+    the write lock, so a listener can tell whether it missed a change made by another process.
+    """
+
+    def __init__(self, filepath=DEFAULT_FILEPATH, storage=None):
+        self.filepath = filepath
+        self._storage = storage if storage is not None else _create_storage(filepath)
+        self._lock = threading.RLock()
+        self._problems = {}
+        self._signature = None
+        self._loaded = False
+        self._compaction_thread = None
+        self._id_allocator = ProblemIdAllocator(filepath + ".seq")
+        self._max_id_number = 0
+        self._write_depth = 0
+        self._listeners = []
+
+    @contextmanager
+    def _writing(self):
+        """
+        Serialises a read-modify-write cycle across threads (RLock) and worker processes
+        (flock on "<bank>.lock"), and refreshes from disk first so the change is applied to
+        the latest data rather than to a stale in-memory copy. Re-entrant within a thread.
+        """
+        with self._lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            with interprocess_lock(self.filepath + ".lock"):
+                self._write_depth = 1
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    self._write_depth = 0
+
+    def _refresh(self):
+        """Reloads the data if it has never been read or changed on disk since the last read/write."""
+        signature = self._storage.signature()
+        if self._loaded and signature == self._signature:
+            return
+        # Remember the signature seen *before* reading: if a writer changes the files while
+        # we read, the next check sees a difference and reloads instead of trusting a torn view.
+        self._signature = signature
+        rows = self._storage.load()
+        self._problems = {}
+        for position, row in enumerate(rows):
+            # Rows without an ID can't be looked up, but are kept so they survive a rewrite.
+            key = row.get('problem_id') or f"__row{position}"
+            self._problems[key] = row
+        self._max_id_number = self._highest_id_number()
+        self._loaded = True
+
+    def _highest_id_number(self):
+        """Scans the loaded IDs once per (re)load so the allocator never falls behind the data."""
+        return max((_problem_id_number(key) or 0 for key in self._problems), default=0)
+
+    def _persist(self, op=None, problem=None, changes=None):
+        """
+        Writes a change through to storage and remembers the new on-disk signature.
+        With no `op` or `changes` the whole bank is rewritten; otherwise only the single record
+        (op, problem) or the batch of (op, problem) `changes` is persisted.
+        """
+        try:
+            if changes is not None:
+                self._storage.record_many(changes, self._problems.values())
+            elif op is None:
+                self._storage.write_all(self._problems.values())
+            else:
+                self._storage.record(op, problem, self._problems.values())
+        except Exception:
+            # The in-memory change never reached disk; reload on next access instead of serving it.
+            self._loaded = False
+            raise
+        if changes is None and op is not None:
+            changes = [(op, problem)]
+        self._signature_changed(changes)
+        if self._storage.needs_compaction():
+            self._start_background_compaction()
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _signature_changed(self, changes):
+        """Remembers the on-disk signature after our own write and reports the change to listeners."""
+        version_before = _signature_version(self._signature)
+        self._signature = self._storage.signature()
+        for listener in list(self._listeners):
+            try:
+                listener(changes, version_before, _signature_version(self._signature))
+            except Exception:
+                logger.exception(f"Problem change listener failed for {self.filepath}")
+
+    def _start_background_compaction(self):
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(
+            target=self.compact, name=f"compact-{os.path.basename(self.filepath)}", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def compact(self):
+        """
+        Folds the journal into a fresh snapshot. The snapshot is written outside the lock so
+        readers and writers are only blocked for the journal rotation and the final rename.
+        Storage backends without a journal ignore this.
+        """
+        if not hasattr(self._storage, 'begin_compaction'):
+            return
+        try:
+            with self._writing():
+                if not self._storage.begin_compaction():
+                    # Finish the interrupted compaction synchronously; the snapshot covers everything.
+                    self._storage.write_all(self._problems.values())
+                    self._signature_changed([])
+                    return
+                rows = [dict(problem) for problem in self._problems.values()]
+                self._signature_changed([]) # Same data, new files
+            temp_path = self._storage.write_compacted_snapshot(rows)
+            with self._writing():
+                self._storage.finish_compaction(temp_path)
+                self._signature_changed([])
+        except Exception as e:
+            logger.error(f"Error compacting problem journal for {self.filepath}: {e}")
+
+    def data_version(self):
+        """
+        Opaque token that changes whenever the bank changes on disk. It is derived from the
+        files' stat data, so every worker process computes the same token for the same data.
+        """
+        return _signature_version(self._storage.signature())
+
+    def last_modified(self):
+        return self._storage.last_modified()
+
+    def snapshot(self):
+        """Returns (data_version, copies of all problems), both taken at the same instant."""
+        with self._lock:
+            self._refresh()
+            return _signature_version(self._signature), [dict(problem) for problem in self._problems.values()]
+
+    def list_problems(self, problem_type=None):
+        return self.query(problem_type=problem_type)
+
+    def iter_problems(self, problem_type=None):
+        """
+        Yields copies of the problems one at a time, e.g. for streaming exports.
+        Only a list of references is taken under the lock, so writers aren't blocked while
+        the consumer works through a large bank.
+        """
+        with self._lock:
+            self._refresh()
+            problems = list(self._problems.values())
+        problem_type_lower = problem_type.lower() if problem_type else None
+        for problem in problems:
+            if problem_type_lower and (problem.get('problem_type') or '').lower() != problem_type_lower:
+                continue
+            yield dict(problem)
+
+    def query(self, problem_type=None, sort_by=None, descending=False, offset=0, limit=None, fields=None,
+              after=None):
+        """
+        Returns one page of problems: filtered by type (case-insensitive), optionally sorted by a
+        timestamp column (ties in problem ID order), sliced by offset/limit and projected to `fields`.
+        `after` (sort value, problem_id) of the previous page's last row starts the page right
+        after it. Only the returned page is copied, so small pages stay cheap on large banks.
+        """
+        with self._lock:
+            self._refresh()
+            problems = self._problems.values()
+            if problem_type:
+                # Case-insensitive, matching the filter the API has always applied.
+                problem_type_lower = problem_type.lower()
+                problems = [
+                    problem for problem in problems
+                    if (problem.get('problem_type') or '').lower() == problem_type_lower
+                ]
+            if sort_by:
+                def key(problem):
+                    return _sort_key(problem.get(sort_by), problem.get('problem_id'))
+                if after is not None:
+                    bound = _sort_key(*after)
+                    problems = [problem for problem in problems if (key(problem) < bound if descending else key(problem) > bound)]
+                if limit is not None:
+                    # Only the first offset + limit rows need ordering (same result as sorted()[:n])
+                    select = heapq.nlargest if descending else heapq.nsmallest
+                    problems = select(offset + limit, problems, key=key)
+                else:
+                    problems = sorted(problems, key=key, reverse=descending)
+            elif descending:
+                problems = list(reversed(list(problems)))
+            page = itertools.islice(problems, offset, None if limit is None else offset + limit)
+            if fields:
+                return [{field: problem.get(field, "") for field in fields} for problem in page]
+            return [dict(problem) for problem in page]
+
+    def get(self, problem_id):
+        with self._lock:
+            self._refresh()
+            problem = self._problems.get(problem_id)
+            return dict(problem) if problem is not None else None
+
+    def replace_all(self, problems):
+        with self._writing():
+            self._problems = {}
+            for position, problem in enumerate(problems):
+                key = problem.get('problem_id') or f"__row{position}"
+                self._problems[key] = dict(problem)
+            self._max_id_number = self._highest_id_number()
+            self._loaded = True
+            self._persist()
+
+    def add(self, problem_text, problem_type, answer, source=""):
+        with self._writing():
+            new_id = self._id_allocator.allocate(floor=self._max_id_number)[0]
+            self._max_id_number = _problem_id_number(new_id)
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+
+            new_problem = {
+                "problem_id": new_id,
+                "problem_text": problem_text,
+                "problem_type": problem_type,
+                "answer": answer,
+                "solution_steps_gemini": "",  # Initially empty
+                "source": source,
+                "created_time": current_time_iso,
+                "updated_time": current_time_iso
+            }
+
+            self._problems[new_id] = new_problem
+            self._persist("put", new_problem)
+            return dict(new_problem)
+
+    def add_many(self, problems):
+        """
+        Adds many problems with one bulk ID allocation and one storage write.
+        Each item is a dict with problem_text, problem_type, answer and optionally source and
+        solution_steps_gemini; any problem_id or timestamps in it are replaced.
+        """
+        problems = list(problems)
+        if not problems:
+            return []
+        with self._writing():
+            new_ids = self._id_allocator.allocate(count=len(problems), floor=self._max_id_number)
+            self._max_id_number = _problem_id_number(new_ids[-1])
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+            created = []
+            for new_id, fields in zip(new_ids, problems):
+                new_problem = {field: fields.get(field) or "" for field in HEADERS}
+                new_problem.update(problem_id=new_id, created_time=current_time_iso, updated_time=current_time_iso)
+                self._problems[new_id] = new_problem
+                created.append(new_problem)
+            self._persist(changes=[("put", problem) for problem in created])
+            return [dict(problem) for problem in created]
+
+    def update_solution(self, problem_id, solution_steps):
+        with self._writing():
+            problem = self._problems.get(problem_id)
+            if problem is None:
+                return False
+            problem['solution_steps_gemini'] = solution_steps
+            problem['updated_time'] = datetime.now(timezone.utc).isoformat()
+            self._persist("put", problem)
+            return True
+
+    def update_solutions(self, solutions):
+        """Applies {problem_id: solution_steps} in one locked cycle and one storage write."""
+        with self._writing():
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+            changes = []
+            for problem_id, solution_steps in solutions.items():
+                problem = self._problems.get(problem_id)
+                if problem is None:
+                    continue
+                problem['solution_steps_gemini'] = solution_steps
+                problem['updated_time'] = current_time_iso
+                changes.append(("put", problem))
+            if changes:
+                self._persist(changes=changes)
+            return [problem['problem_id'] for _, problem in changes]
+
+    @staticmethod
+    def _matches(problem, problem_type, source):
+        if problem_type and problem.get('problem_type', '').lower() != problem_type.lower():
+            return False
+        return not source or problem.get('source', '') == source
+
+    def _apply_patch(self, problem, fields, current_time_iso):
+        for field in UPDATABLE_FIELDS:
+            if field in fields:
+                problem[field] = "" if fields[field] is None else str(fields[field])
+        problem['updated_time'] = current_time_iso
+        if not problem.get('created_time'):
+            # Records from before created_time existed get it on their first update
+            problem['created_time'] = current_time_iso
+
+    def update_many(self, patches):
+        """
+        Applies {problem_id: {field: value}} patches (UPDATABLE_FIELDS only) with one shared
+        updated_time and one storage write. Returns {problem_id: updated copy, or None if not found}.
+        """
+        with self._writing():
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+            results = {}
+            changes = []
+            for problem_id, fields in patches.items():
+                problem = self._problems.get(problem_id)
+                if problem is None:
+                    results[problem_id] = None
+                    continue
+                self._apply_patch(problem, fields, current_time_iso)
+                changes.append(("put", problem))
+                results[problem_id] = dict(problem)
+            if changes:
+                self._persist(changes=changes)
+            return results
+
+    def update_matching(self, fields, problem_type=None, source=None):
+        """Patches every problem matching the filters (at least one required) in one write; returns the updated copies."""
+        if not problem_type and not source:
+            raise ValueError("A problem_type or source filter is required")
+        with self._writing():
+            matching = [problem_id for problem_id, problem in self._problems.items()
+                        if self._matches(problem, problem_type, source)]
+            return list(self.update_many({problem_id: fields for problem_id in matching}).values())
+
+    def delete_many(self, problem_ids):
+        """Deletes the given problems with one storage write; returns the IDs that existed."""
+        with self._writing():
+            deleted = []
+            for problem_id in dict.fromkeys(problem_ids):
+                problem = self._problems.pop(problem_id, None)
+                if problem is not None:
+                    deleted.append(problem)
+            if deleted:
+                self._persist(changes=[("delete", problem) for problem in deleted])
+            return [problem['problem_id'] for problem in deleted]
+
+    def delete_matching(self, problem_type=None, source=None):
+        """Deletes every problem matching the filters (at least one required); returns their IDs."""
+        if not problem_type and not source:
+            raise ValueError("A problem_type or source filter is required")
+        with self._writing():
+            return self.delete_many([problem_id for problem_id, problem in self._problems.items()
+                                     if self._matches(problem, problem_type, source)])
+
+    def delete(self, problem_id):
+        with self._writing():
+            problem = self._problems.pop(problem_id, None)
+            if problem is None:
+                return False
+            self._persist("delete", problem)
+            return True
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+def get_repository(filepath=DEFAULT_FILEPATH):
+    """
+    Returns the shared ProblemRepository for a problem bank, creating it on first use.
+    Repositories are keyed by absolute path so relative and absolute paths share one cache.
+    The storage backend is chosen from the PROBLEM_STORAGE_BACKEND env var ("csv", "journal"
+    or "sqlite"); the sqlite backend keeps the bank in a database next to the CSV.
+    """
+    key = os.path.abspath(filepath)
+    with _repositories_lock:
+        repository = _repositories.get(key)
+        if repository is None:
+            if _configured_backend() == "sqlite":
+                # Imported lazily: sqlite_storage depends on this module.
+                from sqlite_storage import SqliteProblemRepository
+                repository = SqliteProblemRepository(filepath)
+            else:
+                repository = ProblemRepository(filepath)
+            _repositories[key] = repository
+        return repository
+
+def get_data_version(filepath=DEFAULT_FILEPATH):
+    """
+    Returns a short token identifying the current state of the whole problem bank.
+    It changes on every add/update/delete (by any process) and is cheap to compute,
+    which makes it suitable for ETags and cache keys.
+    """
+    return get_repository(filepath).data_version()
+
+def get_last_modified(filepath=DEFAULT_FILEPATH):
+    """Returns when the problem bank last changed (aware UTC datetime), or None if unknown."""
+    return get_repository(filepath).last_modified()
+
+def compact_journal(filepath=DEFAULT_FILEPATH):
+    """
+    Folds any pending journal records into the CSV snapshot right away.
+    After this the CSV alone holds the full bank, so the csv backend can read it again.
+    """
+    get_repository(filepath).compact()
+
+def load_problems(filepath=DEFAULT_FILEPATH, problem_type=None):
+    """
+    Loads problems from a CSV file.
+    Returns a list of dictionaries, where each dictionary represents a problem.
+    If problem_type is given, only problems of that type (case-insensitive) are returned;
+    the sqlite backend answers this from an index.
+    The file is only re-parsed when it changed on disk since the last read.
+    """
+    return get_repository(filepath).list_problems(problem_type=problem_type)
+
+def iter_problems(problem_type=None, filepath=DEFAULT_FILEPATH):
+    """
+    Generator over the problems (optionally of one type, case-insensitive) in storage order.
+    Unlike load_problems it doesn't build the full result list up front.
+    """
+    return get_repository(filepath).iter_problems(problem_type=problem_type)
+
+def query_problems(problem_type=None, sort_by=None, descending=False, offset=0, limit=None, fields=None,
+                   after=None, filepath=DEFAULT_FILEPATH):
+    """
+    Returns a page of problems for list views.
+    problem_type filters case-insensitively, sort_by is one of SORTABLE_FIELDS (None keeps
+    insertion order; ties are in problem ID order), offset/limit select the page and fields
+    projects each problem to a subset of HEADERS. For keyset paging pass `after`, the
+    (sort value, problem_id) of the previous page's last row, instead of an offset: pages then
+    don't shift when problems are added or deleted in between. The sqlite backend pushes all of
+    this down into a single SQL query.
+    """
+    if sort_by is not None and sort_by not in SORTABLE_FIELDS:
+        raise ValueError(f"Cannot sort by '{sort_by}'. Expected one of {', '.join(SORTABLE_FIELDS)}.")
+    if after is not None and sort_by is None:
+        raise ValueError("Paging with `after` needs a sort_by column.")
+    if fields:
+        unknown_fields = [field for field in fields if field not in HEADERS]
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown_fields)}")
+    return get_repository(filepath).query(
+        problem_type=problem_type, sort_by=sort_by, descending=descending,
+        offset=offset, limit=limit, fields=fields, after=after
+    )
+
+def save_problems(problems, filepath=DEFAULT_FILEPATH):
+    """
+    Saves the list of problem dictionaries back to the CSV file.
+    Ensures the header row is written correctly.
+    """
+    get_repository(filepath).replace_all(problems)
 
 def _generate_problem_id(existing_ids):
     """
     Generates a new unique problem ID (e.g., "P001", "P002").
     Starts from "P001" if no IDs exist.
+    Scans every ID; the repositories use ProblemIdAllocator instead, which is O(1)
+    and never hands out the ID of a deleted problem again.
     """
-    if not existing_ids:
-        return "P001"
-
-    max_num = 0
-    for problem_id in existing_ids:
-        if problem_id.startswith("P") and problem_id[1:].isdigit():
-            num = int(problem_id[1:])
-            if num > max_num:
-                max_num = num
-    return f"P{max_num + 1:03d}"
+    max_num = max((_problem_id_number(problem_id) or 0 for problem_id in existing_ids), default=0)
+    return _format_problem_id(max_num + 1)
 
 def add_problem(problem_text, problem_type, answer, source="", filepath=DEFAULT_FILEPATH):
     """
     Adds a new problem to the CSV file.
     Generates a unique problem_id, creates a new problem dictionary,
-    appends it to the list, and saves the updated list.
+    stores it in the repository, and writes it through to disk.
     Returns the newly added problem dictionary.
     """
-    problems = load_problems(filepath=filepath)
-    existing_ids = [p['problem_id'] for p in problems if 'problem_id' in p]
-
-    new_id = _generate_problem_id(existing_ids)
-    current_time_iso = datetime.now(timezone.utc).isoformat()
-
-    new_problem = {
-        "problem_id": new_id,
-        "problem_text": problem_text,
-        "problem_type": problem_type,
-        "answer": answer,
-        "solution_steps_gemini": "",  # Initially empty
-        "source": source,
-        "created_time": current_time_iso,
-        "updated_time": current_time_iso
-    }
+    return get_repository(filepath).add(problem_text, problem_type, answer, source)
 
-    problems.append(new_problem)
-    save_problems(problems, filepath=filepath)
-    return new_problem
+def add_problems(problems, filepath=DEFAULT_FILEPATH):
+    """
+    Bulk variant of add_problem: takes an iterable of problem dicts (problem_text, problem_type,
+    answer, optional source/solution_steps_gemini), allocates all IDs at once and commits them with a
+    single write. Returns the new problems, in input order, with contiguous IDs.
+    """
+    return get_repository(filepath).add_many(problems)
 
 def get_problem_by_id(problem_id_to_find, filepath=DEFAULT_FILEPATH):
     """
-    Loads problems and searches for a problem by its ID.
+    Looks up a problem by its ID in the in-memory index.
     Returns the problem dictionary if found, None otherwise.
     """
-    problems = load_problems(filepath=filepath)
-    for problem in problems:
-        if problem.get('problem_id') == problem_id_to_find:
-            return problem
-    return None
+    return get_repository(filepath).get(problem_id_to_find)
 
 def update_problem_solution(problem_id_to_update, solution_steps, filepath=DEFAULT_FILEPATH):
     """
-    Updates the solution_steps_gemini field for a given problem_id.
-    Loads problems, finds the problem, updates it, and saves the list.
+    Updates the solution_steps_gemini field (and updated_time) for a given problem_id.
     Returns True if successful, False otherwise.
     """
-    problems = load_problems(filepath=filepath)
-    problem_found = False
-    for problem in problems:
-        if problem.get('problem_id') == problem_id_to_update:
-            problem['solution_steps_gemini'] = solution_steps
-            problem_found = True
-            break
+    return get_repository(filepath).update_solution(problem_id_to_update, solution_steps)
 
-    if problem_found:
-        save_problems(problems, filepath=filepath)
-        return True
-    return False
+def update_problem_solutions(solutions, filepath=DEFAULT_FILEPATH):
+    """
+    Bulk variant of update_problem_solution.
+    Takes a {problem_id: solution_steps} dict and commits every update with a single write.
+    Returns the list of problem IDs that were found and updated.
+    """
+    return get_repository(filepath).update_solutions(solutions)
+
+def update_problem(problem_id, fields, filepath=DEFAULT_FILEPATH):
+    """
+    Updates the given UPDATABLE_FIELDS of one problem (other keys are ignored) and bumps updated_time.
+    Returns the updated problem, or None if it doesn't exist.
+    """
+    return get_repository(filepath).update_many({problem_id: fields})[problem_id]
+
+def update_problems(patches, filepath=DEFAULT_FILEPATH):
+    """
+    Bulk update: {problem_id: {field: value}} applied in one write with a single updated_time.
+    Returns {problem_id: updated problem or None if not found}.
+    """
+    return get_repository(filepath).update_many(patches)
+
+def update_problems_matching(fields, problem_type=None, source=None, filepath=DEFAULT_FILEPATH):
+    """
+    Applies the same field changes to every problem with the given problem_type (case-insensitive)
+    and/or source, selected and written atomically. Returns the updated problems.
+    """
+    return get_repository(filepath).update_matching(fields, problem_type=problem_type, source=source)
+
+def delete_problems(problem_ids, filepath=DEFAULT_FILEPATH):
+    """Bulk delete with one write. Returns the IDs that were found and deleted."""
+    return get_repository(filepath).delete_many(problem_ids)
+
+def delete_problems_matching(problem_type=None, source=None, filepath=DEFAULT_FILEPATH):
+    """Deletes every problem with the given problem_type (case-insensitive) and/or source. Returns their IDs."""
+    return get_repository(filepath).delete_matching(problem_type=problem_type, source=source)
 
 def delete_problem(problem_id_to_delete, filepath=DEFAULT_FILEPATH):
     """
     Deletes a problem from the CSV file based on its ID.
     Returns True if the problem was found and deleted, False otherwise.
     """
-    problems = load_problems(filepath=filepath)
-    initial_problem_count = len(problems)
+    return get_repository(filepath).delete(problem_id_to_delete)
 
-    # Filter out the problem to delete
-    problems_after_deletion = [
-        p for p in problems if p.get('problem_id') != problem_id_to_delete
-    ]
-
-    if len(problems_after_deletion) < initial_problem_count:
-        # A problem was removed
-        save_problems(problems_after_deletion, filepath=filepath)
-        return True
-    else:
-        # No problem was removed, meaning the ID was not found
-        return False
+def _stress_worker(filepath, worker_number, count):
+    """Used by the multi-process stress test below: adds `count` problems, then solves each one."""
+    added_ids = []
+    for i in range(count):
+        added_ids.append(add_problem(f"Worker {worker_number} problem {i}", "stress", str(i), filepath=filepath)['problem_id'])
+    for problem_id in added_ids:
+        assert update_problem_solution(problem_id, f"Solved by worker {worker_number}", filepath=filepath)
 
 if __name__ == '__main__':
     # Example Usage and Basic Tests
@@ -169,8 +945,9 @@ if __name__ == '__main__':
 
     # Ensure the CSV is clean for testing
     test_file = "data/test_problems.csv"
-    if os.path.exists(test_file):
-        os.remove(test_file)
+    for leftover in (test_file, test_file + ".journal", test_file + ".seq", os.path.splitext(test_file)[0] + ".db"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
 
     _initialize_csv(test_file) # Create it with headers
 
@@ -214,10 +991,49 @@ if __name__ == '__main__':
     print(f"Updated P001: {updated_p1}")
     assert updated_p1['solution_steps_gemini'] == "Step 1: 2, Step 2: Add 2, Step 3: Equals 4"
 
+    bulk_updated = update_problem_solutions({"P001": "Bulk steps", "P002": "Paris is the capital.", "P999": "x"}, filepath=test_file)
+    assert sorted(bulk_updated) == ["P001", "P002"], bulk_updated
+    assert get_problem_by_id("P002", filepath=test_file)['solution_steps_gemini'] == "Paris is the capital."
+    update_problem_solution("P002", "", filepath=test_file)
+    update_problem_solution("P001", "Step 1: 2, Step 2: Add 2, Step 3: Equals 4", filepath=test_file)
+
     update_fail = update_problem_solution("P999", "No steps", filepath=test_file)
     print(f"Update P999 success: {update_fail}")
     assert not update_fail
 
+    # Test the data version used for ETags and caches
+    print("\nTesting get_data_version...")
+    version_before = get_data_version(filepath=test_file)
+    assert version_before == get_data_version(filepath=test_file), "Version must be stable without writes"
+    solved_before = get_problem_by_id("P001", filepath=test_file)
+    update_problem_solution("P001", "Step 1: 2, Step 2: Add 2, Step 3: Equals 4", filepath=test_file)
+    assert get_data_version(filepath=test_file) != version_before, "Version must change on every write"
+    assert get_problem_by_id("P001", filepath=test_file)['updated_time'] >= solved_before['updated_time']
+    assert get_last_modified(filepath=test_file) is not None
+
+    assert [p['problem_id'] for p in iter_problems(problem_type="Arithmetic", filepath=test_file)] == ["P001"]
+
+    # Test query_problems: filter, sort, paging and projection
+    print("\nTesting query_problems...")
+    newest_first = query_problems(sort_by="created_time", descending=True, filepath=test_file)
+    assert [p['problem_id'] for p in newest_first] == ["P002", "P001"]
+    first_page = query_problems(limit=1, fields=["problem_id", "problem_type"], filepath=test_file)
+    assert first_page == [{"problem_id": "P001", "problem_type": "arithmetic"}]
+    assert [p['problem_id'] for p in query_problems(offset=1, limit=5, filepath=test_file)] == ["P002"]
+    assert query_problems(problem_type="GEOGRAPHY", fields=["problem_id"], filepath=test_file) == [{"problem_id": "P002"}]
+    # Keyset paging: a page starts after the (sort value, problem_id) of the previous page's last row
+    oldest = query_problems(sort_by="created_time", limit=1, filepath=test_file)[0]
+    after = (oldest['created_time'], oldest['problem_id'])
+    assert [p['problem_id'] for p in query_problems(sort_by="created_time", after=after, filepath=test_file)] == ["P002"]
+    assert query_problems(sort_by="created_time", descending=True, after=after, filepath=test_file) == []
+    assert _sort_key("2024", "P999") < _sort_key("2024", "P1000") < _sort_key("2025", "P001")
+    for bad_arguments in ({"sort_by": "answer"}, {"fields": ["no_such_field"]}, {"after": ("", "P001")}):
+        try:
+            query_problems(filepath=test_file, **bad_arguments)
+            assert False, f"Expected ValueError for {bad_arguments}"
+        except ValueError:
+            pass
+
     # Test _generate_problem_id robustness
     print("\nTesting _generate_problem_id...")
     assert _generate_problem_id([]) == "P001"
@@ -227,6 +1043,19 @@ if __name__ == '__main__':
     assert _generate_problem_id(["XYZ", "P001"]) == "P002" # Ignores malformed IDs
     assert _generate_problem_id(["P001", "P002", "P003", "P004", "P005", "P006", "P007", "P008", "P009"]) == "P010"
     assert _generate_problem_id(["P099"]) == "P100"
+    assert _generate_problem_id(["P999"]) == "P1000"
+
+    # Test the persisted ID allocator
+    print("\nTesting ProblemIdAllocator...")
+    import tempfile
+    allocator_dir = tempfile.mkdtemp(prefix="problem_ids_")
+    allocator = ProblemIdAllocator(os.path.join(allocator_dir, "problems.csv.seq"))
+    assert allocator.allocate(floor=2) == ["P003"] # Missing counter is seeded from the data
+    assert allocator.allocate(count=3) == ["P004", "P005", "P006"]
+    assert allocator.allocate(floor=1) == ["P007"] # A lower floor never moves the counter back
+    assert ProblemIdAllocator(allocator.counter_path).allocate() == ["P008"] # Survives restarts
+    assert allocator.allocate(floor=998) == ["P999"]
+    assert allocator.allocate() == ["P1000"]
 
     # Test delete_problem
     print("\nTesting delete_problem...")
@@ -238,6 +1067,50 @@ if __name__ == '__main__':
     deleted_problem = get_problem_by_id("P003", filepath=test_file)
     assert deleted_problem is None, "Problem P003 should have been deleted"
 
+    # The ID of the deleted problem is not handed out again
+    reused_check = add_problem("Problem after a delete", "temp", "ans", filepath=test_file)
+    assert reused_check['problem_id'] == "P004", f"Expected P004, got {reused_check['problem_id']}"
+    assert delete_problem("P004", filepath=test_file)
+
+    # Bulk add: contiguous IDs, one write, input order kept
+    print("\nTesting add_problems...")
+    version_before = get_data_version(filepath=test_file)
+    bulk_added = add_problems([
+        {"problem_text": "1 + 1", "problem_type": "arithmetic", "answer": "2", "problem_id": "ignored"},
+        {"problem_text": "2 + 2", "problem_type": "arithmetic", "answer": "4", "source": "bulk"},
+    ], filepath=test_file)
+    assert [p['problem_id'] for p in bulk_added] == ["P005", "P006"], bulk_added
+    assert get_problem_by_id("P006", filepath=test_file)['source'] == "bulk"
+    assert get_data_version(filepath=test_file) != version_before
+    assert add_problems([], filepath=test_file) == []
+    for problem in bulk_added:
+        assert delete_problem(problem['problem_id'], filepath=test_file)
+
+    # Bulk update and delete
+    print("\nTesting bulk update/delete...")
+    bulk_added = add_problems([
+        {"problem_text": "3 + 3", "problem_type": "Bulk", "answer": "6", "source": "book A"},
+        {"problem_text": "4 + 4", "problem_type": "bulk", "answer": "8", "source": "book B"},
+        {"problem_text": "5 + 5", "problem_type": "other", "answer": "10", "source": "book A"},
+    ], filepath=test_file)
+    ids = [p['problem_id'] for p in bulk_added]
+    updated = update_problem(ids[0], {"answer": 6, "problem_id": "ignored"}, filepath=test_file)
+    assert updated['answer'] == "6" and updated['problem_id'] == ids[0]
+    assert update_problem("P999", {"answer": "1"}, filepath=test_file) is None
+    results = update_problems({ids[0]: {"source": "book C"}, "P999": {"source": "x"}}, filepath=test_file)
+    assert results["P999"] is None and results[ids[0]]['source'] == "book C"
+    retagged = update_problems_matching({"problem_type": "Addition"}, problem_type="BULK", filepath=test_file)
+    assert sorted(p['problem_id'] for p in retagged) == ids[:2]
+    assert len({p['updated_time'] for p in retagged}) == 1, "One commit, one timestamp"
+    assert get_problem_by_id(ids[1], filepath=test_file)['problem_type'] == "Addition"
+    try:
+        delete_problems_matching(filepath=test_file)
+        assert False, "Unfiltered bulk delete must be refused"
+    except ValueError:
+        pass
+    assert delete_problems_matching(source="book A", filepath=test_file) == [ids[2]]
+    assert sorted(delete_problems(ids + ["P999"], filepath=test_file)) == ids[:2]
+
     all_problems_after_delete = load_problems(filepath=test_file)
     print(f"All problems after deleting P003: {all_problems_after_delete}")
     assert len(all_problems_after_delete) == 2, f"Expected 2 problems after deleting P003, got {len(all_problems_after_delete)}"
@@ -247,6 +1120,85 @@ if __name__ == '__main__':
     print(f"Deletion of P999 success: {delete_fail_non_existent}")
     assert not delete_fail_non_existent
 
+    # Test that the repository picks up changes made to the file behind its back
+    # (only meaningful for the file-based backends)
+    if _configured_backend() != "sqlite":
+        print("\nTesting external file change detection...")
+        external_rows = load_problems(filepath=test_file)
+        external_rows.append({
+            "problem_id": "P050", "problem_text": "Edited outside the repository", "problem_type": "temp",
+            "answer": "x", "solution_steps_gemini": "", "source": "external",
+            "created_time": "", "updated_time": ""
+        })
+        _write_problems_csv(external_rows, test_file)
+        os.utime(test_file, ns=(0, 0)) # Force a different mtime even on coarse-grained filesystems
+        assert get_problem_by_id("P050", filepath=test_file) is not None, "Expected reload after external write"
+        assert delete_problem("P050", filepath=test_file)
+        assert len(load_problems(filepath=test_file)) == 2
+
+    # Returned problems are copies; mutating them must not leak into the cache
+    copy_p1 = get_problem_by_id("P001", filepath=test_file)
+    copy_p1['problem_text'] = "mutated"
+    assert get_problem_by_id("P001", filepath=test_file)['problem_text'] == "What is 2+2?"
+
+    # Test the journal backend: replay, background compaction and adoption of an existing CSV
+    print("\nTesting journal storage backend...")
+    import shutil
+    import tempfile
+    journal_dir = tempfile.mkdtemp(prefix="problem_journal_")
+    journal_file = os.path.join(journal_dir, "problems.csv")
+    _write_problems_csv(load_problems(filepath=test_file), journal_file) # Existing CSV becomes the snapshot unchanged
+    journal_repo = ProblemRepository(journal_file, storage=JournalStorage(journal_file, compact_threshold=3))
+    assert len(journal_repo.list_problems()) == 2
+    journal_events = []
+    journal_repo.add_listener(lambda changes, before, after: journal_events.append((changes and [op for op, _ in changes], before, after)))
+    snapshot_version, snapshot_rows = journal_repo.snapshot()
+    assert snapshot_version == journal_repo.data_version() and len(snapshot_rows) == 2
+    journal_p3 = journal_repo.add("Journaled problem", "temp", "ans")
+    assert journal_repo.update_solution(journal_p3['problem_id'], "Journaled steps")
+    assert os.path.exists(journal_file + ".journal"), "Expected mutations to go to the journal"
+    assert len(_read_problems_csv(journal_file)) == 2, "Snapshot should be untouched before compaction"
+
+    replayed = ProblemRepository(journal_file, storage=JournalStorage(journal_file, compact_threshold=3))
+    assert replayed.get(journal_p3['problem_id'])['solution_steps_gemini'] == "Journaled steps"
+
+    assert journal_repo.delete("P002") # Third record crosses the threshold and compacts in the background
+    journal_repo._compaction_thread.join(timeout=10)
+    assert not os.path.exists(journal_file + ".journal")
+    compacted_rows = _read_problems_csv(journal_file)
+    assert [row['problem_id'] for row in compacted_rows] == ["P001", journal_p3['problem_id']]
+    assert replayed.get("P002") is None, "Other repositories should reload after compaction"
+    # Listeners see every write, with versions that chain (compaction reports an empty change)
+    assert [ops for ops, _, _ in journal_events][:3] == [["put"], ["put"], ["delete"]]
+    assert journal_events[0][1] == snapshot_version and journal_events[-1][2] == journal_repo.data_version()
+    assert all(event[2] == following[1] for event, following in zip(journal_events, journal_events[1:]))
+    shutil.rmtree(journal_dir)
+
+    # Multi-process stress test: concurrent read-modify-write cycles must not lose updates
+    print("\nRunning multi-process stress test...")
+    import multiprocessing
+    stress_dir = tempfile.mkdtemp(prefix="problem_stress_")
+    stress_file = os.path.join(stress_dir, "problems.csv")
+    workers, per_worker = 6, 15
+    processes = [
+        multiprocessing.Process(target=_stress_worker, args=(stress_file, n, per_worker))
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0, f"Stress worker failed with exit code {process.exitcode}"
+    stress_problems = load_problems(filepath=stress_file)
+    stress_ids = [p['problem_id'] for p in stress_problems]
+    assert len(stress_problems) == workers * per_worker, f"Lost inserts: {len(stress_problems)} of {workers * per_worker}"
+    assert len(set(stress_ids)) == len(stress_ids), "Duplicate problem IDs handed out"
+    assert all(p['solution_steps_gemini'].startswith("Solved by worker") for p in stress_problems), "Lost solution updates"
+    leftover_temp_files = [name for name in os.listdir(stress_dir) if name.endswith(".tmp")]
+    assert not leftover_temp_files, leftover_temp_files
+    shutil.rmtree(stress_dir)
+    print(f"Stress test passed: {len(stress_ids)} problems from {workers} processes, no lost updates.")
+
     # Test loading from default file (ensure it uses the default path correctly)
     # This requires `data/problems.csv` to be potentially modified by these tests if not careful
     # For now, we'll stick to test_file for explicit operations.
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process coordination, in-process limits still apply
+    fcntl = None
+
+from problem_manager import interprocess_lock
+
+logger = logging.getLogger(__name__)
+
+class ThrottleTimeout(Exception):
+    """Raised when a caller waited `timeout` seconds without getting capacity."""
+
+class Throttle:
+    """
+    Token-bucket rate limiter combined with a cap on concurrent calls.
+
+    `slot(timeout)` is a context manager: it waits for one of `max_in_flight` slots and then for a token
+    (the bucket refills at `rate_per_minute`, holding at most `burst` tokens), and releases the slot on
+    exit. Callers queue instead of failing; only a wait longer than `timeout` raises ThrottleTimeout.
+
+    With `state_dir` set, both limits are shared by every process using that directory: the bucket
+    lives in a small JSON file updated under flock, and each in-flight slot is an flock'd file, so
+    a crashed process gives its slots back automatically. Without it (or without fcntl) the limits
+    apply per process.
+    """
+
+    def __init__(self, rate_per_minute=60, burst=10, max_in_flight=4, timeout=60.0, state_dir=None,
+                 poll_interval=0.05):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self.state_dir = state_dir if (state_dir and fcntl is not None) else None
+        self.poll_interval = poll_interval
+        self._semaphore = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._stats = {
+            "acquired": 0, "timeouts": 0, "waiting": 0, "max_waiting": 0, "in_flight": 0,
+            "throttled": 0, "throttle_seconds": 0.0, "max_throttle_seconds": 0.0,
+        }
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._bucket_path = os.path.join(self.state_dir, "bucket.json")
+
+    # --- token bucket ----------------------------------------------------
+
+    def _take_local_token(self):
+        """Takes a token if one is available; otherwise returns seconds until the next one."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else self.poll_interval
+
+    def _take_shared_token(self):
+        """Same as _take_local_token, with the bucket state kept in a file shared by all processes."""
+        with interprocess_lock(self._bucket_path + ".lock"):
+            now = time.time()
+            try:
+                with open(self._bucket_path, mode='r', encoding='utf-8') as f:
+                    state = json.load(f)
+                tokens, updated = float(state["tokens"]), float(state["updated"])
+            except (OSError, ValueError, KeyError, TypeError):
+                tokens, updated = float(self.burst), now
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate if self.rate > 0 else self.poll_interval
+            # Tiny file rewritten in place; a torn write only resets the bucket to full
+            with open(self._bucket_path, mode='w', encoding='utf-8') as f:
+                json.dump({"tokens": tokens, "updated": now}, f)
+            return wait
+
+    def drain(self):
+        """Empties the bucket, e.g. after the API reported a quota error, so callers back off."""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+        if self.state_dir:
+            with interprocess_lock(self._bucket_path + ".lock"):
+                with open(self._bucket_path, mode='w', encoding='utf-8') as f:
+                    json.dump({"tokens": 0.0, "updated": time.time()}, f)
+
+    # --- in-flight slots -------------------------------------------------
+
+    def _try_shared_slot(self):
+        """Locks one of the slot files without blocking; returns its open file or None."""
+        for number in range(self.max_in_flight):
+            slot_file = open(os.path.join(self.state_dir, f"slot-{number}.lock"), 'a')
+            try:
+                fcntl.flock(slot_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except OSError:
+                slot_file.close()
+        return None
+
+    def _acquire(self, deadline):
+        """Waits for a slot and a token. Returns the shared slot file (or None), raises ThrottleTimeout."""
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise ThrottleTimeout("Timed out waiting for a free Gemini request slot")
+        slot_file = None
+        try:
+            if self.state_dir:
+                slot_file = self._try_shared_slot()
+                while slot_file is None:
+                    if time.monotonic() >= deadline:
+                        raise ThrottleTimeout("Timed out waiting for a free Gemini request slot")
+                    time.sleep(self.poll_interval)
+                    slot_file = self._try_shared_slot()
+            take_token = self._take_shared_token if self.state_dir else self._take_local_token
+            wait = take_token()
+            while wait > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ThrottleTimeout("Timed out waiting for Gemini rate limit capacity")
+                time.sleep(min(wait, remaining))
+                wait = take_token()
+            return slot_file
+        except BaseException:
+            if slot_file is not None:
+                slot_file.close()
+            self._semaphore.release()
+            raise
+
+    @contextmanager
+    def slot(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._lock:
+            self._stats["waiting"] += 1
+            self._stats["max_waiting"] = max(self._stats["max_waiting"], self._stats["waiting"])
+        try:
+            slot_file = self._acquire(started + timeout)
+        except ThrottleTimeout:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                self._stats["waiting"] -= 1
+                self._stats["throttle_seconds"] += waited
+                self._stats["max_throttle_seconds"] = max(self._stats["max_throttle_seconds"], waited)
+                if waited >= self.poll_interval:
+                    self._stats["throttled"] += 1
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["in_flight"] += 1
+        try:
+            yield
+        finally:
+            if slot_file is not None:
+                slot_file.close() # Releases the flock
+            self._semaphore.release()
+            with self._lock:
+                self._stats["in_flight"] -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["throttle_seconds"] = round(stats["throttle_seconds"], 3)
+        stats["max_throttle_seconds"] = round(stats["max_throttle_seconds"], 3)
+        stats.update(rate_per_minute=self.rate * 60, burst=self.burst, max_in_flight=self.max_in_flight,
+                     shared=bool(self.state_dir))
+        return stats
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("Running basic tests for rate_limiter...")
+
+    # Burst passes immediately, after that calls are spaced by the refill rate
+    throttle = Throttle(rate_per_minute=600, burst=2, max_in_flight=10, timeout=5)
+    started = time.monotonic()
+    for _ in range(4):
+        with throttle.slot():
+            pass
+    elapsed = time.monotonic() - started
+    assert 0.15 <= elapsed < 1.0, elapsed # 2 free tokens, then 2 x 0.1s
+
+    # The in-flight cap holds under concurrency
+    throttle = Throttle(rate_per_minute=60000, burst=100, max_in_flight=2, timeout=5)
+    peak = {"now": 0, "max": 0}
+    peak_lock = threading.Lock()
+
+    def call():
+        with throttle.slot():
+            with peak_lock:
+                peak["now"] += 1
+                peak["max"] = max(peak["max"], peak["now"])
+            time.sleep(0.02)
+            with peak_lock:
+                peak["now"] -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: call(), range(16)))
+    assert peak["max"] == 2, peak
+    stats = throttle.stats()
+    assert stats["acquired"] == 16 and stats["max_waiting"] > 2 and stats["in_flight"] == 0, stats
+
+    # Waiting is bounded
+    throttle = Throttle(rate_per_minute=1, burst=1, max_in_flight=1)
+    with throttle.slot():
+        pass
+    try:
+        with throttle.slot(timeout=0.1):
+            assert False, "No token should be available"
+    except ThrottleTimeout:
+        pass
+    assert throttle.stats()["timeouts"] == 1
+
+    # Shared state: two throttles over one directory behave like one
+    if fcntl is not None:
+        state_dir = tempfile.mkdtemp(prefix="throttle_")
+        first = Throttle(rate_per_minute=1, burst=1, max_in_flight=1, state_dir=state_dir)
+        second = Throttle(rate_per_minute=1, burst=1, max_in_flight=1, state_dir=state_dir)
+        with first.slot():
+            try:
+                with second.slot(timeout=0.1):
+                    assert False, "The only shared slot is taken"
+            except ThrottleTimeout:
+                pass
+        try:
+            with second.slot(timeout=0.1):
+                assert False, "The shared bucket is empty"
+        except ThrottleTimeout:
+            pass
+        shutil.rmtree(state_dir)
+
+    print(f"Throttle stats: {throttle.stats()}")
+    print("Basic tests for rate_limiter completed.")
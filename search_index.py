@@ -0,0 +1,719 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import logging
+import operator
+import itertools
+import threading
+from array import array
+
+from problem_manager import DEFAULT_FILEPATH, get_repository
+
+logger = logging.getLogger(__name__)
+
+# Indexed fields and how much a query term found in each counts towards a result's score
+FIELD_WEIGHTS = (("problem_text", 3), ("answer", 2), ("solution_steps_gemini", 1))
+DEFAULT_SEARCH_LIMIT = 20
+# Totals that would take testing more documents than twice this are estimated from this many
+COUNT_SAMPLE_SIZE = 64
+# Postings are compacted once tombstoned documents outnumber live ones, or out-of-order documents
+# exceed a sixteenth of them, but never for fewer than this many
+MIN_COMPACT_DEAD = 1000
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff" # Kana and CJK ideographs
+# A run of CJK characters, or a word of letters/digits
+_RUN_RE = re.compile(f"[{_CJK}]+|[^\\W_{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+# Full-width ASCII forms (common in Chinese input: １２，ＡＢ) and the ideographic space to ASCII
+_FULL_WIDTH = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_FULL_WIDTH[0x3000] = 0x20
+
+def normalize(text):
+    """Folds full-width characters to ASCII and case. (A table lookup; NFKC is much slower on CJK text.)"""
+    return (text or "").translate(_FULL_WIDTH).casefold()
+
+def _runs(normalized_text):
+    return _RUN_RE.findall(normalized_text)
+
+def _tokens(normalized_text):
+    tokens = set()
+    for run in _runs(normalized_text):
+        if len(run) > 1 and _CJK_RE.match(run):
+            tokens.update(map(operator.add, run, run[1:]))
+        else:
+            tokens.add(run)
+    return tokens
+
+def tokenize(text):
+    """
+    Index terms of a text: words of letters/digits as they are, and for Chinese (CJK runs,
+    which have no spaces between words) every character bigram. A CJK character standing
+    alone is a term by itself; single characters inside longer runs are found via the bigrams.
+    """
+    return _tokens(normalize(text))
+
+def _contains(posting, number):
+    position = bisect.bisect_left(posting, number)
+    return position < len(posting) and posting[position] == number
+
+def _is_term(run):
+    """Whether a query run is an index term itself (a word, or two CJK characters)."""
+    return len(run) == 2 or not _CJK_RE.match(run)
+
+def _run_terms(run):
+    """The index terms a run is found through: its bigrams if it is a CJK phrase."""
+    if len(run) > 2 and _CJK_RE.match(run):
+        return set(map(operator.add, run, run[1:]))
+    return {run}
+
+def _intersect(postings):
+    """Numbers in every one of the sorted postings, in order. Skips ahead by binary search."""
+    postings = sorted(postings, key=len)
+    positions = [0] * len(postings)
+    target = postings[0][0] if postings[0] else None
+    while target is not None:
+        for i, posting in enumerate(postings):
+            position = positions[i] = bisect.bisect_left(posting, target, positions[i])
+            if position == len(posting):
+                return
+            if posting[position] != target:
+                target = posting[position]
+                break
+        else:
+            yield target
+            target += 1
+
+def _union(postings):
+    """Numbers in any of the sorted postings, in order."""
+    return (number for number, _ in itertools.groupby(heapq.merge(*postings)))
+
+def _holds(clause, number):
+    """Whether a live document has a clause's run in its field (see SearchIndex._clauses)."""
+    _, postings, _, test = clause
+    return test(number) if test is not None else _contains(postings[0], number)
+
+def _score(clauses, number):
+    """A live document's score from the clauses of SearchIndex._clauses; 0 if a run is missing."""
+    score = 0
+    for run_clauses in clauses:
+        run_score = sum(clause[0] for clause in run_clauses if _holds(clause, number))
+        if not run_score:
+            return 0
+        score += run_score
+    return score
+
+def _restrict(posting, candidates):
+    """The candidates (a set) that are in a sorted posting (or a set of numbers)."""
+    if posting is None:
+        return set()
+    if isinstance(posting, array) and len(candidates) * 16 < len(posting):
+        # Few candidates: binary search the posting instead of reading it all
+        return {number for number in candidates if _contains(posting, number)}
+    return candidates.intersection(posting)
+
+def _id_rank(problem_id):
+    """Problem ID order (P999 before P1000)."""
+    return len(problem_id), problem_id
+
+def _rank_key(hit):
+    """Best score first, then problem ID order."""
+    problem_id, score = hit
+    return -score, len(problem_id), problem_id
+
+class _IndexData:
+    """
+    Postings and documents of one index generation.
+
+    Documents are numbered in problem ID order as they are added, so among documents with the
+    same score the lowest numbers rank first. A problem that is re-indexed, or added with a lower
+    ID than the last one, gets the next number anyway and is remembered as out of order; compact()
+    renumbers everything in ID order again.
+    """
+
+    def __init__(self):
+        self.postings = {}       # term -> sorted array of document numbers (any field)
+        self.field_postings = tuple({} for _ in FIELD_WEIGHTS) # the same, per field
+        self.char_bigrams = {}   # CJK character -> bigram terms containing it
+        self.documents = {}      # document number -> (problem_id, problem_type, fingerprint, normalized texts...)
+        self.numbers = {}        # problem_id -> document number
+        self.types = {}          # problem_type -> set of document numbers
+        self.tombstones = set()  # numbers of replaced or deleted documents still in the postings
+        self.out_of_order = set()
+        self.last_rank = None
+        self.next_number = 0
+
+    def put(self, problem):
+        """(Re)indexes a problem; a no-op if none of its indexed fields changed."""
+        problem_id = problem.get('problem_id')
+        if not problem_id:
+            return
+        raw = tuple(problem.get(field) or "" for field, _ in FIELD_WEIGHTS)
+        problem_type = (problem.get('problem_type') or '').lower()
+        fingerprint = hash(raw)
+        number = self.numbers.get(problem_id)
+        if number is not None:
+            document = self.documents[number]
+            if document[2] == fingerprint and document[1] == problem_type:
+                return
+            self.remove(problem_id)
+        number = self._add_document((problem_id, problem_type, fingerprint) + tuple(normalize(text) for text in raw))
+        field_terms = [_tokens(text) for text in self.documents[number][3:]]
+        postings = self.postings
+        for term in set().union(*field_terms):
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = array('I')
+                if len(term) == 2 and _CJK_RE.match(term):
+                    for char in set(term):
+                        self.char_bigrams.setdefault(char, []).append(term)
+            posting.append(number)
+        for field_postings, terms in zip(self.field_postings, field_terms):
+            for term in terms:
+                posting = field_postings.get(term)
+                if posting is None:
+                    posting = field_postings[term] = array('I')
+                posting.append(number)
+
+    def _add_document(self, document):
+        number = self.next_number
+        self.next_number += 1
+        rank = _id_rank(document[0])
+        if self.last_rank is None or rank > self.last_rank:
+            self.last_rank = rank
+        else:
+            self.out_of_order.add(number)
+        self.documents[number] = document
+        self.numbers[document[0]] = number
+        self.types.setdefault(document[1], set()).add(number)
+        return number
+
+    def ids(self):
+        return self.numbers.keys()
+
+    def remove(self, problem_id):
+        number = self.numbers.pop(problem_id, None)
+        if number is not None:
+            document = self.documents.pop(number)
+            self.types[document[1]].discard(number)
+            self.out_of_order.discard(number)
+            self.tombstones.add(number)
+
+    def needs_compaction(self):
+        return (len(self.tombstones) > max(MIN_COMPACT_DEAD, len(self.documents))
+                or len(self.out_of_order) > max(MIN_COMPACT_DEAD, len(self.documents) // 16))
+
+    def compact(self):
+        """Drops tombstoned document numbers from every posting and renumbers documents in ID order."""
+        order = sorted(self.documents, key=lambda number: _id_rank(self.documents[number][0]))
+        renumbered = {old: new for new, old in enumerate(order)}
+        for postings in (self.postings,) + self.field_postings:
+            for term, posting in list(postings.items()):
+                live = sorted(renumbered[number] for number in posting if number in renumbered)
+                if live:
+                    postings[term] = array('I', live)
+                else:
+                    del postings[term]
+        for char, terms in list(self.char_bigrams.items()):
+            terms[:] = [term for term in terms if term in self.postings]
+            if not terms:
+                del self.char_bigrams[char]
+        documents = [self.documents[number] for number in order]
+        self.documents = {}
+        self.numbers = {}
+        self.types = {}
+        self.tombstones = set()
+        self.out_of_order = set()
+        self.last_rank = None
+        self.next_number = 0
+        for document in documents:
+            self._add_document(document)
+
+    def requirement(self, run):
+        """
+        What a query run needs: a list of postings that must all contain the document, or None
+        if nothing can match. A single CJK character matches the union of its bigrams.
+        """
+        if len(run) > 1 and _CJK_RE.match(run):
+            terms = set(map(operator.add, run, run[1:]))
+        elif _CJK_RE.match(run):
+            union = set(self.postings.get(run, ()))
+            for term in self.char_bigrams.get(run, ()):
+                union.update(self.postings.get(term, ()))
+            return [union] if union else None
+        else:
+            terms = {run}
+        postings = [self.postings.get(term) for term in terms]
+        return postings if all(posting is not None for posting in postings) else None
+
+    def field_matches(self, run, candidates):
+        """
+        For each field, the candidates whose field contains the run. For CJK phrases of three or
+        more characters these are the candidates having all its bigrams in the field; whether
+        they are adjacent still has to be checked on the text.
+        """
+        matches = []
+        for field_postings in self.field_postings:
+            if len(run) > 1 and _CJK_RE.match(run):
+                found = None
+                for term in set(map(operator.add, run, run[1:])):
+                    found = _restrict(field_postings.get(term), candidates if found is None else found)
+                    if not found:
+                        break
+            elif _CJK_RE.match(run):
+                found = _restrict(field_postings.get(run), candidates)
+                for term in self.char_bigrams.get(run, ()):
+                    found |= _restrict(field_postings.get(term), candidates)
+            else:
+                found = _restrict(field_postings.get(run), candidates)
+            matches.append(found)
+        return matches
+
+class BankIndex:
+    """
+    Base of in-memory indexes derived from a problem bank (search terms, duplicate signatures).
+
+    The index follows this process's writes through the repository's change listener. Queries
+    call ensure_current(), which compares the repository's data_version() with the version the
+    index has seen; after a change it could not apply (another worker process wrote, or the
+    whole bank was replaced) it compares a snapshot with its documents and re-indexes only the
+    problems that differ.
+
+    Subclasses set `data_class`: an object with put(problem) (a no-op for unchanged problems),
+    remove(problem_id), ids(), needs_compaction() and compact(). All access to self._data must
+    hold self._lock.
+    """
+
+    data_class = None
+    name = "Index"
+
+    def __init__(self, repository):
+        self._repository = repository
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._data = self.data_class()
+        self._version = None
+        self._built = False
+        self._stats = {"builds": 0, "syncs": 0, "sync_seconds": 0.0, "compactions": 0}
+        repository.add_listener(self._on_change)
+
+    def _apply(self, changes):
+        for op, problem in changes:
+            if op == "delete":
+                self._data.remove(problem.get('problem_id'))
+            else:
+                self._data.put(problem)
+        if self._data.needs_compaction():
+            self._data.compact()
+            self._stats["compactions"] += 1
+
+    def _on_change(self, changes, version_before, version_after):
+        """Repository listener, called after every write of this process."""
+        with self._lock:
+            if changes is not None and self._version is not None and version_before == self._version:
+                self._apply(changes)
+                self._version = version_after
+            else:
+                self._version = None # Missed a change; sync on the next query
+
+    def ensure_current(self):
+        if self._repository.data_version() != self._version:
+            self.sync()
+
+    def sync(self):
+        """
+        Brings the index up to date with a snapshot of the bank. The first build runs outside the
+        index lock so writers aren't held up; changes they make meanwhile are caught by the next sync.
+        """
+        with self._sync_lock:
+            if self._repository.data_version() == self._version:
+                return
+            started = time.monotonic()
+            version, problems = self._repository.snapshot()
+            if not self._built:
+                data = self.data_class()
+                for problem in problems:
+                    data.put(problem)
+                if data.needs_compaction():
+                    data.compact()
+                with self._lock:
+                    self._data = data
+                    self._version = version
+                    self._built = True
+                    self._stats["builds"] += 1
+            else:
+                with self._lock:
+                    current = set()
+                    for problem in problems:
+                        self._data.put(problem)
+                        current.add(problem.get('problem_id'))
+                    self._apply([("delete", {"problem_id": problem_id})
+                                 for problem_id in list(self._data.ids()) if problem_id not in current])
+                    self._version = version
+                    self._stats["syncs"] += 1
+            elapsed = time.monotonic() - started
+            self._stats["sync_seconds"] += elapsed
+        logger.info(f"{self.name} synced with {len(problems)} problems in {elapsed:.2f}s")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, documents=len(self._data.ids()), current=self._version is not None)
+        stats["sync_seconds"] = round(stats["sync_seconds"], 3)
+        return stats
+
+class SearchIndex(BankIndex):
+    """
+    In-memory inverted index over problem_text, answer and solution_steps_gemini of one problem bank.
+
+    Postings are append-only arrays of internal document numbers, so they stay compact and sorted.
+    A changed problem gets a new number and its old one becomes a tombstone (the journal pattern
+    again); once tombstones outnumber live documents the postings are rewritten without them.
+
+    A query matches problems containing every word and every CJK phrase of the query (phrases
+    are found through their bigrams and then checked as substrings). Results are ranked by
+    FIELD_WEIGHTS, then by problem ID.
+    """
+
+    data_class = _IndexData
+    name = "Search index"
+
+    def __init__(self, repository):
+        super().__init__(repository)
+        self._stats.update(queries=0, query_seconds=0.0)
+
+    # --- queries ---------------------------------------------------------
+
+    def search(self, query, problem_type=None, offset=0, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Returns (total number of matches, [(problem_id, score), ...] for the requested page,
+        whether the total is exact).
+
+        Scores come from per-field postings; CJK phrases of three or more characters and single
+        CJK characters are tested on the texts, but only for the documents a page needs. When
+        enough documents reach the best possible score (every run in every field where it occurs
+        at all) to fill the page, they are found by walking one posting in problem ID order and
+        the walk stops there. The total is then counted exactly when that is cheap (one word,
+        or few candidates) and otherwise estimated from a sample of COUNT_SAMPLE_SIZE candidates.
+        """
+        runs = list(dict.fromkeys(_runs(normalize(query))))
+        if not runs:
+            return 0, [], True
+        self.ensure_current()
+        started = time.perf_counter()
+        wanted = offset + limit
+        total, page, exact = 0, [], True
+        with self._lock:
+            data = self._data
+            clauses = self._clauses(runs)
+            allowed = data.types.get(problem_type.lower(), set()) if problem_type else None
+            if clauses is not None and allowed != set():
+                best = self._best_page(clauses, wanted, allowed)
+                if best is not None:
+                    page = best
+                    total, exact = self._count(runs, clauses, allowed)
+                else:
+                    candidates = self._candidates(runs)
+                    if candidates:
+                        candidates.difference_update(data.tombstones)
+                        if allowed is not None:
+                            candidates.intersection_update(allowed)
+                    if candidates:
+                        total, page, exact = self._rank(runs, clauses, candidates, wanted, allowed)
+            total = max(total, len(page)) # An estimate never undercuts what was found
+            self._stats["queries"] += 1
+            self._stats["query_seconds"] += time.perf_counter() - started
+        return total, page[offset:], exact
+
+    def _clauses(self, runs):
+        """
+        For each run, a (weight, postings, union, test) clause per field the run can occur in, or
+        None if some run occurs in no field at all. Every document with the run in that field is
+        in all of `postings` (sorted); for words and bigrams that settles it and test is None.
+        CJK phrases have their bigrams as postings and test(number) checks they are adjacent, in
+        the text. A single CJK character is in any of the postings listed in `union` and is
+        tested on the text too.
+        """
+        data = self._data
+        documents = data.documents
+
+        def in_text(run, index):
+            return lambda number: run in documents[number][index]
+
+        clauses = []
+        for run in runs:
+            cjk = _CJK_RE.match(run)
+            run_clauses = []
+            for field, ((_, weight), field_postings) in enumerate(zip(FIELD_WEIGHTS, data.field_postings)):
+                if cjk and len(run) == 1:
+                    terms = [run] + data.char_bigrams.get(run, [])
+                    union = [field_postings[term] for term in terms if term in field_postings]
+                    if union:
+                        run_clauses.append((weight, [], union, in_text(run, 3 + field)))
+                    continue
+                postings = [field_postings.get(term) for term in _run_terms(run)]
+                if any(posting is None for posting in postings):
+                    continue
+                run_clauses.append((weight, postings, None, in_text(run, 3 + field) if cjk and len(run) > 2 else None))
+            if not run_clauses:
+                return None
+            clauses.append(run_clauses)
+        return clauses
+
+    def _best_page(self, clauses, wanted, allowed):
+        """
+        The top `wanted` hits if at least that many documents (of the `allowed` set, if given)
+        have the best possible score, else None. Joins the postings all those documents are in,
+        in document (= problem ID) order, tests only what the postings leave open, and stops once
+        it has enough; out-of-order documents are checked separately.
+        """
+        data = self._data
+        documents = data.documents
+        out_of_order = data.out_of_order
+        required = [clause for run_clauses in clauses for clause in run_clauses]
+        best_score = sum(clause[0] for clause in required)
+        # A phrase's text test implies its bigrams, so only its rarest bigram joins the walk
+        postings = [min(clause[1], key=len) for clause in required if clause[1]]
+        tests = [clause[3] for clause in required if clause[3] is not None]
+
+        def is_best(number):
+            return (number in documents and (allowed is None or number in allowed)
+                    and all(test(number) for test in tests))
+
+        if postings:
+            numbers = _intersect(postings)
+        else: # Only single characters: walk the union of the smallest one's postings
+            numbers = _union(min((clause[2] for clause in required), key=lambda union: sum(map(len, union))))
+        found = []
+        for number in numbers:
+            if number not in out_of_order and is_best(number):
+                found.append(number)
+                if len(found) == wanted:
+                    break
+        found += [number for number in out_of_order
+                  if all(_contains(posting, number) for posting in postings) and is_best(number)]
+        if len(found) < wanted:
+            return None
+        return heapq.nsmallest(wanted, [(documents[number][0], best_score) for number in found], key=_rank_key)
+
+    def _count(self, runs, clauses, allowed):
+        """
+        (number of live documents matching, whether it is exact). A single word or bigram is
+        counted from its posting. Otherwise the matches are among the documents of the shortest
+        posting any run needs (or of the `allowed` set, if smaller): up to 2 * COUNT_SAMPLE_SIZE
+        of them are all tested, larger sets are estimated from evenly spaced samples.
+        """
+        data = self._data
+        documents = data.documents
+        if len(runs) == 1 and allowed is None and _is_term(runs[0]):
+            posting = data.postings[runs[0]]
+            return len(posting) - len(_restrict(posting, data.tombstones)), True
+        populations = [data.postings[term] for run in runs if len(run) > 1 or not _CJK_RE.match(run)
+                       for term in _run_terms(run)]
+        population = min(populations, key=len) if populations else range(data.next_number)
+        if allowed is not None and len(allowed) < len(population):
+            population = sorted(allowed)
+
+        def matches(number):
+            return (number in documents and (allowed is None or number in allowed)
+                    and all(any(_holds(clause, number) for clause in run_clauses) for run_clauses in clauses))
+
+        if len(population) <= 2 * COUNT_SAMPLE_SIZE:
+            return sum(1 for number in population if matches(number)), True
+        step = len(population) / COUNT_SAMPLE_SIZE
+        hits = sum(1 for i in range(COUNT_SAMPLE_SIZE) if matches(population[int(i * step)]))
+        return round(len(population) * hits / COUNT_SAMPLE_SIZE), False
+
+    def _rank(self, runs, clauses, candidates, wanted, allowed):
+        """
+        (total, top `wanted` hits, whether the total is exact) of a filtered candidate set.
+        Candidates are grouped by the score their postings give them and the page is filled from
+        the top group down, in ID order. A phrase's bigrams may not be adjacent, so with phrases
+        that score is only an upper bound: each document is tested as it is taken, and one that
+        scores less moves down to its actual group (or out, with no score at all).
+        """
+        data = self._data
+        documents = data.documents
+        verify = any(len(run) > 2 and _CJK_RE.match(run) for run in runs)
+        weighted = []
+        for run in runs:
+            matches = data.field_matches(run, candidates)
+            weighted += [(weight, found) for (_, weight), found in zip(FIELD_WEIGHTS, matches) if found]
+        groups = {}
+        for number in candidates:
+            score = 0
+            for weight, found in weighted:
+                if number in found:
+                    score += weight
+            if score: # Without, a phrase's bigrams are spread over several fields
+                groups.setdefault(score, set()).add(number)
+
+        def take(number, score):
+            """Whether the document really has this score; if not it is moved to the right group."""
+            if not verify:
+                return True
+            actual = _score(clauses, number)
+            if actual != score and actual:
+                groups.setdefault(actual, set()).add(number)
+            return actual == score
+
+        # Within a score the lowest numbers are the first IDs, apart from out-of-order documents
+        page = []
+        while groups and len(page) < wanted:
+            score = max(groups)
+            group = groups.pop(score)
+            ordered = list(group.difference(data.out_of_order))
+            heapq.heapify(ordered)
+            numbers = []
+            while ordered and len(numbers) < wanted - len(page):
+                number = heapq.heappop(ordered)
+                if take(number, score):
+                    numbers.append(number)
+            numbers += [number for number in group.intersection(data.out_of_order) if take(number, score)]
+            page += heapq.nsmallest(wanted - len(page), [(documents[number][0], score) for number in numbers],
+                                    key=_rank_key)
+        if not verify:
+            return len(candidates), page, True
+        if len(page) < wanted:
+            return len(page), page, True # Every candidate was tested
+        total, exact = self._count(runs, clauses, allowed)
+        return total, page, exact
+
+    def _candidates(self, runs):
+        """Live or tombstoned document numbers having every term of every run (a set), or None."""
+        postings = []
+        for run in runs:
+            requirement = self._data.requirement(run)
+            if requirement is None:
+                return None
+            postings.extend(requirement)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates = _restrict(posting, candidates)
+        return candidates
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(terms=len(self._data.postings), tombstones=len(self._data.tombstones))
+        query_seconds = stats.pop("query_seconds")
+        stats["avg_query_ms"] = round(query_seconds * 1000 / stats["queries"], 3) if stats["queries"] else 0.0
+        return stats
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_search_index(filepath=DEFAULT_FILEPATH):
+    """The search index of a problem bank, attached to its shared repository on first use."""
+    key = os.path.abspath(filepath)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = SearchIndex(get_repository(filepath))
+        return index
+
+def search_problems(query, problem_type=None, offset=0, limit=DEFAULT_SEARCH_LIMIT, filepath=DEFAULT_FILEPATH):
+    """
+    Full-text search. Returns {"total": n, "total_exact": bool, "items": [problem, ...]} with each
+    problem's "search_score" added, best matches first. A total that is expensive to count exactly
+    is estimated (see SearchIndex.search).
+    """
+    total, hits, exact = get_search_index(filepath).search(query, problem_type=problem_type, offset=offset, limit=limit)
+    repository = get_repository(filepath)
+    items = []
+    for problem_id, score in hits:
+        problem = repository.get(problem_id)
+        if problem is not None: # Deleted since the search
+            problem["search_score"] = score
+            items.append(problem)
+    return {"total": total, "total_exact": exact, "items": items}
+
+if __name__ == '__main__':
+    import random
+    import shutil
+    import tempfile
+    from problem_manager import add_problem, add_problems, update_problem_solution, update_problem, delete_problem
+
+    print("Running basic tests for search_index...")
+    assert tokenize("5个苹果 Apples") == {"5", "个苹", "苹果", "apples"}
+    assert tokenize("５") == {"5"}, "Full-width digits are normalized"
+
+    test_dir = tempfile.mkdtemp(prefix="search_index_")
+    filepath = os.path.join(test_dir, "problems.csv")
+    p1 = add_problem("小明有5个苹果，又买了3个苹果，一共有几个苹果？", "加法", "8", filepath=filepath)
+    p2 = add_problem("树上有10只鸟，飞走了4只，还剩几只？", "减法", "6", filepath=filepath)
+    p3 = add_problem("How many apples are left if you eat 2 of 7 apples?", "subtraction", "5", filepath=filepath)
+
+    def ids(query, **kwargs):
+        return [problem["problem_id"] for problem in search_problems(query, filepath=filepath, **kwargs)["items"]]
+
+    assert ids("苹果") == [p1["problem_id"]]
+    assert ids("果") == [p1["problem_id"]] and ids("鸟") == [p2["problem_id"]], "Single characters match too"
+    assert ids("apples") == [p3["problem_id"]] and ids("APPLES") == [p3["problem_id"]]
+    assert ids("苹果 鸟") == [], "All terms must match"
+    assert ids("飞走了") == [p2["problem_id"]]
+    assert ids("飞了") == [], "Phrases must be contiguous"
+    assert search_problems("飞走了", filepath=filepath)["total_exact"]
+    assert ids("苹果", problem_type="减法") == []
+    assert ids("") == [] and ids("？") == []
+
+    # Incremental updates through the repository listener, no re-sync
+    index = get_search_index(filepath)
+    syncs = index.stats()["syncs"]
+    update_problem_solution(p2["problem_id"], "用减法：10 - 4 = 6，还剩6只鸟。", filepath=filepath)
+    assert ids("减法") == [p2["problem_id"]]
+    update_problem(p1["problem_id"], {"problem_text": "小红有5个梨"}, filepath=filepath)
+    assert ids("苹果") == [] and ids("梨") == [p1["problem_id"]]
+    delete_problem(p3["problem_id"], filepath=filepath)
+    assert ids("apples") == []
+    assert index.stats()["syncs"] == syncs
+
+    # Ranking: a match in problem_text outweighs one in the solution; ties keep ID order
+    p4 = add_problem("鸟有几只？", "减法", "6", filepath=filepath)
+    assert [problem["search_score"] for problem in search_problems("鸟", filepath=filepath)["items"]] == [4, 3]
+    update_problem_solution(p4["problem_id"], "数一数鸟", filepath=filepath)
+    assert ids("鸟") == [p2["problem_id"], p4["problem_id"]]
+
+    # A write the index didn't see (another worker process) is picked up by a sync
+    other_process = type(get_repository(filepath))(filepath)
+    other_process.add("苹果和梨", "加法", "2")
+    assert len(ids("苹果")) == 1 and index.stats()["syncs"] == syncs + 1
+
+    # Timing on a larger bank
+    random.seed(7)
+    words = ["苹果", "梨", "小明", "小红", "树上", "鸟", "飞走了", "一共", "还剩", "多少", "米", "厘米", "平均", "分"]
+    big_path = os.path.join(test_dir, "big.csv")
+    add_problems([
+        {"problem_text": "".join(random.choice(words) for _ in range(8)) + f"{i}", "problem_type": "加法", "answer": str(i),
+         "solution_steps_gemini": "".join(random.choice(words) for _ in range(20))}
+        for i in range(100000)
+    ], filepath=big_path)
+    big_index = get_search_index(big_path)
+    big_index.sync()
+    # Common terms and phrases match much of the bank, but only the first page is ranked (and
+    # phrases only checked for it); totals that need more than one posting are estimated
+    for query in ("12345", "小明 12345", "苹果", "飞走了", "苹果小明", "小明 飞走了", "果"):
+        started = time.perf_counter()
+        for _ in range(100):
+            total, hits, exact = big_index.search(query)
+        elapsed_ms = (time.perf_counter() - started) * 10
+        print(f"Query {query!r} on 100000 problems: {total} matches{'' if exact else ' (estimated)'}, {elapsed_ms:.3f} ms")
+        assert elapsed_ms < 5, f"{query!r} took {elapsed_ms:.1f} ms"
+        assert len(hits) == (1 if "12345" in query else DEFAULT_SEARCH_LIMIT)
+    assert big_index.search("苹果")[0] > 50000 and big_index.search("苹果")[2]
+    assert big_index.search("苹果", offset=40, limit=10)[1] == big_index.search("苹果", limit=50)[1][40:]
+    phrase_hits = big_index.search("飞走了", offset=40, limit=10)[1]
+    assert phrase_hits == big_index.search("飞走了", limit=50)[1][40:]
+    assert all("飞走了" in get_repository(big_path).get(problem_id)["problem_text"] for problem_id, _ in phrase_hits)
+
+    # An estimated total stays close to the real count
+    exact_total = sum(1 for problem in get_repository(big_path).snapshot()[1]
+                      if "苹果小明" in problem["problem_text"] + " " + problem["solution_steps_gemini"])
+    total, _, exact = big_index.search("苹果小明")
+    assert not exact and abs(total - exact_total) < exact_total * 0.25, (total, exact_total)
+    print(f"Index stats: {big_index.stats()}")
+
+    shutil.rmtree(test_dir)
+    print("Basic tests for search_index completed.")
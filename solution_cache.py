@@ -0,0 +1,219 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "data/gemini_cache.db"
+# Environment variables: cache location, and "0"/"false" to turn the cache off entirely
+CACHE_PATH_ENV_VAR = "GEMINI_CACHE_PATH"
+CACHE_ENABLED_ENV_VAR = "GEMINI_CACHE_ENABLED"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+"""
+
+def cache_key(prompt, model):
+    """Content address of a response: sha256 over the model name and the exact prompt sent."""
+    return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+class SolutionCache:
+    """
+    Persistent cache of Gemini responses, content-addressed by (model, prompt).
+
+    Identical problems at the same student level produce the same prompt, so they share one entry
+    no matter who entered them. Entries expire `ttl_seconds` after they were stored; beyond
+    `max_entries` or `max_bytes` the least recently used entries are evicted. The database is
+    shared by all worker processes; each thread uses its own connection.
+
+    Cache failures are logged and treated as misses; they never fail a generation.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, ttl_seconds=30 * 24 * 3600,
+                 max_entries=20000, max_bytes=64 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypasses": 0, "errors": 0}
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, counter, amount=1):
+        with self._counter_lock:
+            self._counters[counter] += amount
+
+    def get(self, prompt, model):
+        """Returns the cached response text, or None on a miss or expired entry."""
+        key = cache_key(prompt, model)
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                row = connection.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._count("evictions")
+                    row = None
+                if row is not None:
+                    connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Gemini response cache lookup failed: {e}")
+            self._count("errors")
+            row = None
+        self._count("hits" if row is not None else "misses")
+        return row[0] if row is not None else None
+
+    def put(self, prompt, model, response):
+        """Stores a response (replacing any previous one) and evicts entries over the size limits."""
+        key = cache_key(prompt, model)
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, size, now, now)
+                )
+                self._evict(connection, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Gemini response cache store failed: {e}")
+            self._count("errors")
+            return
+        self._count("stores")
+
+    def _evict(self, connection, now):
+        """Drops expired entries, then least recently used ones until both limits hold."""
+        evicted = connection.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        count, total = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            excess_entries = max(0, count - self.max_entries)
+            excess_bytes = total - self.max_bytes
+            freed = 0
+            victims = []
+            for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                if len(victims) >= excess_entries and freed >= excess_bytes:
+                    break
+                victims.append((key,))
+                freed += size
+            connection.executemany("DELETE FROM responses WHERE key = ?", victims)
+            evicted += len(victims)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def record_bypass(self):
+        """Counts a lookup skipped on purpose (forced regeneration)."""
+        self._count("bypasses")
+
+    def stats(self):
+        with self._counter_lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        try:
+            entries, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            entries, total = None, None
+        return dict(counters, entries=entries, bytes=total,
+                    hit_rate=round(counters["hits"] / lookups, 4) if lookups else 0.0)
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM responses")
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    """
+    The process-wide cache configured from GEMINI_CACHE_PATH, created on first use.
+    Returns None when GEMINI_CACHE_ENABLED is "0"/"false" or the database can't be opened.
+    """
+    global _default_cache
+    if os.getenv(CACHE_ENABLED_ENV_VAR, "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = SolutionCache(os.getenv(CACHE_PATH_ENV_VAR) or DEFAULT_CACHE_PATH)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Gemini response cache disabled, could not open it: {e}")
+                return None
+        return _default_cache
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+
+    print("Running basic tests for solution_cache...")
+    cache_dir = tempfile.mkdtemp(prefix="solution_cache_")
+    cache = SolutionCache(os.path.join(cache_dir, "cache.db"), ttl_seconds=60, max_entries=3)
+
+    assert cache.get("What is 5 + 3?", "mock") is None
+    cache.put("What is 5 + 3?", "mock", "5 + 3 = 8")
+    assert cache.get("What is 5 + 3?", "mock") == "5 + 3 = 8"
+    assert cache.get("What is 5 + 3?", "gemini-1.0-pro") is None, "The model name is part of the key"
+    assert cache_key("a", "m") != cache_key("a\0m", ""), "Key parts must not run together"
+
+    # Shared between processes/instances through the database file
+    assert SolutionCache(cache.db_path).get("What is 5 + 3?", "mock") == "5 + 3 = 8"
+
+    # LRU eviction by entry count: touching P0 keeps it, P1 is the oldest afterwards
+    for i in range(3):
+        cache.put(f"P{i}", "mock", f"S{i}")
+        time.sleep(0.01)
+    cache.get("P0", "mock")
+    time.sleep(0.01)
+    cache.put("P3", "mock", "S3")
+    assert cache.get("P0", "mock") == "S0" and cache.get("P1", "mock") is None
+
+    # Eviction by total size
+    small = SolutionCache(os.path.join(cache_dir, "small.db"), max_bytes=10)
+    small.put("a", "mock", "123456")
+    time.sleep(0.01)
+    small.put("b", "mock", "123456")
+    assert small.get("a", "mock") is None and small.get("b", "mock") == "123456"
+
+    # TTL expiry
+    expiring = SolutionCache(os.path.join(cache_dir, "ttl.db"), ttl_seconds=0.05)
+    expiring.put("x", "mock", "y")
+    time.sleep(0.1)
+    assert expiring.get("x", "mock") is None
+
+    stats = cache.stats()
+    print(f"Cache stats: {stats}")
+    assert stats["hits"] >= 3 and stats["misses"] >= 3 and stats["evictions"] >= 1 and stats["entries"] == 3
+
+    shutil.rmtree(cache_dir)
+    print("Basic tests for solution_cache completed.")
@@ -0,0 +1,479 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+from problem_manager import HEADERS, SORTABLE_FIELDS, UPDATABLE_FIELDS, _read_problems_csv, _format_problem_id
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ", ".join(HEADERS)
+_PLACEHOLDERS = ", ".join("?" for _ in HEADERS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS problems (
+    problem_id TEXT PRIMARY KEY,
+    problem_text TEXT NOT NULL DEFAULT '',
+    problem_type TEXT NOT NULL DEFAULT '',
+    answer TEXT NOT NULL DEFAULT '',
+    solution_steps_gemini TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    created_time TEXT NOT NULL DEFAULT '',
+    updated_time TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_problems_problem_type ON problems (problem_type COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_problems_created_time ON problems (created_time);
+CREATE INDEX IF NOT EXISTS idx_problems_updated_time ON problems (updated_time);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_LAST_ID_KEY = "last_problem_number"
+_DATA_VERSION_KEY = "data_version"
+_LAST_MODIFIED_KEY = "last_modified"
+
+def sqlite_path_for(filepath):
+    """Maps a problems CSV path (e.g. data/problems.csv) to its SQLite database (data/problems.db)."""
+    return os.path.splitext(filepath)[0] + ".db"
+
+def _row_values(problem):
+    return tuple(problem.get(field) or "" for field in HEADERS)
+
+def _highest_id_number(connection):
+    row = connection.execute(
+        "SELECT MAX(CAST(SUBSTR(problem_id, 2) AS INTEGER)) FROM problems WHERE problem_id GLOB 'P[0-9]*'"
+    ).fetchone()
+    return row[0] or 0
+
+def _raise_id_counter(connection, floor):
+    """Moves the persisted ID high-water mark up to `floor` (never down) inside the caller's transaction."""
+    connection.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+        (_LAST_ID_KEY, str(floor))
+    )
+
+def _record_change(connection):
+    """
+    Bumps the data version and last-modified time inside the caller's write transaction.
+    Returns the new data version.
+    """
+    connection.execute(
+        "INSERT INTO meta (key, value) VALUES (?, '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+        (_DATA_VERSION_KEY,)
+    )
+    connection.execute(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        (_LAST_MODIFIED_KEY, datetime.now(timezone.utc).isoformat())
+    )
+    return connection.execute("SELECT value FROM meta WHERE key = ?", (_DATA_VERSION_KEY,)).fetchone()[0]
+
+def _allocate_problem_ids(connection, count=1):
+    """
+    Reserves `count` IDs from the persisted counter in the meta table.
+    Must run inside a write transaction; the counter is seeded from the existing IDs once.
+    """
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (_LAST_ID_KEY,)).fetchone()
+    last = int(row[0]) if row is not None else _highest_id_number(connection)
+    first = last + 1
+    _raise_id_counter(connection, last + count)
+    return [_format_problem_id(number) for number in range(first, first + count)]
+
+class SqliteProblemRepository:
+    """
+    SQLite-backed drop-in for ProblemRepository.
+
+    Exposes the same methods, so the problem_manager functions keep their signatures
+    regardless of backend. Lookups go through the primary key and the problem_type filter
+    is pushed down to an indexed, case-insensitive WHERE clause instead of a Python scan.
+    Each thread gets its own connection; the database runs in WAL mode so readers don't
+    block the writer. Change listeners get the same calls as with ProblemRepository, after
+    the transaction has committed; deleted problems are reported as {"problem_id": ...}.
+    """
+
+    def __init__(self, filepath, db_path=None):
+        self.filepath = filepath
+        self.db_path = db_path or sqlite_path_for(filepath)
+        self._local = threading.local()
+        self._listeners = []
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        is_new_database = not os.path.exists(self.db_path)
+        connection = self._connection()
+        connection.executescript(_SCHEMA)
+        if is_new_database and os.path.exists(filepath):
+            imported = import_csv_to_sqlite(filepath, connection=connection)
+            logger.info(f"Imported {imported} problems from {filepath} into new database {self.db_path}")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, changes, version):
+        """Reports a committed change; `version` is the data version the transaction wrote."""
+        version_before = str(int(version) - 1)
+        for listener in list(self._listeners):
+            try:
+                listener(changes, version_before, str(version))
+            except Exception:
+                logger.exception(f"Problem change listener failed for {self.db_path}")
+
+    @staticmethod
+    def _deleted(problem_ids):
+        return [("delete", {"problem_id": problem_id}) for problem_id in problem_ids]
+
+    def _meta_value(self, key):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def data_version(self):
+        """Write counter kept in the meta table; shared by every process using the database."""
+        return self._meta_value(_DATA_VERSION_KEY) or "0"
+
+    def last_modified(self):
+        value = self._meta_value(_LAST_MODIFIED_KEY)
+        return datetime.fromisoformat(value) if value else None
+
+    def snapshot(self):
+        """Returns (data_version, all problems) read in one transaction."""
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            version = self._meta_value(_DATA_VERSION_KEY) or "0"
+            problems = [dict(row) for row in connection.execute(f"SELECT {_COLUMNS} FROM problems ORDER BY rowid")]
+        return version, problems
+
+    def list_problems(self, problem_type=None):
+        return self.query(problem_type=problem_type)
+
+    def iter_problems(self, problem_type=None, batch_size=500):
+        """Streams rows from a cursor in batches instead of materialising the whole result."""
+        query = f"SELECT {_COLUMNS} FROM problems"
+        params = ()
+        if problem_type:
+            query += " WHERE problem_type = ? COLLATE NOCASE"
+            params = (problem_type,)
+        cursor = self._connection().execute(query + " ORDER BY rowid", params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+
+    def query(self, problem_type=None, sort_by=None, descending=False, offset=0, limit=None, fields=None,
+              after=None):
+        # Column names can't be bound as parameters; both are checked against fixed lists.
+        columns = [field for field in (fields or HEADERS) if field in HEADERS]
+        direction = "DESC" if descending else "ASC"
+        query = f"SELECT {', '.join(columns)} FROM problems"
+        conditions = []
+        params = []
+        if problem_type:
+            conditions.append("problem_type = ? COLLATE NOCASE")
+            params.append(problem_type)
+        if after is not None and sort_by in SORTABLE_FIELDS:
+            # Keyset paging: a row-value comparison in the same order as ORDER BY
+            value, problem_id = after
+            conditions.append(f"({sort_by}, length(problem_id), problem_id) {'<' if descending else '>'} (?, ?, ?)")
+            params.extend([value or "", len(problem_id or ""), problem_id or ""])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if sort_by in SORTABLE_FIELDS:
+            query += f" ORDER BY {sort_by} {direction}, length(problem_id) {direction}, problem_id {direction}"
+        else:
+            query += f" ORDER BY rowid {direction}"
+        query += " LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+        return [dict(row) for row in self._connection().execute(query, params)]
+
+    def get(self, problem_id):
+        row = self._connection().execute(
+            f"SELECT {_COLUMNS} FROM problems WHERE problem_id = ?", (problem_id,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def replace_all(self, problems):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM problems")
+            connection.executemany(
+                f"INSERT OR REPLACE INTO problems ({_COLUMNS}) VALUES ({_PLACEHOLDERS})",
+                (_row_values(problem) for problem in problems)
+            )
+            _raise_id_counter(connection, _highest_id_number(connection))
+            version = _record_change(connection)
+        self._notify(None, version)
+
+    def add(self, problem_text, problem_type, answer, source=""):
+        connection = self._connection()
+        with connection:
+            # BEGIN IMMEDIATE takes the write lock up front so two writers can't pick the same ID.
+            connection.execute("BEGIN IMMEDIATE")
+            new_id = _allocate_problem_ids(connection)[0]
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+
+            new_problem = {
+                "problem_id": new_id,
+                "problem_text": problem_text,
+                "problem_type": problem_type,
+                "answer": answer,
+                "solution_steps_gemini": "",  # Initially empty
+                "source": source,
+                "created_time": current_time_iso,
+                "updated_time": current_time_iso
+            }
+            connection.execute(
+                f"INSERT INTO problems ({_COLUMNS}) VALUES ({_PLACEHOLDERS})", _row_values(new_problem)
+            )
+            version = _record_change(connection)
+        self._notify([("put", new_problem)], version)
+        return new_problem
+
+    def add_many(self, problems):
+        problems = list(problems)
+        if not problems:
+            return []
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            new_ids = _allocate_problem_ids(connection, count=len(problems))
+            current_time_iso = datetime.now(timezone.utc).isoformat()
+            created = []
+            for new_id, fields in zip(new_ids, problems):
+                new_problem = {field: fields.get(field) or "" for field in HEADERS}
+                new_problem.update(problem_id=new_id, created_time=current_time_iso, updated_time=current_time_iso)
+                created.append(new_problem)
+            connection.executemany(
+                f"INSERT INTO problems ({_COLUMNS}) VALUES ({_PLACEHOLDERS})",
+                [_row_values(problem) for problem in created]
+            )
+            version = _record_change(connection)
+        self._notify([("put", problem) for problem in created], version)
+        return created
+
+    def update_solution(self, problem_id, solution_steps):
+        return bool(self.update_solutions({problem_id: solution_steps}))
+
+    def update_solutions(self, solutions):
+        connection = self._connection()
+        current_time_iso = datetime.now(timezone.utc).isoformat()
+        updated = []
+        with connection:
+            for problem_id, solution_steps in solutions.items():
+                cursor = connection.execute(
+                    "UPDATE problems SET solution_steps_gemini = ?, updated_time = ? WHERE problem_id = ?",
+                    (solution_steps or "", current_time_iso, problem_id)
+                )
+                if cursor.rowcount:
+                    updated.append(problem_id)
+            if updated:
+                version = _record_change(connection)
+                changes = [("put", self._fetch(connection, problem_id)) for problem_id in updated]
+        if updated:
+            self._notify(changes, version)
+        return updated
+
+    @staticmethod
+    def _fetch(connection, problem_id):
+        return dict(connection.execute(f"SELECT {_COLUMNS} FROM problems WHERE problem_id = ?", (problem_id,)).fetchone())
+
+    @staticmethod
+    def _filter_clause(problem_type, source):
+        if not problem_type and not source:
+            raise ValueError("A problem_type or source filter is required")
+        clauses, params = [], []
+        if problem_type:
+            clauses.append("problem_type = ? COLLATE NOCASE")
+            params.append(problem_type)
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        return " AND ".join(clauses), params
+
+    @staticmethod
+    def _update_rows(connection, patches, current_time_iso):
+        results = {}
+        for problem_id, fields in patches.items():
+            assignments = [field for field in UPDATABLE_FIELDS if field in fields]
+            values = ["" if fields[field] is None else str(fields[field]) for field in assignments]
+            cursor = connection.execute(
+                "UPDATE problems SET " + "".join(f"{field} = ?, " for field in assignments) +
+                "updated_time = ?, created_time = CASE WHEN created_time = '' THEN ? ELSE created_time END "
+                "WHERE problem_id = ?",
+                values + [current_time_iso, current_time_iso, problem_id]
+            )
+            results[problem_id] = SqliteProblemRepository._fetch(connection, problem_id) if cursor.rowcount else None
+        return results
+
+    def update_many(self, patches):
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            results = self._update_rows(connection, patches, datetime.now(timezone.utc).isoformat())
+            changes = [("put", problem) for problem in results.values() if problem is not None]
+            if changes:
+                version = _record_change(connection)
+        if changes:
+            self._notify(changes, version)
+        return results
+
+    def update_matching(self, fields, problem_type=None, source=None):
+        where, params = self._filter_clause(problem_type, source)
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            matching = [row[0] for row in connection.execute(f"SELECT problem_id FROM problems WHERE {where}", params)]
+            results = self._update_rows(connection, {problem_id: fields for problem_id in matching},
+                                        datetime.now(timezone.utc).isoformat())
+            if matching:
+                version = _record_change(connection)
+        if matching:
+            self._notify([("put", problem) for problem in results.values()], version)
+        return list(results.values())
+
+    def delete_many(self, problem_ids):
+        connection = self._connection()
+        deleted = []
+        with connection:
+            for problem_id in dict.fromkeys(problem_ids):
+                if connection.execute("DELETE FROM problems WHERE problem_id = ?", (problem_id,)).rowcount:
+                    deleted.append(problem_id)
+            if deleted:
+                version = _record_change(connection)
+        if deleted:
+            self._notify(self._deleted(deleted), version)
+        return deleted
+
+    def delete_matching(self, problem_type=None, source=None):
+        where, params = self._filter_clause(problem_type, source)
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            matching = [row[0] for row in connection.execute(f"SELECT problem_id FROM problems WHERE {where}", params)]
+            if matching:
+                connection.execute(f"DELETE FROM problems WHERE {where}", params)
+                version = _record_change(connection)
+        if matching:
+            self._notify(self._deleted(matching), version)
+        return matching
+
+    def delete(self, problem_id):
+        return bool(self.delete_many([problem_id]))
+
+    def compact(self):
+        """SQLite manages its own storage; kept for interface parity with ProblemRepository."""
+        return None
+
+def import_csv_to_sqlite(csv_path, db_path=None, connection=None):
+    """
+    Bulk-imports every problem from a problems CSV into a SQLite database in one transaction.
+    Existing rows with the same problem_id are replaced. Returns the number of imported problems.
+    """
+    owns_connection = connection is None
+    if owns_connection:
+        connection = sqlite3.connect(db_path or sqlite_path_for(csv_path))
+        connection.executescript(_SCHEMA)
+    try:
+        rows = [row for row in _read_problems_csv(csv_path) if row.get('problem_id')]
+        with connection:
+            connection.executemany(
+                f"INSERT OR REPLACE INTO problems ({_COLUMNS}) VALUES ({_PLACEHOLDERS})",
+                (_row_values(row) for row in rows)
+            )
+            _raise_id_counter(connection, _highest_id_number(connection))
+            _record_change(connection)
+        return len(rows)
+    finally:
+        if owns_connection:
+            connection.close()
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+
+    print("Running basic tests for sqlite_storage...")
+    test_dir = tempfile.mkdtemp(prefix="sqlite_storage_")
+    csv_file = os.path.join(test_dir, "problems.csv")
+
+    # Seed a CSV so the new database imports it on first use
+    seed_rows = [
+        {"problem_id": "P001", "problem_text": "What is 2+2?", "problem_type": "Arithmetic", "answer": "4",
+         "solution_steps_gemini": "", "source": "seed", "created_time": "2024-01-01T00:00:00+00:00",
+         "updated_time": "2024-01-01T00:00:00+00:00"},
+        {"problem_id": "P002", "problem_text": "长方形的周长", "problem_type": "geometry", "answer": "20",
+         "solution_steps_gemini": "", "source": "seed", "created_time": "2024-01-02T00:00:00+00:00",
+         "updated_time": "2024-01-02T00:00:00+00:00"},
+    ]
+    from problem_manager import _write_problems_csv
+    _write_problems_csv(seed_rows, csv_file)
+
+    repository = SqliteProblemRepository(csv_file)
+    assert os.path.exists(sqlite_path_for(csv_file))
+    assert [p['problem_id'] for p in repository.list_problems()] == ["P001", "P002"]
+
+    # Filter is case-insensitive and served from the problem_type index
+    assert [p['problem_id'] for p in repository.list_problems(problem_type="arithmetic")] == ["P001"]
+    plan = repository._connection().execute(
+        "EXPLAIN QUERY PLAN SELECT problem_id FROM problems WHERE problem_type = ? COLLATE NOCASE", ("x",)
+    ).fetchall()
+    assert any("idx_problems_problem_type" in str(tuple(step)) for step in plan), plan
+
+    assert [p['problem_id'] for p in repository.iter_problems(problem_type="GEOMETRY", batch_size=1)] == ["P002"]
+
+    # Paging, sorting and projection happen in SQL
+    assert repository.query(sort_by="created_time", descending=True, limit=1, fields=["problem_id"]) == [{"problem_id": "P002"}]
+    assert [p['problem_id'] for p in repository.query(offset=1)] == ["P002"]
+    newest = ("2024-01-02T00:00:00+00:00", "P002")
+    assert repository.query(sort_by="created_time", descending=True, after=newest, fields=["problem_id"]) == [{"problem_id": "P001"}]
+    assert repository.query(sort_by="created_time", after=newest) == []
+
+    new_problem = repository.add("What is 3+4?", "Arithmetic", "7", source="test_case")
+    assert new_problem['problem_id'] == "P003"
+    assert repository.get("P003")['problem_text'] == "What is 3+4?"
+    version_before = repository.data_version()
+    assert repository.update_solution("P003", "Count on from 3.")
+    assert repository.data_version() != version_before
+    assert repository.last_modified() is not None
+    assert repository.get("P003")['solution_steps_gemini'] == "Count on from 3."
+    assert not repository.update_solution("P999", "nothing")
+    assert repository.update_solutions({"P001": "Bulk", "P999": "missing"}) == ["P001"]
+    assert repository.get("P001")['solution_steps_gemini'] == "Bulk"
+    assert repository.delete("P002")
+    assert not repository.delete("P002")
+    assert repository.get("P002") is None
+
+    # Deleting the newest problem must not free its ID
+    assert repository.delete("P003")
+    assert repository.add("What is 5+5?", "Arithmetic", "10")['problem_id'] == "P004"
+    repository._connection().execute("UPDATE meta SET value = '999' WHERE key = ?", (_LAST_ID_KEY,))
+    repository._connection().commit()
+    assert repository.add("Past P999", "Arithmetic", "1")['problem_id'] == "P1000"
+
+    repository.replace_all(seed_rows)
+    assert [p['problem_id'] for p in repository.list_problems()] == ["P001", "P002"]
+
+    # Explicit bulk import into a separate database
+    other_db = os.path.join(test_dir, "other.db")
+    assert import_csv_to_sqlite(csv_file, other_db) == 2
+    assert len(SqliteProblemRepository(csv_file, db_path=other_db).list_problems()) == 2
+
+    shutil.rmtree(test_dir)
+    print("Basic tests for sqlite_storage completed.")
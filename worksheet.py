@@ -0,0 +1,326 @@
+import os
+import json
+import uuid
+import random
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+from problem_manager import DEFAULT_FILEPATH, get_repository, interprocess_lock, fsync_directory
+from search_index import BankIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = "data/worksheets.json"
+HISTORY_PATH_ENV_VAR = "WORKSHEET_HISTORY_PATH"
+# How many of the most recent worksheets a new one avoids repeating problems from
+AVOID_LAST_ENV_VAR = "WORKSHEET_AVOID_LAST"
+DEFAULT_AVOID_LAST = 3
+# Worksheets kept in the history (and available for re-rendering)
+MAX_HISTORY = 100
+MAX_WORKSHEET_PROBLEMS = 200
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _id_key(problem_id):
+    """Problem ID order: P999 before P1000."""
+    return len(problem_id), problem_id
+
+def history_path():
+    return os.getenv(HISTORY_PATH_ENV_VAR) or DEFAULT_HISTORY_PATH
+
+def default_avoid_last():
+    try:
+        return max(0, int(os.getenv(AVOID_LAST_ENV_VAR, DEFAULT_AVOID_LAST)))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {AVOID_LAST_ENV_VAR}; using {DEFAULT_AVOID_LAST}")
+        return DEFAULT_AVOID_LAST
+
+class _Pool:
+    """
+    IDs of one problem type in ID order. New problems are appended (they have the highest IDs, so
+    the order usually holds); removals only drop the member, and the list is rebuilt lazily.
+    """
+
+    __slots__ = ("ids", "members", "ordered")
+
+    def __init__(self):
+        self.ids = []
+        self.members = set()
+        self.ordered = True
+
+    def add(self, problem_id):
+        if self.ids and _id_key(self.ids[-1]) > _id_key(problem_id):
+            self.ordered = False
+        self.members.add(problem_id)
+        self.ids.append(problem_id)
+
+    def discard(self, problem_id):
+        self.members.discard(problem_id)
+        self.ordered = False
+
+    def sorted_ids(self):
+        if not self.ordered:
+            # Nearly sorted in practice, which Timsort handles in about linear time
+            self.ids = sorted(dict.fromkeys(problem_id for problem_id in self.ids if problem_id in self.members),
+                              key=_id_key)
+            self.ordered = True
+        return self.ids
+
+class _PoolData:
+    """Problem IDs grouped by (lower-cased) problem_type."""
+
+    def __init__(self):
+        self.types = {}  # problem_id -> type key
+        self.pools = {}  # type key -> _Pool
+
+    def ids(self):
+        return self.types.keys()
+
+    def put(self, problem):
+        problem_id = problem.get('problem_id')
+        if not problem_id:
+            return
+        type_key = (problem.get('problem_type') or '').strip().lower()
+        old_key = self.types.get(problem_id)
+        if old_key == type_key:
+            return
+        if old_key is not None:
+            self.pools[old_key].discard(problem_id)
+        self.types[problem_id] = type_key
+        self.pools.setdefault(type_key, _Pool()).add(problem_id)
+
+    def remove(self, problem_id):
+        type_key = self.types.pop(problem_id, None)
+        if type_key is not None:
+            self.pools[type_key].discard(problem_id)
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self):
+        pass
+
+class WorksheetPools(BankIndex):
+    """
+    Per-type ID pools of one problem bank, kept current like the search index, so a worksheet is
+    drawn by picking random positions in a pool instead of loading and filtering the bank.
+    """
+
+    data_class = _PoolData
+    name = "Worksheet pools"
+
+    def sample(self, counts, seed, exclude=frozenset()):
+        """
+        Draws counts[problem_type] distinct IDs per type with random.Random(seed), avoiding
+        `exclude` as long as the pool has enough other problems. Returns (ids in `counts` order,
+        number of excluded IDs that had to be reused). Raises ValueError if a type has too few problems.
+        """
+        rng = random.Random(seed)
+        self.ensure_current()
+        picked = []
+        reused = 0
+        with self._lock:
+            for problem_type, count in counts.items():
+                pool = self._data.pools.get(problem_type.strip().lower())
+                pool_ids = pool.sorted_ids() if pool is not None else []
+                if len(pool_ids) < count:
+                    raise ValueError(f"Only {len(pool_ids)} problems of type '{problem_type}', {count} requested")
+                chosen = _draw(rng, pool_ids, count, exclude)
+                reused += sum(1 for problem_id in chosen if problem_id in exclude)
+                picked.extend(chosen)
+        return picked, reused
+
+def _draw(rng, pool_ids, count, exclude):
+    """`count` distinct IDs from `pool_ids`, preferring IDs not in `exclude`."""
+    chosen = []
+    seen = set()
+    # Random positions first: a few draws when the pool is much larger than the sheet
+    for _ in range(4 * count + 16):
+        if len(chosen) == count:
+            return chosen
+        problem_id = pool_ids[rng.randrange(len(pool_ids))]
+        if problem_id not in seen and problem_id not in exclude:
+            seen.add(problem_id)
+            chosen.append(problem_id)
+    # Small or mostly excluded pool: choose among what is left, then reuse excluded IDs if needed
+    remaining = [problem_id for problem_id in pool_ids if problem_id not in seen and problem_id not in exclude]
+    chosen.extend(rng.sample(remaining, min(count - len(chosen), len(remaining))))
+    if len(chosen) < count:
+        excluded = [problem_id for problem_id in pool_ids if problem_id in exclude]
+        chosen.extend(rng.sample(excluded, count - len(chosen)))
+    return chosen
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_worksheet_pools(filepath=DEFAULT_FILEPATH):
+    key = os.path.abspath(filepath)
+    with _pools_lock:
+        pools = _pools.get(key)
+        if pools is None:
+            pools = _pools[key] = WorksheetPools(get_repository(filepath))
+        return pools
+
+def _read_history(path):
+    try:
+        with open(path, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read worksheet history {path}: {e}")
+        return []
+
+def _write_history(path, worksheets):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".worksheets-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode='w', encoding='utf-8') as f:
+            json.dump(worksheets, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        fsync_directory(directory)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def validate_counts(counts):
+    """Checks a {problem_type: count} spec; returns it with int counts or raises ValueError."""
+    if not isinstance(counts, dict) or not counts:
+        raise ValueError("counts must be a non-empty object of problem_type -> number of problems")
+    validated = {}
+    for problem_type, count in counts.items():
+        if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+            raise ValueError(f"Count for '{problem_type}' must be a positive integer")
+        if problem_type.strip().lower() in (key.strip().lower() for key in validated):
+            raise ValueError(f"problem_type '{problem_type}' is listed twice")
+        validated[problem_type] = count
+    if sum(validated.values()) > MAX_WORKSHEET_PROBLEMS:
+        raise ValueError(f"A worksheet can have at most {MAX_WORKSHEET_PROBLEMS} problems")
+    return validated
+
+def generate_worksheet(counts, seed=None, avoid_last=None, filepath=DEFAULT_FILEPATH, history_file=None):
+    """
+    Samples a worksheet: counts[problem_type] random problems of each type, none of them from the
+    last `avoid_last` worksheets unless a type runs out. The same seed over the same bank and
+    history gives the same sheet; without one a seed is chosen and recorded.
+    Returns the history entry {"worksheet_id", "created_time", "counts", "seed", "problem_ids", "reused"}.
+    """
+    counts = validate_counts(counts)
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    elif not isinstance(seed, int) or isinstance(seed, bool):
+        raise ValueError("seed must be an integer")
+    avoid_last = default_avoid_last() if avoid_last is None else avoid_last
+    history_file = history_file or history_path()
+    pools = get_worksheet_pools(filepath)
+
+    # Held while sampling so worksheets generated at the same time avoid each other too
+    with interprocess_lock(history_file + ".lock"):
+        worksheets = _read_history(history_file)
+        recent = worksheets[-avoid_last:] if avoid_last > 0 else []
+        exclude = {problem_id for worksheet in recent for problem_id in worksheet.get("problem_ids", ())}
+        problem_ids, reused = pools.sample(counts, seed, exclude)
+        worksheet = {
+            "worksheet_id": uuid.uuid4().hex,
+            "created_time": _now_iso(),
+            "counts": counts,
+            "seed": seed,
+            "problem_ids": problem_ids,
+            "reused": reused,
+        }
+        worksheets.append(worksheet)
+        _write_history(history_file, worksheets[-MAX_HISTORY:])
+    if reused:
+        logger.info(f"Worksheet {worksheet['worksheet_id']} reuses {reused} recently used problems")
+    return worksheet
+
+def get_worksheet(worksheet_id, history_file=None):
+    """A worksheet from the history, or None if unknown (or already dropped from it)."""
+    for worksheet in _read_history(history_file or history_path()):
+        if worksheet.get("worksheet_id") == worksheet_id:
+            return worksheet
+    return None
+
+def worksheet_problems(worksheet, filepath=DEFAULT_FILEPATH):
+    """The worksheet's problems in sheet order; problems deleted since are left out."""
+    repository = get_repository(filepath)
+    problems = (repository.get(problem_id) for problem_id in worksheet["problem_ids"])
+    return [problem for problem in problems if problem is not None]
+
+if __name__ == '__main__':
+    import time
+    import shutil
+    from problem_manager import add_problems, update_problem, delete_problem
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    print("Running basic tests for worksheet...")
+
+    temp_dir = tempfile.mkdtemp(prefix="worksheet_")
+    bank = os.path.join(temp_dir, "problems.csv")
+    history = os.path.join(temp_dir, "worksheets.json")
+    try:
+        types = ["Arithmetic", "Geometry", "Algebra", "Word Problem"]
+        add_problems([{"problem_text": f"Problem {i}", "problem_type": types[i % 4], "answer": str(i)}
+                      for i in range(100000)], filepath=bank)
+
+        started = time.perf_counter()
+        first = generate_worksheet({"arithmetic": 10, "Geometry": 5}, seed=7, filepath=bank, history_file=history)
+        print(f"First worksheet (pools built): {(time.perf_counter() - started) * 1000:.0f} ms")
+        assert len(first["problem_ids"]) == 15 and len(set(first["problem_ids"])) == 15
+        problems = worksheet_problems(first, filepath=bank)
+        assert [p["problem_type"] for p in problems] == ["Arithmetic"] * 10 + ["Geometry"] * 5
+        assert get_worksheet(first["worksheet_id"], history_file=history)["problem_ids"] == first["problem_ids"]
+
+        started = time.perf_counter()
+        for _ in range(20):
+            generate_worksheet({"Algebra": 20, "Word Problem": 20}, filepath=bank, history_file=history, avoid_last=0)
+        print(f"Worksheet from a 100k bank: {(time.perf_counter() - started) * 1000 / 20:.2f} ms")
+
+        # Same seed and history -> same sheet
+        a = generate_worksheet({"Algebra": 5}, seed=42, avoid_last=0, filepath=bank, history_file=history)
+        b = generate_worksheet({"Algebra": 5}, seed=42, avoid_last=0, filepath=bank, history_file=history)
+        assert a["problem_ids"] == b["problem_ids"]
+
+        # Recent worksheets are avoided; a small pool falls back to reuse
+        small_bank = os.path.join(temp_dir, "small.csv")
+        add_problems([{"problem_text": f"Q{i}", "problem_type": "Arithmetic", "answer": "1"} for i in range(10)],
+                     filepath=small_bank)
+        small_history = os.path.join(temp_dir, "small.json")
+        s1 = generate_worksheet({"Arithmetic": 4}, filepath=small_bank, history_file=small_history, avoid_last=2)
+        s2 = generate_worksheet({"Arithmetic": 4}, filepath=small_bank, history_file=small_history, avoid_last=2)
+        assert not set(s1["problem_ids"]) & set(s2["problem_ids"]) and s2["reused"] == 0
+        s3 = generate_worksheet({"Arithmetic": 4}, filepath=small_bank, history_file=small_history, avoid_last=2)
+        assert s3["reused"] == 2 and len(set(s3["problem_ids"])) == 4
+
+        # Pools follow changes
+        update_problem(s3["problem_ids"][0], {"problem_type": "Geometry"}, filepath=small_bank)
+        delete_problem(s3["problem_ids"][1], filepath=small_bank)
+        s4 = generate_worksheet({"Arithmetic": 8, "geometry": 1}, filepath=small_bank, history_file=small_history, avoid_last=0)
+        assert s4["problem_ids"][-1] == s3["problem_ids"][0]
+        assert s3["problem_ids"][1] not in s4["problem_ids"]
+
+        for bad in ({}, {"Arithmetic": 0}, {"Arithmetic": "3"}, {"Arithmetic": 9}, {"Calculus": 1},
+                    {"Arithmetic": 1, "arithmetic": 1}):
+            try:
+                generate_worksheet(bad, filepath=small_bank, history_file=small_history)
+                assert False, f"{bad} should be rejected"
+            except ValueError:
+                pass
+
+        # History is bounded
+        for _ in range(MAX_HISTORY + 5):
+            generate_worksheet({"Arithmetic": 1}, filepath=small_bank, history_file=small_history, avoid_last=0)
+        assert len(_read_history(small_history)) == MAX_HISTORY
+        print(f"Pool stats: {get_worksheet_pools(bank).stats()}")
+    finally:
+        shutil.rmtree(temp_dir)
+    print("Basic tests for worksheet completed.")